@@ -0,0 +1,99 @@
+"""
+FDC3 Log Encoding Benchmark
+
+Compares the legacy per-entry json.dumps() prompt context with the compact
+log_encoder table on synthetic trading sessions. Reports prompt size,
+approximate token count and build time.
+
+Usage:
+    python analyst/bench_log_encoding.py [--entries 10000] [--runs 5]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from log_encoder import encode_logs
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'TSLA', 'GOOGL', 'AMZN', 'EUR/USD', 'GBP/USD', 'USD/JPY']
+
+
+def count_tokens(text):
+    """Token count via tiktoken when installed, otherwise the ~4 chars/token rule of thumb"""
+    try:
+        import tiktoken
+        return len(tiktoken.get_encoding("cl100k_base").encode(text)), "tiktoken"
+    except ImportError:
+        return len(text) // 4, "chars/4"
+
+
+def make_session(n, seed=7):
+    """Synthetic session shaped like the mock app's FDC3 log (selections, orders, trades, summaries)"""
+    rng = random.Random(seed)
+    ts = 1718000000000
+    positions = {s: rng.randint(-500, 500) for s in SYMBOLS}
+    logs = []
+    for i in range(n):
+        ts += rng.randint(50, 4000)
+        sym = rng.choice(SYMBOLS)
+        kind = rng.random()
+        if kind < 0.55:
+            logs.append({"origin": "APP", "type": "fdc3.instrument", "timestamp": ts,
+                         "data": {"type": "fdc3.instrument", "id": {"ticker": sym}, "name": sym}})
+        elif kind < 0.75:
+            qty = rng.choice([10, 25, 100, 1000, 25000])
+            side = rng.choice(["BUY", "SELL"])
+            logs.append({"origin": "APP", "type": "order.submitted", "timestamp": ts,
+                         "data": {"orderId": f"ORD-{1000 + i}", "symbol": sym, "side": side,
+                                  "qty": qty, "type": "MKT", "price": "MKT"}})
+            positions[sym] += qty if side == "BUY" else -qty
+        elif kind < 0.9:
+            logs.append({"origin": "APP", "type": "fdc3.trade", "timestamp": ts,
+                         "data": {"type": "fdc3.trade", "id": {"execId": f"EX-{i}"},
+                                  "instrument": {"type": "fdc3.instrument", "id": {"ticker": sym}},
+                                  "side": "BUY", "quantity": 100, "price": round(rng.uniform(1, 1000), 2),
+                                  "orderId": f"ORD-{1000 + i}", "counterparty": "IBKR"}})
+        else:
+            logs.append({"origin": "APP", "type": "portfolio.summary", "timestamp": ts,
+                         "data": {"type": "portfolio.summary",
+                                  "positions": [{"sym": s, "qty": q, "avg": 100.0} for s, q in positions.items()]}})
+    return logs
+
+
+def legacy_context(logs):
+    """The original process_analysis string concatenation"""
+    log_context = ""
+    for entry in logs:
+        log_context += f"[{entry.get('origin')}] {entry.get('type')}: {json.dumps(entry.get('data'))}\n"
+    return log_context
+
+
+def bench(name, fn, logs, runs):
+    best = float('inf')
+    out = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = fn(logs)
+        best = min(best, time.perf_counter() - start)
+    tokens, method = count_tokens(out)
+    print(f"{name:<10} {len(out):>12,} chars {tokens:>12,} tokens ({method}) {best * 1000:>9.1f} ms")
+    return len(out), tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=10000, help="Log entries per session")
+    parser.add_argument("--runs", type=int, default=5, help="Timing runs (best is reported)")
+    args = parser.parse_args()
+
+    logs = make_session(args.entries)
+    print(f"Session: {len(logs):,} FDC3 log entries\n")
+    legacy_chars, legacy_tokens = bench("legacy", legacy_context, logs, args.runs)
+    compact_chars, compact_tokens = bench("compact", encode_logs, logs, args.runs)
+    print(f"\nReduction: {legacy_chars / max(compact_chars, 1):.1f}x chars, "
+          f"{legacy_tokens / max(compact_tokens, 1):.1f}x tokens")
+
+
+if __name__ == "__main__":
+    main()
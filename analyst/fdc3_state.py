@@ -0,0 +1,244 @@
+"""
+FDC3 State Reducer
+
+Folds a chronological FDC3 log into the current trading state in one linear
+pass, so prompts can carry "what is true now" instead of the whole history
+plus override rules for the LLM to apply.
+
+Handled contexts:
+    fdc3.portfolio      -> replaces all positions (snapshot)
+    fdc3.position       -> upserts one position (holding 0 removes it)
+    portfolio.summary   -> replaces positions and orders (compact app snapshot)
+    fdc3.order          -> upserts one order
+    order.submitted     -> upserts a newly submitted order (app log)
+    fdc3.collection     -> applies each member; a collection of orders (e.g. "Recent
+                           Orders") is a snapshot, so orders missing from it are dropped
+    fdc3.instrument     -> selected instrument + recently viewed list
+
+Usage:
+    from fdc3_state import FDC3StateReducer, build_context
+
+    reducer = FDC3StateReducer()
+    for entry in live_feed:
+        reducer.apply(entry)
+    state = reducer.snapshot()
+
+    prompt_context = build_context(logs, tail=20)
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from log_encoder import encode_logs
+
+RECENT_INSTRUMENTS = 10
+MAX_ORDERS = 50  # most recent orders kept in a snapshot
+DEFAULT_TAIL = 20
+
+
+def _ticker(context: Any) -> Optional[str]:
+    """Extract a ticker from an fdc3.instrument (or anything holding one)"""
+    if not isinstance(context, dict):
+        return None
+    ident = context.get('id')
+    if isinstance(ident, dict) and ident.get('ticker'):
+        return ident['ticker']
+    if context.get('ticker'):
+        return context['ticker']
+    for key in ('instrument', 'product'):
+        ticker = _ticker(context.get(key))
+        if ticker:
+            return ticker
+    return None
+
+
+def _order_id(context: Dict[str, Any]) -> Any:
+    """Order id of an fdc3.order (id.orderId, or a bare orderId)"""
+    ident = context.get('id') if isinstance(context.get('id'), dict) else {}
+    return ident.get('orderId') or context.get('orderId')
+
+
+def _entry_type(entry: Dict[str, Any]) -> Optional[str]:
+    # Context types are namespaced ('fdc3.order'); a bare data.type is a field
+    # such as the order type in order.submitted ('LIMIT')
+    data = entry.get('data')
+    if isinstance(data, dict) and '.' in str(data.get('type', '')):
+        return data['type']
+    return entry.get('type')
+
+
+class FDC3StateReducer:
+    """Incremental reducer: apply() entries oldest to newest, read snapshot() at any time"""
+
+    def __init__(self):
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.orders: Dict[str, Dict[str, Any]] = {}
+        self.selected_instrument: Optional[Dict[str, Any]] = None
+        self.recent_instruments: List[str] = []
+        self.portfolio_as_of = None
+        self.last_timestamp = None
+        self.event_counts: Dict[str, int] = {}
+        self.applied = 0
+
+        self._handlers = {
+            'fdc3.portfolio': self._on_portfolio,
+            'fdc3.position': self._on_position,
+            'portfolio.summary': self._on_summary,
+            'fdc3.order': self._on_order,
+            'order.submitted': self._on_order_submitted,
+            'fdc3.collection': self._on_collection,
+            'fdc3.instrument': self._on_instrument,
+        }
+
+    # ── Public API ──────────────────────────────────────────
+
+    def apply(self, entry: Dict[str, Any]) -> bool:
+        """Fold one log entry into the state. Returns True if the entry type is understood."""
+        ctx_type = _entry_type(entry)
+        self.applied += 1
+        if ctx_type:
+            self.event_counts[ctx_type] = self.event_counts.get(ctx_type, 0) + 1
+        ts = entry.get('timestamp')
+        if isinstance(ts, (int, float)):
+            self.last_timestamp = ts
+
+        handler = self._handlers.get(ctx_type)
+        if handler is None:
+            return False
+        data = entry.get('data')
+        handler(data if isinstance(data, dict) else {}, ts)
+        return True
+
+    def apply_all(self, entries: List[Dict[str, Any]]) -> 'FDC3StateReducer':
+        for entry in entries:
+            self.apply(entry)
+        return self
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current state as a plain JSON-serializable dict"""
+        open_orders, closed_orders = [], []
+        for oid, order in self.orders.items():
+            (closed_orders if _is_final(order.get('status')) else open_orders).append({"orderId": oid, **order})
+        state = {
+            "positions": [{"symbol": sym, **pos} for sym, pos in self.positions.items()],
+            "openOrders": open_orders[-MAX_ORDERS:],
+            "recentlyClosedOrders": closed_orders[-10:],
+            "selectedInstrument": self.selected_instrument,
+            "recentInstruments": list(self.recent_instruments),
+            "portfolioAsOf": self.portfolio_as_of,
+            "asOf": self.last_timestamp,
+            "eventsApplied": self.applied,
+        }
+        return state
+
+    # ── Context handlers ────────────────────────────────────
+
+    def _on_portfolio(self, data, ts):
+        self.positions = {}
+        for position in data.get('positions') or []:
+            self._on_position(position, ts)
+        self.portfolio_as_of = ts
+
+    def _on_position(self, data, ts):
+        symbol = _ticker(data.get('instrument')) or _ticker(data)
+        if not symbol:
+            return
+        holding = data.get('holding', data.get('quantity', 0)) or 0
+        if holding == 0:
+            self.positions.pop(symbol, None)
+            return
+        position = {"qty": holding, "avgCost": data.get('avgCost')}
+        if data.get('isSimulated'):
+            position["isSimulated"] = True
+        self.positions[symbol] = position
+
+    def _on_summary(self, data, ts):
+        if 'positions' in data:
+            self.positions = {}
+            for p in data.get('positions') or []:
+                if p.get('sym') and p.get('qty'):
+                    self.positions[p['sym']] = {"qty": p['qty'], "avgCost": p.get('avg')}
+            self.portfolio_as_of = ts
+        # The app omits 'orders' when it has none, so every summary replaces the order set
+        orders = [o for o in data.get('orders') or [] if isinstance(o, dict) and o.get('id') is not None]
+        self._retain_orders({str(o['id']) for o in orders})
+        for o in orders:
+            self._upsert_order(str(o['id']), symbol=o.get('sym'), side=o.get('side'),
+                               qty=o.get('qty'), status=o.get('st'))
+
+    def _on_order(self, data, ts):
+        order_id = _order_id(data)
+        if order_id is None:
+            return
+        details = data.get('details') if isinstance(data.get('details'), dict) else {}
+        self._upsert_order(
+            str(order_id),
+            symbol=details.get('symbol') or _ticker(details) or _ticker(data),
+            side=details.get('side') or data.get('side'),
+            qty=details.get('qty') or data.get('quantity'),
+            status=details.get('status') or data.get('status'),
+            isSimulated=details.get('isSimulated') or None,
+        )
+
+    def _on_order_submitted(self, data, ts):
+        if data.get('orderId') is None:
+            return
+        self._upsert_order(str(data['orderId']), symbol=data.get('symbol'), side=data.get('side'),
+                           qty=data.get('qty'), orderType=data.get('type'), price=data.get('price'),
+                           status='Submitted')
+
+    def _on_collection(self, data, ts):
+        members = [m for m in data.get('members') or [] if isinstance(m, dict)]
+        if members and all(m.get('type') == 'fdc3.order' for m in members):
+            self._retain_orders({str(_order_id(m)) for m in members})
+        for member in members:
+            handler = self._handlers.get(member.get('type'))
+            if handler is not None and handler != self._on_collection:
+                handler(member, ts)
+
+    def _on_instrument(self, data, ts):
+        symbol = _ticker(data)
+        if not symbol:
+            return
+        self.selected_instrument = {"symbol": symbol, "name": data.get('name', symbol), "at": ts}
+        if symbol in self.recent_instruments:
+            self.recent_instruments.remove(symbol)
+        self.recent_instruments.insert(0, symbol)
+        del self.recent_instruments[RECENT_INSTRUMENTS:]
+
+    def _retain_orders(self, order_ids):
+        """Drop orders a snapshot no longer lists (filled, cancelled or aged out)"""
+        for order_id in [oid for oid in self.orders if oid not in order_ids]:
+            del self.orders[order_id]
+
+    def _upsert_order(self, order_id, **fields):
+        order = self.orders.pop(order_id, {})  # re-insert so dict order tracks recency
+        order.update({k: v for k, v in fields.items() if v is not None})
+        self.orders[order_id] = order
+
+
+def _is_final(status) -> bool:
+    return str(status or '').lower() in ('filled', 'cancelled', 'canceled', 'inactive', 'rejected')
+
+
+def _timestamp(entry):
+    ts = entry.get('timestamp')
+    return ts if isinstance(ts, (int, float)) else 0
+
+
+def reduce_logs(logs: List[Dict[str, Any]]) -> FDC3StateReducer:
+    """Fold a (possibly unordered) log list into a reducer, oldest entry first"""
+    return FDC3StateReducer().apply_all(sorted(logs, key=_timestamp))
+
+
+def build_context(logs: List[Dict[str, Any]], tail: int = DEFAULT_TAIL) -> str:
+    """Prompt context: the reduced current state plus a short compact-encoded activity tail"""
+    ordered = sorted(logs, key=_timestamp)
+    state = FDC3StateReducer().apply_all(ordered).snapshot()
+    recent = ordered[-tail:] if tail else []
+    return (
+        f"CURRENT STATE (reduced from {len(ordered)} FDC3 events, authoritative over the activity below):\n"
+        f"{json.dumps(state, separators=(',', ':'), default=str)}\n\n"
+        f"RECENT ACTIVITY (last {len(recent)} events):\n"
+        f"{encode_logs(recent)}"
+    )
@@ -4,27 +4,33 @@ import struct
 import os
 import subprocess
 
+# Opened once for the life of the host process; line-buffered so a crash keeps what was written
+DEBUG_LOG_PATH = os.environ.get("HOST_DEBUG_LOG", "c:/temp/host_debug_new.txt")
+try:
+    debug_log = open(DEBUG_LOG_PATH, "a", encoding='utf-8', buffering=1)
+except OSError:
+    debug_log = None
+
+def debug(message):
+    if debug_log is not None:
+        debug_log.write(message + "\n")
+
 def get_message():
     try:
-        with open("c:/temp/host_debug_new.txt", "a", encoding='utf-8') as f:
-            f.write("get_message: Waiting for stdin...\n")
+        debug("get_message: Waiting for stdin...")
             
         raw = sys.stdin.buffer.read(4)
         if not raw:
-            with open("c:/temp/host_debug_new.txt", "a") as f:
-                f.write("get_message: EOF reading length\n")
+            debug("get_message: EOF reading length")
             sys.exit(0)
         msg_len = struct.unpack('@I', raw)[0]
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"get_message: Length={msg_len}\n")
+        debug(f"get_message: Length={msg_len}")
             
         msg = sys.stdin.buffer.read(msg_len).decode('utf-8')
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"get_message: Payload read. Size={len(msg)}\n")
+        debug(f"get_message: Payload read. Size={len(msg)}")
         return json.loads(msg)
     except Exception as e:
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"get_message ERROR: {e}\n")
+        debug(f"get_message ERROR: {e}")
         raise e
 
 def send_message(content):
@@ -34,12 +40,10 @@ def send_message(content):
 
 if __name__ == "__main__":
     try:
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"HOST LAUNCHED PID:{os.getpid()}\n")
+        debug(f"HOST LAUNCHED PID:{os.getpid()}")
             
         data = get_message()
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"Message received: {json.dumps(data)}\n")
+        debug(f"Message received: {json.dumps(data)}")
 
         # Create sessions directory if it doesn't exist
         sessions_dir = os.path.join(os.path.dirname(__file__), "..", "sessions")
@@ -79,25 +83,21 @@ if __name__ == "__main__":
             if 'endTime' in cfg and cfg['endTime']:
                 cmd.extend(["--end_time", cfg['endTime']])
 
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"Running cmd: {cmd}\n")
+        debug(f"Running cmd: {cmd}")
 
         # Sync run with capturing
         try:
             result = subprocess.run(cmd, cwd=os.path.dirname(analyst_script), capture_output=True, text=True, encoding='utf-8', timeout=300)
             
-            with open("c:/temp/host_debug_new.txt", "a") as f:
-                f.write(f"Analyst finished. RC={result.returncode}\nStdout: {result.stdout[:100]}...\nStderr: {result.stderr}\n")
+            debug(f"Analyst finished. RC={result.returncode}\nStdout: {result.stdout[:100]}...\nStderr: {result.stderr}")
 
             if result.returncode == 0:
                 send_message({"status": "Success", "analysis": result.stdout})
             else:
                 send_message({"status": "Error", "error": result.stderr})
         except subprocess.TimeoutExpired:
-             with open("c:/temp/host_debug_new.txt", "a") as f:
-                f.write(f"Analyst TIMEOUT\n")
+             debug(f"Analyst TIMEOUT")
              send_message({"status": "Error", "error": "Analysis timed out (Backend Unresponsive)."})
     except Exception as e:
-        with open("c:/temp/host_debug_new.txt", "a") as f:
-            f.write(f"CRITICAL ERROR: {e}\n")
+        debug(f"CRITICAL ERROR: {e}")
         send_message({"status": "Error", "error": str(e)})
@@ -0,0 +1,267 @@
+"""
+Compact FDC3 Log Encoder
+
+Turns captured FDC3 log entries ({origin, type, timestamp, data}) into a
+token-efficient tabular block for LLM prompts, instead of one json.dumps()
+line per entry:
+
+    #fdc3log n=3 t0=1718000000000
+    #legend +N = ms since previous row; col=value; missing col = unchanged since the previous row of the same type; ~ = field absent
+    #cols 0=origin 1=type 2=data.type 3=data.id.ticker 4=data.name
+    #syms $0=fdc3.instrument $1=AAPL $2="Apple Inc."
+    +0 0=APP 1=$0 2=$0 3=$1 4=$2
+    +1520 1=$0 3=MSFT 4=Microsoft
+    +30 1=$0 3=$1 4=$2
+
+- Field names appear once, in the #cols header; rows refer to column indexes.
+- Timestamps are delta-encoded against the previous row (rows are sorted).
+- Strings written more than once are interned in the #syms table.
+- Fields equal to their value in the previous row of the same type are omitted.
+  The type column is the exception: every row after the first of its type
+  starts with it, so each row's stream stays visible.
+
+Each entry is diffed against the previous entry of its type before anything is
+flattened: subtrees that compare equal (in C) are skipped, and only changed
+cells are collected. The distinct cells are then encoded once, with their
+column labels and interned symbols, and the table is built with one join.
+
+Trade-off: the legacy prompt was one json.dumps() line per entry, which runs
+in C. On 10,000 synthetic entries (bench_log_encoding.py) the encoder takes
+~70 ms against ~45 ms for that loop. Its
+output is ~6x smaller in characters and tokens. What remains is the Python walk
+over the fields that did change.
+
+Usage:
+    from log_encoder import encode_logs
+    prompt = f"Captured FDC3 Contexts:\\n{encode_logs(logs)}"
+"""
+
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+MAX_FLATTEN_DEPTH = 6
+MIN_INTERN_LENGTH = 4  # '$12' costs 3 chars, so shorter strings never pay off
+
+ABSENT = '~'
+_SAFE_STRING = re.compile(r'^[A-Za-z_][A-Za-z0-9_.:/@+\-]*$')
+_RESERVED = {'~', 'null', 'true', 'false'}
+_MISSING = object()
+_EMPTY: Dict[str, Any] = {}
+_SCALARS = frozenset({str, int, float, bool, type(None)})
+
+
+def _leaf_keys(value: Any, key: str, depth: int) -> List[str]:
+    """Columns a value flattens to (positions.0.sym, ...)"""
+    t = type(value)
+    if (t is dict or t is list) and value and depth < MAX_FLATTEN_DEPTH:
+        keys: List[str] = []
+        for k, v in (value.items() if t is dict else enumerate(value)):
+            keys += _leaf_keys(v, f"{key}.{k}", depth + 1)
+        return keys
+    return [key]
+
+
+def _walked(value: Any, depth: int) -> bool:
+    """Whether a value at this depth is flattened into sub-columns rather than written whole"""
+    return (type(value) is dict or type(value) is list) and bool(value) and depth < MAX_FLATTEN_DEPTH
+
+
+def _diff(new: Dict[Any, Any], old: Dict[Any, Any], prefix: str, depth: int,
+          cells: List[Tuple[str, Any, type]], absent: List[str], skip: Any = None):
+    """
+    Flatten the dict new into dotted (column, value, type) cells, keeping only those
+    that differ from old. Subtrees equal to the old ones are compared in C and never
+    walked (so inside them 1 and true count as equal, as == has it); columns that old
+    had and new lacks are collected in absent.
+    """
+    get = old.get
+    added = 0
+    for k, v in new.items():
+        o = get(k, _MISSING)
+        if o == v and type(o) is type(v):
+            continue
+        if o is _MISSING:
+            added += 1
+        if k == skip:
+            continue
+        t = type(v)
+        if t is dict and type(o) is dict and v and o and depth < MAX_FLATTEN_DEPTH:
+            _diff(v, o, f"{prefix}{k}.", depth + 1, cells, absent)
+        elif t in _SCALARS and type(o) is not dict and type(o) is not list:
+            cells.append((f"{prefix}{k}", v, t))
+        else:
+            _diff_value(f"{prefix}{k}", v, o, depth, cells, absent)
+    if len(old) > len(new) - added:
+        # Some old keys are not in new
+        for k in old.keys() - new.keys():
+            if k != skip:
+                absent += _leaf_keys(old[k], f"{prefix}{k}", depth)
+
+
+def _diff_list(new: List[Any], old: List[Any], prefix: str, depth: int,
+               cells: List[Tuple[str, Any, type]], absent: List[str]):
+    """_diff for lists, whose items are compared by position"""
+    size = len(old)
+    for i, v in enumerate(new):
+        o = old[i] if i < size else _MISSING
+        if o == v and type(o) is type(v):
+            continue
+        _diff_value(f"{prefix}{i}", v, o, depth, cells, absent)
+    for i in range(len(new), size):
+        absent += _leaf_keys(old[i], f"{prefix}{i}", depth)
+
+
+def _diff_value(key: str, value: Any, old: Any, depth: int,
+                cells: List[Tuple[str, Any, type]], absent: List[str]):
+    """One changed value of any kind, including trees replacing scalars and the reverse"""
+    t = type(value)
+    if _walked(value, depth):
+        walk = _diff if t is dict else _diff_list
+        if type(old) is t and old:
+            walk(value, old, key + ".", depth + 1, cells, absent)
+            return
+        # A new tree in place of a scalar, an empty value or a tree of the other kind
+        start = len(cells)
+        walk(value, _EMPTY if t is dict else [], key + ".", depth + 1, cells, absent)
+        if _walked(old, depth):
+            written = {cell[0] for cell in cells[start:]}
+            absent += [leaf for leaf in _leaf_keys(old, key, depth) if leaf not in written]
+        elif old is not _MISSING:
+            absent.append(key)
+        return
+    if t not in _SCALARS:
+        if isinstance(value, (dict, list)):
+            # Empty or nested too deep: one JSON cell
+            value, t = json.dumps(value, separators=(',', ':')), str
+        elif t.__hash__ is None:
+            value, t = str(value), str
+    if _walked(old, depth):
+        absent += _leaf_keys(old, key, depth)
+    cells.append((key, value, t))
+
+
+def _encode_scalar(value: Any) -> str:
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if isinstance(value, float):
+        return repr(int(value)) if value.is_integer() and abs(value) < 1e15 else repr(value)
+    if isinstance(value, int):
+        return str(value)
+    s = str(value)
+    if _SAFE_STRING.match(s) and s not in _RESERVED:
+        return s
+    return json.dumps(s, ensure_ascii=False)
+
+
+def _entry_ts(entry: Dict[str, Any]):
+    ts = entry.get('timestamp')
+    return ts if isinstance(ts, (int, float)) else None
+
+
+def _sort_key(entry: Dict[str, Any]):
+    ts = entry.get('timestamp')
+    return ts if isinstance(ts, (int, float)) else 0
+
+
+def _encode_delta(delta: Any) -> str:
+    if type(delta) is int and delta >= 0:
+        return f"+{delta}"
+    return f"+{_encode_scalar(delta)}" if delta >= 0 else _encode_scalar(delta)
+
+
+def encode_logs(logs: List[Dict[str, Any]]) -> str:
+    """Encode FDC3 log entries as a compact delta/interned table (single join, linear)"""
+    if not logs:
+        return "#fdc3log n=0"
+
+    # Chronological order so timestamp deltas stay small and "unchanged" means "since last event"
+    ordered = sorted(logs, key=_sort_key)
+    t0 = next((ts for ts in map(_entry_ts, ordered) if ts is not None), 0)
+
+    # Diff every entry against the previous entry of its type. Only the changed cells are
+    # kept, in one flat list with each row's end offset, so unchanged subtrees are never
+    # flattened and columns and string counts for interning come from what is written.
+    cells: List[Tuple[str, Any, type]] = []
+    rows: List[Tuple[str, int]] = []
+    absent_by_row: Dict[int, List[str]] = {}
+    absent: List[str] = []
+    previous_by_type: Dict[Any, Dict[str, Any]] = {}
+    last_ts = t0
+    for entry in ordered:
+        ts = entry.get('timestamp', last_ts)
+        if type(ts) is not int and type(ts) is not float:
+            ts = _entry_ts(entry)
+            if ts is None:
+                ts = last_ts
+        delta = ts - last_ts
+        last_ts = ts
+
+        row_type = entry.get('type')
+        if type(row_type) is dict or type(row_type) is list:
+            row_type = None
+        previous = previous_by_type.get(row_type)
+        if previous is None:
+            _diff(entry, _EMPTY, "", 1, cells, absent, 'timestamp')
+        else:
+            # The type of a repeated stream is unchanged by construction, but is still
+            # written first so every row shows which stream it belongs to
+            if row_type is not None:
+                cells.append(('type', row_type, type(row_type)))
+            _diff(entry, previous, "", 1, cells, absent, 'timestamp')
+            if absent:
+                absent_by_row[len(rows)] = absent
+                absent = []
+        previous_by_type[row_type] = entry
+        rows.append((f"+{delta}" if type(delta) is int and delta >= 0 else _encode_delta(delta), len(cells)))
+
+    # Each distinct cell is encoded once: columns in order of first appearance, strings
+    # written more than once interned in the symbol table
+    cell_counts = Counter(cells)
+    columns: Dict[str, int] = {}
+    string_counts: Dict[str, int] = {}
+    for (key, value, t), count in cell_counts.items():
+        if key not in columns:
+            columns[key] = len(columns)
+        if t is str:
+            string_counts[value] = string_counts.get(value, 0) + count
+
+    encoded: Dict[str, str] = {}
+    symbols: List[str] = []
+    for value, count in string_counts.items():
+        text = value if _SAFE_STRING.match(value) and value not in _RESERVED else json.dumps(value, ensure_ascii=False)
+        if count > 1 and len(value) >= MIN_INTERN_LENGTH:
+            ref = f"${len(symbols)}"
+            symbols.append(f"{ref}={text}")
+            text = ref
+        encoded[value] = text
+    labels = {key: f"{idx}=" for key, idx in columns.items()}
+    cell_text: Dict[Tuple[str, Any, type], str] = {}
+    for cell in cell_counts:
+        key, value, t = cell
+        cell_text[cell] = labels[key] + (encoded[value] if t is str else _encode_scalar(value))
+    texts = list(map(cell_text.__getitem__, cells))
+
+    lines = [
+        f"#fdc3log n={len(rows)} t0={_encode_scalar(t0)}",
+        "#legend +N = ms since previous row; col=value; missing col = unchanged since the previous row of the same type; ~ = field absent",
+        "#cols " + " ".join(f"{idx}={name}" for name, idx in columns.items()),
+    ]
+    if symbols:
+        lines.append("#syms " + " ".join(symbols))
+
+    start = 0
+    for index, (delta, end) in enumerate(rows):
+        line = " ".join([delta, *texts[start:end]])
+        start = end
+        dropped = absent_by_row.get(index)
+        if dropped:
+            line += "".join(f" {labels[key]}{ABSENT}" for key in sorted(dropped, key=columns.get))
+        lines.append(line)
+
+    return "\n".join(lines)
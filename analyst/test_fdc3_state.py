@@ -0,0 +1,49 @@
+"""
+FDC3 State Reducer Tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from fdc3_state import FDC3StateReducer
+
+
+def summary(ts, orders):
+    data = {"type": "portfolio.summary", "positions": [{"sym": "AAPL", "qty": 10, "avg": 190.0}]}
+    if orders:
+        data["orders"] = orders
+    return {"timestamp": ts, "type": "portfolio.summary", "data": data}
+
+
+def order_collection(ts, members):
+    return {"timestamp": ts, "type": "fdc3.collection", "data": {
+        "type": "fdc3.collection", "name": "Recent Orders",
+        "members": [{"type": "fdc3.order", "id": {"orderId": oid}, "details": {"symbol": "MSFT", "status": st}}
+                    for oid, st in members]}}
+
+
+def test_summary_drops_orders_it_no_longer_lists():
+    reducer = FDC3StateReducer()
+    reducer.apply(summary(1, [{"id": 1, "sym": "AAPL", "st": "Submitted"}, {"id": 2, "sym": "MSFT", "st": "Submitted"}]))
+    reducer.apply(summary(2, [{"id": 2, "sym": "MSFT", "st": "Submitted"}]))
+    assert [o["orderId"] for o in reducer.snapshot()["openOrders"]] == ["2"]
+    reducer.apply(summary(3, None))  # the app leaves out 'orders' when there are none
+    assert reducer.snapshot()["openOrders"] == []
+
+
+def test_order_collection_is_a_snapshot():
+    reducer = FDC3StateReducer()
+    reducer.apply({"timestamp": 1, "type": "order.submitted",
+                   "data": {"orderId": 7, "symbol": "TSLA", "side": "BUY", "qty": 5, "type": "LIMIT"}})
+    reducer.apply(order_collection(2, [(8, "Submitted"), (9, "Filled")]))
+    state = reducer.snapshot()
+    assert [o["orderId"] for o in state["openOrders"]] == ["8"]
+    assert [o["orderId"] for o in state["recentlyClosedOrders"]] == ["9"]
+
+
+def test_single_order_updates_keep_other_orders():
+    reducer = FDC3StateReducer()
+    reducer.apply(order_collection(1, [(8, "Submitted")]))
+    reducer.apply({"timestamp": 2, "type": "fdc3.order", "data": {"type": "fdc3.order", "id": {"orderId": 10}}})
+    assert [o["orderId"] for o in reducer.snapshot()["openOrders"]] == ["8", "10"]
@@ -0,0 +1,51 @@
+"""
+Compact FDC3 Log Encoder Tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from log_encoder import encode_logs
+
+
+def instrument(ts, ticker, name):
+    return {"origin": "APP", "type": "fdc3.instrument", "timestamp": ts,
+            "data": {"type": "fdc3.instrument", "id": {"ticker": ticker}, "name": name}}
+
+
+def test_docstring_example():
+    logs = [instrument(1718000001550, "AAPL", "Apple Inc."), instrument(1718000000000, "AAPL", "Apple Inc."),
+            instrument(1718000001520, "MSFT", "Microsoft")]
+    assert encode_logs(logs).splitlines() == [
+        "#fdc3log n=3 t0=1718000000000",
+        "#legend +N = ms since previous row; col=value; missing col = unchanged since the previous row "
+        "of the same type; ~ = field absent",
+        "#cols 0=origin 1=type 2=data.type 3=data.id.ticker 4=data.name",
+        '#syms $0=fdc3.instrument $1=AAPL $2="Apple Inc."',
+        "+0 0=APP 1=$0 2=$0 3=$1 4=$2",
+        "+1520 1=$0 3=MSFT 4=Microsoft",
+        "+30 1=$0 3=$1 4=$2",
+    ]
+
+
+def test_absent_fields_and_empty_input():
+    logs = [{"type": "x.y", "timestamp": 1, "data": {"a": 1, "b": [1, 2]}},
+            {"type": "x.y", "timestamp": 3, "data": {"a": 1}}]
+    assert encode_logs(logs).splitlines()[-1] == "+2 0=x.y 2=~ 3=~"
+    assert encode_logs([]) == "#fdc3log n=0"
+
+
+def test_subtree_changes_shape():
+    """A list replaced by a dict, then by a scalar: old columns the new value lacks are marked absent"""
+    logs = [{"type": "t", "timestamp": 1, "data": {"a": [1, 2], "b": "x"}},
+            {"type": "t", "timestamp": 2, "data": {"a": {"0": 1, "k": 3}, "b": "x"}},
+            {"type": "t", "timestamp": 3, "data": {"a": 5, "b": {}}},
+            {"type": "u", "timestamp": 4, "data": {"b": "x"}}]
+    assert encode_logs(logs).splitlines()[2:] == [
+        "#cols 0=type 1=data.a.0 2=data.a.1 3=data.b 4=data.a.k 5=data.a",
+        "+0 0=t 1=1 2=2 3=x",
+        "+1 0=t 1=1 4=3 2=~",
+        '+1 0=t 5=5 3="{}" 1=~ 4=~',
+        "+1 0=u 3=x",
+    ]
@@ -5,6 +5,7 @@ import os
 import argparse
 import time
 from openai import OpenAI
+from fdc3_state import build_context
 
 def analyze():
     start_time = time.time()
@@ -137,31 +138,9 @@ def analyze():
     all_logs = filtered_logs
 
     try:
-        # Context Selection Logic ("Sticky Context")
-        # 1. Find the LATEST Portfolio Snapshot (CRITICAL for position awareness)
-        portfolio_snapshot = None
-        for log in reversed(all_logs):
-            if log['data'].get('type') == 'fdc3.portfolio':
-                portfolio_snapshot = log
-                break
-        
-        # 2. Select recent logs (Last 50)
-        recent_logs = all_logs[-50:]
-        
-        # 3. Combine them
-        # If we found a snapshot and it's NOT already in the recent list, prepend it.
-        final_context_logs = []
-        if portfolio_snapshot and not (portfolio_snapshot in recent_logs):
-            sys.stderr.write(f"DEBUG: Injecting Sticky Portfolio Snapshot ({portfolio_snapshot['timestamp']})\n")
-            final_context_logs.append(portfolio_snapshot)
-        
-        final_context_logs.extend(recent_logs)
-        
-        # Prepare text lines
-        texts = [f"{l['origin']} ({l.get('timestamp')}): {json.dumps(l['data'])}" for l in final_context_logs]
-        
-        # Direct Context (No Vector DB needed for small batch)
-        context = "\n".join(texts)
+        # Fold the whole log into current state (portfolio, positions, orders, selection)
+        # and send it with a short recent-activity tail instead of the raw history
+        context = build_context(all_logs)
         
         sys.stderr.write("DEBUG: Logs prepared.\n")
         
@@ -182,7 +161,7 @@ def analyze():
         # Combined Knowledge + System Prompt
         simulation_logic = "\n\nCRITICAL CONTEXT:\n1. HYBRID EXECUTION: Stocks (AAPL, MSFT, etc.) are routed live to IBKR Gateway. FX pairs (USD/JPY, EUR/USD, etc.) are handled via a local Simulation Service for immediate execution to bypass broker restrictions.\n2. SIMULATION FLAG: Look for 'isSimulated: true' in positions or orders. These are simulated FX trades that reflect in the user's combined portfolio.\n3. PORTFOLIO LOGIC: The 'fdc3.portfolio' snapshot represents the merged state of both live IBKR holdings and simulated FX contracts."
         
-        rule_set = "\n\nCRITICAL ANALYSIS RULES:\n1. Prioritize the LATEST information based on timestamp order.\n2. Individual `fdc3.position` updates appearing AFTER a `fdc3.portfolio` snapshot MUST override the portfolio's data for that instrument.\n3. The logs are chronological (Oldest to Newest). The last entry is the current state."
+        rule_set = "\n\nCRITICAL ANALYSIS RULES:\n1. CURRENT STATE is already reduced from the full log (snapshots and later position/order updates applied in order). Treat it as the current portfolio and order state.\n2. RECENT ACTIVITY is the chronological tail (Oldest to Newest) and explains what the trader just did."
         
         if knowledge_base:
             system_instruction = f"REFERENCE KNOWLEDGE:\n{knowledge_base}\n\nINSTRUCTIONS:\n{system_base}{simulation_logic}{rule_set}"
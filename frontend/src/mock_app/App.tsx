@@ -42,23 +42,26 @@ const App = () => {
     const [layout, setLayout] = useState<Layout[]>(initialLayout);
     const [isMobile, setIsMobile] = useState(false);
     const [showSettings, setShowSettings] = useState(false);
-    const { broadcastSnapshot, theme, toggleTheme, updateInstrumentFromIBKR, connectionStatus, fetchStatus, mcpMode, toggleMcpMode } = useSimulationStore();
+    const { instruments, broadcastSnapshot, theme, toggleTheme, updateInstrumentFromIBKR, releaseServerSymbols, connectionStatus, fetchStatus, mcpMode, toggleMcpMode } = useSimulationStore();
 
     // IBKR Market Data Integration
 
     // IBKR Market Data Integration
-    const handleIBKRUpdate = useCallback((symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null; isDelayed: boolean }) => {
+    const handleIBKRUpdate = useCallback((symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null; isDelayed: boolean; isSimulated?: boolean }) => {
         updateInstrumentFromIBKR(symbol, {
             last: data.last,
             bid: data.bid,
             ask: data.ask,
             chg: data.chg,
+            isSimulated: data.isSimulated,
         });
     }, [updateInstrumentFromIBKR]);
 
     const { isDelayed: ibkrDelayed } = useIBKRMarketData({
         onUpdate: handleIBKRUpdate,
+        onDisconnect: releaseServerSymbols,
         autoConnect: true,
+        symbols: Object.keys(instruments),
     });
 
     // Widget metadata
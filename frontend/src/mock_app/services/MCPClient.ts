@@ -31,6 +31,12 @@ export class BrowserSSETransport implements Transport {
             this._abortController = new AbortController();
 
             this._eventSource.onerror = (event) => {
+                // Once connected, let EventSource reconnect by itself: it sends
+                // Last-Event-ID and the server resumes the same session
+                if (this._endpoint && this._eventSource?.readyState === EventSource.CONNECTING) {
+                    console.warn("[MCP] SSE connection lost, resuming session...");
+                    return;
+                }
                 const error = new Error(`EventSource error: ${JSON.stringify(event)}`);
                 reject(error);
                 this.onerror?.(error);
@@ -159,8 +165,8 @@ export class MCPClientService {
                     }
                     console.error("MCP Transport Error:", err);
                     this.isConnected = false;
-                    // Force close the transport on error to stop EventSource from auto-reconnecting
-                    // with a session ID that the server has likely already discarded.
+                    // Transient drops are resumed inside the transport; reaching here means the
+                    // stream is gone for good, so close it and reconnect fresh on next use.
                     if (this.transport) {
                         this.transport.close().catch(e => console.error("Error closing transport on error:", e));
                         this.transport = null;
@@ -7,13 +7,16 @@ export interface IBKRMarketDataUpdate {
     ask: number | null;
     chg?: number | null;
     isDelayed: boolean;
+    isSimulated?: boolean; // priced by the server-side simulator, not IBKR
 }
 
 export type OnUpdateCallback = (symbol: string, data: IBKRMarketDataUpdate) => void;
 
 interface UseIBKRMarketDataOptions {
     onUpdate: OnUpdateCallback;
+    onDisconnect?: () => void; // stream lost: symbols it priced get no more updates until it is back
     autoConnect?: boolean;
+    symbols?: string[]; // the watchlist; the server only keeps market-data demand for these
 }
 
 interface IBKRMarketDataState {
@@ -22,7 +25,7 @@ interface IBKRMarketDataState {
     error: string | null;
 }
 
-export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarketDataOptions) => {
+export const useIBKRMarketData = ({ onUpdate, onDisconnect, autoConnect = true, symbols }: UseIBKRMarketDataOptions) => {
     const [state, setState] = useState<IBKRMarketDataState>({
         connected: false,
         isDelayed: false,
@@ -32,6 +35,11 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
     const eventSourceRef = useRef<EventSource | null>(null);
     const mountedRef = useRef(true);
     const reconnectTimeoutRef = useRef<ReturnType<typeof setTimeout> | null>(null);
+    const symbolsRef = useRef(symbols);
+    symbolsRef.current = symbols;
+    // Stream clientId and the symbols the server has for it, for POST /ibkr/stream/<clientId>/symbols
+    const clientIdRef = useRef<number | null>(null);
+    const streamSymbolsRef = useRef<Set<string> | null>(null);
 
     // Cleanup function
     const cleanup = useCallback(() => {
@@ -43,6 +51,29 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
             eventSourceRef.current.close();
             eventSourceRef.current = null;
         }
+        clientIdRef.current = null;
+        streamSymbolsRef.current = null;
+    }, []);
+
+    // Bring the open stream's symbols in line with the watchlist; removed symbols release their demand
+    const syncSymbols = useCallback(() => {
+        const clientId = clientIdRef.current;
+        const current = streamSymbolsRef.current;
+        const wanted = symbolsRef.current;
+        if (clientId === null || current === null || !wanted) {
+            return;
+        }
+        const add = wanted.filter(symbol => !current.has(symbol));
+        const remove = [...current].filter(symbol => !wanted.includes(symbol));
+        if (add.length === 0 && remove.length === 0) {
+            return;
+        }
+        streamSymbolsRef.current = new Set(wanted);
+        fetch(`/ibkr/stream/${clientId}/symbols`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ add, remove }),
+        }).catch(err => console.error('[IBKR] Failed to update stream symbols:', err));
     }, []);
 
     // Connect to IBKR via Flask proxy
@@ -74,9 +105,12 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
                 throw new Error(connectData.error || 'Connection failed');
             }
 
-            // Step 2: Open SSE stream for market data
+            // Step 2: Open SSE stream for market data, limited to the watchlist when one is given
             console.log('[IBKR] Opening SSE stream...');
-            const eventSource = new EventSource('/ibkr/stream');
+            const watchlist = symbolsRef.current;
+            const eventSource = new EventSource(watchlist
+                ? `/ibkr/stream?symbols=${encodeURIComponent(watchlist.join(','))}`
+                : '/ibkr/stream');
             eventSourceRef.current = eventSource;
 
             eventSource.onopen = () => {
@@ -87,7 +121,11 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
                 try {
                     const data = JSON.parse(event.data);
 
-                    if (data.type === 'connected') {
+                    if (data.type === 'stream') {
+                        clientIdRef.current = data.clientId;
+                        streamSymbolsRef.current = data.symbols ? new Set<string>(data.symbols) : null;
+                        syncSymbols();
+                    } else if (data.type === 'connected') {
                         console.log('[IBKR] Connection status:', data.status);
                         setState(prev => ({ ...prev, connected: data.status }));
                     } else if (data.type === 'marketData') {
@@ -103,6 +141,7 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
                             ask: data.ask,
                             chg: data.chg,
                             isDelayed: data.isDelayed,
+                            isSimulated: data.isSimulated === true,
                         });
                     } else if (data.type === 'error') {
                         console.error('[IBKR] Server error:', data.message);
@@ -116,6 +155,7 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
             eventSource.onerror = (error) => {
                 console.error('[IBKR] SSE error:', error);
                 setState(prev => ({ ...prev, connected: false, error: 'SSE connection error' }));
+                onDisconnect?.();
 
                 // Close and reconnect
                 cleanup();
@@ -149,7 +189,7 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
                 }, 5000);
             }
         }
-    }, [cleanup, onUpdate, autoConnect, state.isDelayed]);
+    }, [cleanup, syncSymbols, onUpdate, onDisconnect, autoConnect, state.isDelayed]);
 
     // Subscribe to a specific symbol (for dynamic subscriptions)
     const subscribe = useCallback((symbol: string, _conid?: number) => {
@@ -157,6 +197,11 @@ export const useIBKRMarketData = ({ onUpdate, autoConnect = true }: UseIBKRMarke
         console.log(`[IBKR] Subscribe request for ${symbol} (handled by server)`);
     }, []);
 
+    const symbolsKey = symbols?.join(',');
+    useEffect(() => {
+        syncSymbols();
+    }, [symbolsKey, syncSymbols]);
+
     // Auto-connect on mount
     useEffect(() => {
         mountedRef.current = true;
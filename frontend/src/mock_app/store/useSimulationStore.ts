@@ -103,6 +103,7 @@ interface SimulationState {
     aiConfig: AiConfig;
     theme: 'dark' | 'light';
     ibkrSymbols: Set<string>; // Symbols receiving live IBKR data
+    serverSimSymbols: Set<string>; // Symbols priced by the server-side simulator (same prices in every tab)
     mcpTrades: McpTrade[]; // Trades executed via MCP/IBKR
     connectionStatus: {
         marketData: boolean;
@@ -123,7 +124,8 @@ interface SimulationState {
     selectTrade: (trade: Trade) => void;
     selectContact: (name: string) => void;
     flattenPosition: (symbol: string) => void;
-    updateInstrumentFromIBKR: (symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null }) => void;
+    updateInstrumentFromIBKR: (symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null; isSimulated?: boolean }) => void;
+    releaseServerSymbols: () => void; // server stream lost: resume the local random walk for every symbol
     addMcpTrade: (trade: Omit<McpTrade, 'id' | 'timestamp'>) => void;
     updateMcpTrade: (id: string, updates: Partial<McpTrade>) => void;
     cancelOrder: (orderId: string) => Promise<void>;
@@ -188,6 +190,7 @@ export const useSimulationStore = create<SimulationState>()(
             fdc3Logs: [],
             toasts: [],
             ibkrSymbols: new Set<string>(),
+            serverSimSymbols: new Set<string>(),
             mcpTrades: [],
             aiConfig: {
                 provider: 'local',
@@ -379,8 +382,8 @@ export const useSimulationStore = create<SimulationState>()(
                     const newInstruments = { ...state.instruments };
                     let changed = false;
                     Object.keys(newInstruments).forEach(key => {
-                        // Skip symbols that have live IBKR data (only simulate non-IBKR symbols)
-                        if (state.ibkrSymbols.has(key)) {
+                        // Skip symbols streamed by the server, live from IBKR or from its simulator
+                        if (state.ibkrSymbols.has(key) || state.serverSimSymbols.has(key)) {
                             return;
                         }
                         if (Math.random() > 0.4) {
@@ -603,7 +606,7 @@ export const useSimulationStore = create<SimulationState>()(
                 }
             },
 
-            updateInstrumentFromIBKR: (symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null }) => {
+            updateInstrumentFromIBKR: (symbol: string, data: { last: number; bid: number | null; ask: number | null; chg?: number | null; isSimulated?: boolean }) => {
                 set(state => {
                     const inst = state.instruments[symbol];
                     // Update EQUITY and FX type instruments (skip RATES for now)
@@ -632,17 +635,33 @@ export const useSimulationStore = create<SimulationState>()(
                         }
                     }
 
-                    // Add symbol to IBKR set
+                    // A symbol is in at most one set: the server falls back to simulating it when IBKR drops
+                    const inSim = state.serverSimSymbols.has(symbol);
+                    const inIbkr = state.ibkrSymbols.has(symbol);
+                    if (data.isSimulated ? (inSim && !inIbkr) : (inIbkr && !inSim)) {
+                        return { instruments: { ...state.instruments, [symbol]: updatedInst } };
+                    }
+                    const newSimSymbols = new Set(state.serverSimSymbols);
                     const newIbkrSymbols = new Set(state.ibkrSymbols);
-                    newIbkrSymbols.add(symbol);
-
+                    if (data.isSimulated) {
+                        newSimSymbols.add(symbol);
+                        newIbkrSymbols.delete(symbol);
+                    } else {
+                        newIbkrSymbols.add(symbol);
+                        newSimSymbols.delete(symbol);
+                    }
                     return {
                         instruments: { ...state.instruments, [symbol]: updatedInst },
+                        serverSimSymbols: newSimSymbols,
                         ibkrSymbols: newIbkrSymbols
                     };
                 });
             },
 
+            releaseServerSymbols: () => {
+                set({ ibkrSymbols: new Set<string>(), serverSimSymbols: new Set<string>() });
+            },
+
             addMcpTrade: (trade) => {
                 const id = `MCP-${Date.now()}-${Math.random().toString(36).substring(7)}`;
                 set(state => ({
@@ -707,18 +726,7 @@ export const useSimulationStore = create<SimulationState>()(
                         [symbol]: newInstrument
                     }
                 }));
-
-                // Subscribe to market data
-                try {
-                    await fetch(`${API_BASE_URL}/mcp/subscribe`, {
-                        method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
-                        body: JSON.stringify({ symbol })
-                    });
-                    console.log(`Subscribed to market data for ${symbol}`);
-                } catch (err) {
-                    console.error(`Failed to subscribe to ${symbol}:`, err);
-                }
+                // Market data follows through the /ibkr/stream symbols (useIBKRMarketData)
             },
 
             removeInstrument: (symbol: string) => {
@@ -730,6 +738,7 @@ export const useSimulationStore = create<SimulationState>()(
                         selectedSymbol: state.selectedSymbol === symbol ? '' : state.selectedSymbol
                     };
                 });
+                // Its market-data line is released once it leaves the /ibkr/stream symbols
             },
 
             reorderInstruments: (newOrder: string[]) => {
@@ -753,7 +762,8 @@ export const useSimulationStore = create<SimulationState>()(
     )
 );
 
-// Start simulation loop
+// Local simulation loop: only moves symbols the server is not streaming
+// (e.g. instruments added without IBKR while the server simulator has no model for them)
 setInterval(() => {
     useSimulationStore.getState().simulateMarketData();
 }, 2000);
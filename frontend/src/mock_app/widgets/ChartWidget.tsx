@@ -2,13 +2,43 @@
 import { useState, useEffect } from 'react';
 import { AreaChart, Area, XAxis, YAxis, Tooltip, CartesianGrid, ResponsiveContainer } from 'recharts';
 import { useSimulationStore } from '../store/useSimulationStore';
+import { API_BASE_URL } from '../config';
+
+interface Bar { t: number; o: number; h: number; l: number; c: number; v: number; n: number }
+
+const formatBarTime = (seconds: number) =>
+    new Date(seconds * 1000).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
 
 
 const ChartWidget = () => {
     const { instruments, selectedSymbol } = useSimulationStore();
     const [data, setData] = useState<{ time: string, value: number }[]>([]);
+    const [serverBars, setServerBars] = useState<Bar[]>([]);
 
+    // Server-side 1m bars (shared tick history); fall back to the synthetic series when there are none yet
     useEffect(() => {
+        let cancelled = false;
+        const symbol = selectedSymbol || 'AAPL';
+        const load = async () => {
+            try {
+                const res = await fetch(`${API_BASE_URL}/marketdata/bars?symbol=${encodeURIComponent(symbol)}&interval=1m`);
+                if (!res.ok) return;
+                const body = await res.json();
+                if (!cancelled) setServerBars(body.bars || []);
+            } catch {
+                if (!cancelled) setServerBars([]);
+            }
+        };
+        load();
+        const timer = setInterval(load, 60000);
+        return () => { cancelled = true; clearInterval(timer); };
+    }, [selectedSymbol]);
+
+    useEffect(() => {
+        if (serverBars.length >= 2) {
+            setData(serverBars.map(bar => ({ time: formatBarTime(bar.t), value: bar.c })));
+            return;
+        }
         const lastPrice = instruments[selectedSymbol || 'AAPL']?.last || 150;
         const dataPoints = [];
         let price = lastPrice;
@@ -22,7 +52,7 @@ const ChartWidget = () => {
             });
         }
         setData(dataPoints);
-    }, [selectedSymbol, instruments]);
+    }, [selectedSymbol, instruments, serverBars]);
 
     const isPositive = (data[data.length - 1]?.value || 0) >= (data[0]?.value || 0);
 
@@ -0,0 +1,169 @@
+"""
+Asynchronous Batched File Logger
+
+Replaces open-append-close per line under a global lock. Calling threads only
+append (timestamp, level, message) to a bounded in-memory buffer; one writer
+thread drains it every flush_interval, writes the batch with a single write()
+on a file kept open, and rotates by size (app.log -> app.log.1 -> ... ->
+app.log.<backups>).
+
+Levels below the configured one are dropped before anything is buffered.
+Per-tick messages pass a sample key: at most one line per key per
+sample_interval seconds is kept, and the next kept line reports how many were
+suppressed. If the buffer is full the oldest lines are dropped (counted in
+stats()), so logging never blocks a hot thread. If rotating fails (e.g. on
+Windows while another process has the file open) the writer keeps appending
+to the current file and tries again after ROTATE_RETRY seconds.
+
+Usage:
+    log = AsyncLogger("ibkr_proxy.log", level="INFO", max_bytes=10 * 1024 * 1024, backups=3)
+    log.log("INFO", "[IBKR] Connected")
+    log.log("DEBUG", f"[IBKR WS] Received {preview}", sample="ibkr-ws-message")
+    if log.enabled("DEBUG"): log.log("DEBUG", json.dumps(big_message))
+    log.close()   # flush and stop (also registered with atexit)
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+ROTATE_RETRY = 30.0
+
+
+class AsyncLogger:
+    """Enqueue-only logging front end with a background batching writer"""
+
+    def __init__(self, path: str, level: str = 'INFO', max_bytes: int = 10 * 1024 * 1024, backups: int = 3,
+                 buffer_size: int = 10000, flush_interval: float = 0.25, sample_interval: float = 1.0):
+        self.path = path
+        self.threshold = LEVELS.get(str(level).upper(), LEVELS['INFO'])
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.sample_interval = sample_interval
+        self._buffer = deque(maxlen=buffer_size)
+        self._samples: Dict[str, list] = {}  # key -> [next allowed time, suppressed since last kept]
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = None
+        self._size = 0
+        self._rotate_after = 0.0  # no rotation attempt before this time (after a failed one)
+        self._stats = {"enqueued": 0, "written": 0, "dropped": 0, "sampledOut": 0, "batches": 0,
+                       "rotations": 0, "rotationErrors": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name='async-log-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enabled(self, level: str) -> bool:
+        """Whether a level would be logged; guards messages that are costly to build"""
+        return LEVELS.get(level, 0) >= self.threshold
+
+    def log(self, level: str, message: str, sample: Optional[str] = None):
+        """Buffer one line; with a sample key, at most one line per key per sample_interval"""
+        if LEVELS.get(level, 0) < self.threshold or self._closed:
+            return
+        now = time.time()
+        if sample is not None:
+            slot = self._samples.get(sample)
+            if slot is None:
+                slot = self._samples[sample] = [0.0, 0]
+            if now < slot[0]:
+                slot[1] += 1
+                self._stats["sampledOut"] += 1
+                return
+            if slot[1]:
+                message = f"{message} (+{slot[1]} similar suppressed)"
+            slot[0], slot[1] = now + self.sample_interval, 0
+        if len(self._buffer) == self._buffer.maxlen:
+            self._stats["dropped"] += 1
+        self._buffer.append((now, level, message))
+        self._stats["enqueued"] += 1
+        if LEVELS[level] >= LEVELS['ERROR']:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+            if self._closed:
+                self._flush()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _flush(self):
+        # Writer thread only
+        if not self._buffer:
+            return
+        lines = []
+        stamp_second, stamp = None, ''
+        while self._buffer:
+            try:
+                ts, level, message = self._buffer.popleft()
+            except IndexError:
+                break
+            second = int(ts)
+            if second != stamp_second:
+                stamp_second, stamp = second, time.ctime(ts)
+            lines.append(f"[{stamp}] {level} {message}\n")
+        data = ''.join(lines).encode('utf-8', errors='replace')
+        try:
+            if self._file is None:
+                self._open()
+            if self._size and self._size + len(data) > self.max_bytes and time.time() >= self._rotate_after:
+                self._try_rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self._stats["written"] += len(lines)
+            self._stats["batches"] += 1
+        except OSError:
+            self._stats["errors"] += 1
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+
+    def _try_rotate(self):
+        try:
+            self._rotate()
+        except OSError:
+            self._stats["rotationErrors"] += 1
+            self._rotate_after = time.time() + ROTATE_RETRY
+            if self._file is None:
+                self._open()  # keep appending to the current file
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._stats["rotations"] += 1
+        self._open()
+
+    def close(self):
+        """Write everything buffered and stop the writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update({"path": self.path, "level": next(n for n, v in LEVELS.items() if v == self.threshold),
+                      "buffered": len(self._buffer), "bufferSize": self._buffer.maxlen,
+                      "maxBytes": self.max_bytes, "backups": self.backups})
+        return stats
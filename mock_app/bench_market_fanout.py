@@ -0,0 +1,89 @@
+"""
+Market-Data Fan-out Benchmark
+
+Measures relay CPU per tick for N connected /ibkr/stream clients:
+
+    legacy   json.dumps per tick, put_nowait into every client's Queue, then
+             each client formats its own f"data: ...\\n\\n" frame
+    shared   one sse_frame() per tick shared by every client's conflating
+             slot, then each client joins its pending frames
+
+Every client drains after every tick round, i.e. nobody is slow, so no
+updates are conflated away and both variants write the same frames.
+
+Usage:
+    python mock_app/bench_market_fanout.py [--clients 100 500 1000] [--ticks 200]
+"""
+
+import argparse
+import json
+import queue
+import random
+import time
+
+from market_fanout import MarketFanout, sse_frame
+
+SYMBOLS = ['AAPL', 'MSFT', 'NVDA', 'TSLA', 'GOOGL', 'AMZN', 'META', 'EUR/USD', 'GBP/USD', 'USD/JPY']
+
+
+def make_ticks(n, seed=7):
+    rng = random.Random(seed)
+    prices = {s: rng.uniform(1, 500) for s in SYMBOLS}
+    ticks = []
+    for _ in range(n):
+        for symbol in SYMBOLS:
+            prices[symbol] *= 1 + rng.gauss(0, 0.0005)
+            last = round(prices[symbol], 4)
+            ticks.append({'type': 'marketData', 'symbol': symbol, 'last': last,
+                          'bid': round(last - 0.01, 4), 'ask': round(last + 0.01, 4),
+                          'chg': 0.0, 'isDelayed': False})
+    return ticks
+
+
+def run_legacy(ticks, n_clients):
+    clients = [queue.Queue(maxsize=100) for _ in range(n_clients)]
+    written = 0
+    start = time.process_time()
+    for i in range(0, len(ticks), len(SYMBOLS)):
+        for update in ticks[i:i + len(SYMBOLS)]:
+            message = json.dumps(update)
+            for q in clients:
+                q.put_nowait(message)
+        for q in clients:
+            while not q.empty():
+                written += len(f"data: {q.get_nowait()}\n\n".encode('utf-8'))
+    return time.process_time() - start, written
+
+
+def run_shared(ticks, n_clients):
+    fanout = MarketFanout(max_rate=0)  # no rate limit: drain everything every round
+    clients = [fanout.add_client() for _ in range(n_clients)]
+    written = 0
+    start = time.process_time()
+    for i in range(0, len(ticks), len(SYMBOLS)):
+        for update in ticks[i:i + len(SYMBOLS)]:
+            fanout.publish(update['symbol'], sse_frame(update))
+        for client in clients:
+            written += len(b"".join(client.drain(timeout=0)))
+    return time.process_time() - start, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--ticks', type=int, default=200, help="tick rounds (one update per symbol each)")
+    args = parser.parse_args()
+
+    ticks = make_ticks(args.ticks)
+    print(f"{len(ticks):,} updates across {len(SYMBOLS)} symbols")
+    print(f"{'clients':>8} {'legacy':>12} {'shared':>12} {'speedup':>8} {'us/update (shared)':>20}")
+    for n in args.clients:
+        legacy_s, legacy_bytes = run_legacy(ticks, n)
+        shared_s, shared_bytes = run_shared(ticks, n)
+        assert legacy_bytes == shared_bytes, "variants wrote different output"
+        print(f"{n:>8} {legacy_s * 1000:>10.1f}ms {shared_s * 1000:>10.1f}ms "
+              f"{legacy_s / shared_s:>7.1f}x {shared_s / len(ticks) * 1e6:>20.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Local IBKR WebSocket Feed Simulator
+
+A standalone stand-in for the Client Portal gateway's market-data WebSocket,
+for load-testing the relay (/ibkr/stream fan-out) without a real gateway.
+Speaks the subset of the protocol serve_mock.py uses:
+
+    on connect        {"topic": "sts", "args": {"authenticated": true}}
+    smd+<conid>+{..}  subscribe a conid; umd+<conid>+{} unsubscribes
+    hb / tic          heartbeats (accepted and counted)
+    updates           {"conid": .., "topic": "smd+<conid>", "31": .., "84": .., ...}
+                      with partial field sets, and 'C'-prefixed delayed prices
+                      plus "6509": "D" when --delayed is set
+
+It also answers the REST calls /ibkr/connect makes before opening the socket
+(iserver/auth/status and iserver/auth/ssodh/init), on the same port. Standard
+library only; plain ws:// (no TLS).
+
+Usage:
+    python mock_app/ibkr_feed_simulator.py --port 5001 --rate 10 --burst-every 30 --burst-multiplier 50
+    IBKR_BASE_URL=http://127.0.0.1:5001 IBKR_WS_URL=ws://127.0.0.1:5001/v1/api/ws python mock_app/serve_mock.py
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, Optional, Set
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_PATH = "/v1/api/ws"
+AUTH_PATHS = ("/v1/api/iserver/auth/status", "/v1/api/iserver/auth/ssodh/init", "/v1/api/tickle")
+AUTH_STATUS = {"authenticated": True, "connected": True, "competing": False, "message": "simulated"}
+
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+def ws_frame(payload: bytes, opcode: int = OP_TEXT) -> bytes:
+    """Unmasked server-to-client frame"""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return head + payload
+
+
+class FeedConnection:
+    """One connected relay: its subscriptions and a send lock"""
+
+    def __init__(self, sock: socket.socket, address):
+        self.sock = sock
+        self.address = address
+        self.subscriptions: Set[int] = set()
+        self.announced: Set[int] = set()  # conids that already got the 6509 availability field
+        self.lock = threading.Lock()
+        self.open = True
+
+    def send(self, payload: bytes, opcode: int = OP_TEXT) -> bool:
+        try:
+            with self.lock:
+                self.sock.sendall(ws_frame(payload, opcode))
+            return True
+        except OSError:
+            self.open = False
+            return False
+
+    def recv_exact(self, n: int) -> Optional[bytes]:
+        buf = b''
+        while len(buf) < n:
+            chunk = self.sock.recv(n - len(buf))
+            if not chunk:
+                return None
+            buf += chunk
+        return buf
+
+    def recv_message(self):
+        """(opcode, payload) of the next client frame; None once the socket closes"""
+        head = self.recv_exact(2)
+        if head is None:
+            return None
+        opcode, length = head[0] & 0x0F, head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self.recv_exact(2) or b'\0\0')[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self.recv_exact(8) or b'\0' * 8)[0]
+        mask = self.recv_exact(4) if head[1] & 0x80 else None
+        payload = self.recv_exact(length) if length else b''
+        if payload is None:
+            return None
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+
+class FeedSimulator:
+    """Shared random-walk market for every subscribed conid, pushed to every connection"""
+
+    def __init__(self, rate: float = 4.0, volatility: float = 0.0005, delayed: bool = False,
+                 burst_every: float = 0.0, burst_duration: float = 1.0, burst_multiplier: float = 20.0,
+                 prices: Optional[Dict[int, float]] = None, seed: Optional[int] = None):
+        self.rate = rate
+        self.volatility = volatility
+        self.delayed = delayed
+        self.burst_every = burst_every
+        self.burst_duration = burst_duration
+        self.burst_multiplier = burst_multiplier
+        self.rng = random.Random(seed)
+        self.prices: Dict[int, float] = dict(prices or {})
+        self.opens: Dict[int, float] = dict(self.prices)
+        self.volume: Dict[int, int] = {}
+        self.connections: Set[FeedConnection] = set()
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.stats = {"connections": 0, "subscriptions": 0, "heartbeats": 0, "updates": 0, "messages": 0}
+
+    # ── connection side ──
+
+    def attach(self, conn: FeedConnection):
+        with self.lock:
+            self.connections.add(conn)
+            self.stats["connections"] += 1
+        conn.send(json.dumps({"topic": "sts", "args": {"authenticated": True}}).encode())
+
+    def detach(self, conn: FeedConnection):
+        with self.lock:
+            self.connections.discard(conn)
+
+    def on_client_message(self, conn: FeedConnection, text: str):
+        if text in ('hb', 'tic', 'ech+hb'):
+            self.stats["heartbeats"] += 1
+            return
+        kind, _, rest = text.partition('+')
+        conid_text = rest.split('+', 1)[0]
+        if not conid_text.isdigit():
+            return
+        conid = int(conid_text)
+        with self.lock:
+            if kind == 'smd':
+                conn.subscriptions.add(conid)
+                self.stats["subscriptions"] += 1
+                if conid not in self.prices:
+                    self.prices[conid] = self.opens[conid] = round(self.rng.uniform(20, 500), 2)
+                    self.volume[conid] = 0
+            elif kind == 'umd':
+                conn.subscriptions.discard(conid)
+                conn.announced.discard(conid)
+
+    # ── market side ──
+
+    def in_burst(self) -> bool:
+        if not self.burst_every:
+            return False
+        return (time.monotonic() - self.started) % self.burst_every < self.burst_duration
+
+    def make_update(self, conid: int) -> Dict[str, str]:
+        """Advance one conid and build a partial-field update, as the gateway sends them"""
+        price = self.prices[conid] * (1 + self.rng.gauss(0, self.volatility))
+        self.prices[conid] = price
+        spread = max(0.01, round(price * 0.0002, 2))
+        prefix = 'C' if self.delayed else ''
+        update = {"conid": conid, "topic": f"smd+{conid}", "_updated": int(time.time() * 1000)}
+        if self.rng.random() < 0.7:
+            size = self.rng.choice((1, 10, 100, 200, 500))
+            self.volume[conid] = self.volume.get(conid, 0) + size
+            update["31"] = f"{prefix}{price:.2f}"
+            update["7059"] = str(size)
+            update["83"] = f"{price - self.opens[conid]:.2f}"
+        if self.rng.random() < 0.8:
+            update["84"] = f"{price - spread:.2f}"
+            update["86"] = f"{price + spread:.2f}"
+            update["85"] = str(self.rng.randint(1, 20) * 100)
+        if self.rng.random() < 0.1:
+            update["88"] = str(self.volume.get(conid, 0))
+        return update
+
+    def step(self):
+        # Subscriptions change on the connection threads: read them (and claim the
+        # one-time 6509 announcement) under the lock, send outside it
+        with self.lock:
+            conns = [c for c in self.connections if c.open]
+            wanted = set().union(*(c.subscriptions for c in conns)) if conns else set()
+            updates = {conid: self.make_update(conid) for conid in wanted}
+            plans = []
+            for conn in conns:
+                first = conn.subscriptions - conn.announced
+                conn.announced |= first
+                plans.append((conn, list(conn.subscriptions), first))
+        encoded = {conid: json.dumps(u).encode() for conid, u in updates.items()}
+        for conn, conids, first in plans:
+            for conid in conids:
+                if conid in first:
+                    payload = json.dumps(dict(updates[conid], **{"6509": "D" if self.delayed else "RB"})).encode()
+                else:
+                    payload = encoded[conid]
+                if not conn.send(payload):
+                    break
+                self.stats["messages"] += 1
+        self.stats["updates"] += len(updates)
+
+    def run(self):
+        while True:
+            rate = self.rate * (self.burst_multiplier if self.in_burst() else 1)
+            started = time.monotonic()
+            try:
+                self.step()
+            except Exception as e:  # keep feeding the other conids and connections
+                print(f"[FeedSim] Step failed: {e!r}")
+            time.sleep(max(0.0, 1.0 / rate - (time.monotonic() - started)))
+
+
+class FeedRequestHandler(socketserver.BaseRequestHandler):
+    """HTTP on the gateway paths: REST auth stubs, or an upgrade to the market-data WebSocket"""
+
+    simulator: FeedSimulator = None
+
+    def handle(self):
+        sock = self.request
+        head = b''
+        while b'\r\n\r\n' not in head:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            head += chunk
+        head, _, body = head.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        method, path = (lines[0].split(' ') + ['', ''])[:2]
+        path = path.split('?', 1)[0]
+        headers = {k.strip().lower(): v.strip() for k, _, v in (line.partition(':') for line in lines[1:])}
+
+        if path == WS_PATH and headers.get('upgrade', '').lower() == 'websocket':
+            self.serve_websocket(sock, headers)
+            return
+
+        remaining = int(headers.get('content-length', 0) or 0) - len(body)
+        while remaining > 0:
+            chunk = sock.recv(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        if path in AUTH_PATHS:
+            status, payload = "200 OK", json.dumps(AUTH_STATUS).encode()
+        else:
+            status, payload = "404 Not Found", json.dumps({"error": f"not simulated: {method} {path}"}).encode()
+        sock.sendall(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+
+    def serve_websocket(self, sock, headers):
+        accept = base64.b64encode(hashlib.sha1((headers.get('sec-websocket-key', '') + WS_GUID).encode()).digest())
+        sock.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        conn = FeedConnection(sock, self.client_address)
+        print(f"[FeedSim] Relay connected from {self.client_address[0]}:{self.client_address[1]}")
+        self.simulator.attach(conn)
+        try:
+            while conn.open:
+                message = conn.recv_message()
+                if message is None:
+                    break
+                opcode, payload = message
+                if opcode == OP_CLOSE:
+                    conn.send(payload[:2], OP_CLOSE)
+                    break
+                if opcode == OP_PING:
+                    conn.send(payload, OP_PONG)
+                elif opcode == OP_TEXT:
+                    self.simulator.on_client_message(conn, payload.decode('utf-8', 'replace'))
+        except OSError:
+            pass
+        finally:
+            conn.open = False
+            self.simulator.detach(conn)
+            print(f"[FeedSim] Relay disconnected ({len(conn.subscriptions)} subscriptions)")
+
+
+class ThreadingFeedServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_prices(text: str) -> Dict[int, float]:
+    """"265598=190.5,272093=410" -> {265598: 190.5, 272093: 410.0}"""
+    prices = {}
+    for item in filter(None, (text or '').split(',')):
+        conid, _, price = item.partition('=')
+        prices[int(conid)] = float(price)
+    return prices
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local IBKR market-data WebSocket simulator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--rate', type=float, default=4.0, help="updates per second per subscribed conid")
+    parser.add_argument('--volatility', type=float, default=0.0005, help="per-update relative price stddev")
+    parser.add_argument('--delayed', action='store_true', help="send delayed data ('C' prefixes, 6509=D)")
+    parser.add_argument('--burst-every', type=float, default=0.0, help="seconds between bursts (0 = none)")
+    parser.add_argument('--burst-duration', type=float, default=1.0, help="seconds each burst lasts")
+    parser.add_argument('--burst-multiplier', type=float, default=20.0, help="rate multiplier during a burst")
+    parser.add_argument('--prices', default='', help="starting prices, e.g. 265598=190.5,272093=410")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = FeedSimulator(rate=args.rate, volatility=args.volatility, delayed=args.delayed,
+                              burst_every=args.burst_every, burst_duration=args.burst_duration,
+                              burst_multiplier=args.burst_multiplier, prices=parse_prices(args.prices),
+                              seed=args.seed)
+    FeedRequestHandler.simulator = simulator
+    server = ThreadingFeedServer((args.host, args.port), FeedRequestHandler)
+    threading.Thread(target=simulator.run, name='feed-sim', daemon=True).start()
+    threading.Thread(target=server.serve_forever, name='feed-sim-server', daemon=True).start()
+    print(f"[FeedSim] ws://{args.host}:{args.port}{WS_PATH} ({args.rate:g} updates/s per conid"
+          f"{f', bursts x{args.burst_multiplier:g} every {args.burst_every:g}s' if args.burst_every else ''})")
+    try:
+        last = dict(simulator.stats)
+        while True:
+            time.sleep(10)
+            now = dict(simulator.stats)
+            print(f"[FeedSim] {len(simulator.connections)} relay(s), "
+                  f"{(now['messages'] - last['messages']) / 10:.0f} msg/s, {now['updates']:,} updates total")
+            last = now
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
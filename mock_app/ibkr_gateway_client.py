@@ -14,10 +14,334 @@ Usage:
 
 import requests
 from typing import Optional, Dict, List, Any
+import copy
 import time
 import sys
 import json
 import threading
+import functools
+import inspect
+from concurrent.futures import Future
+
+from tool_registry import encode_json, freeze
+
+
+# MCP-compatible tool definitions for the IBKR operations, built and frozen once;
+# IBKR_TOOLS_JSON (below) is their encoded form
+IBKR_TOOLS = freeze([
+    {
+        "name": "get_accounts",
+        "description": "List all available Interactive Brokers trading accounts. Returns account IDs that can be passed to other tools. Call this first if you need to target a specific account.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        },
+        "annotations": {
+            "title": "List Trading Accounts",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": False
+        }
+    },
+    {
+        "name": "get_positions",
+        "description": "Get current portfolio positions from Interactive Brokers. Returns all open positions including symbol, quantity, average cost, market value, unrealized P&L, and asset class. Use this to answer questions about holdings, portfolio composition, or profit/loss.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "account_id": {
+                    "type": "string",
+                    "description": "Optional IBKR account ID. If omitted, uses the first available account."
+                }
+            },
+            "required": []
+        },
+        "annotations": {
+            "title": "Get Portfolio Positions",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": False
+        }
+    },
+    {
+        "name": "get_account_summary",
+        "description": "Get account summary with balance, buying power, margin, net liquidation value, and equity from Interactive Brokers. Use this to answer questions about available funds, account value, or margin usage.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "account_id": {
+                    "type": "string",
+                    "description": "Optional IBKR account ID. If omitted, uses the first available account."
+                }
+            },
+            "required": []
+        },
+        "annotations": {
+            "title": "Get Account Summary",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": False
+        }
+    },
+    {
+        "name": "get_orders",
+        "description": "Get list of current and recent orders from Interactive Brokers. Returns order ID, symbol, side, quantity, order type, status, and fill details. Use this to check order status, pending orders, or recent trade history.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {},
+            "required": []
+        },
+        "annotations": {
+            "title": "Get Orders",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": False
+        }
+    },
+    {
+        "name": "search_contract",
+        "description": "Search for tradeable contracts/instruments by ticker symbol. Returns matching contracts with conid (contract ID), company name, asset class (STK, CASH, OPT, FUT), and exchange. Use this to look up instruments before placing orders or to find contract IDs.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "symbol": {
+                    "type": "string",
+                    "description": "Ticker symbol to search for (e.g., 'AAPL', 'MSFT', 'EUR.USD'). For FX pairs use dot notation."
+                }
+            },
+            "required": ["symbol"]
+        },
+        "annotations": {
+            "title": "Search Contracts",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": True
+        }
+    },
+    {
+        "name": "get_market_data_snapshot",
+        "description": "Get a real-time market data snapshot for one or more contracts. Returns last price, bid, ask, volume, and other fields. Requires contract IDs (conids) — use search_contract first if you only have a ticker symbol.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "conids": {
+                    "type": "array",
+                    "items": {"type": "integer"},
+                    "description": "List of contract IDs (conids) to get market data for. Use search_contract to find conids from ticker symbols."
+                },
+                "fields": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Optional list of field IDs to request (e.g., ['31','84','86'] for last/bid/ask). If omitted, returns default fields."
+                }
+            },
+            "required": ["conids"]
+        },
+        "annotations": {
+            "title": "Get Market Data Snapshot",
+            "readOnlyHint": True,
+            "destructiveHint": False,
+            "openWorldHint": True
+        }
+    },
+    {
+        "name": "place_order",
+        "description": "Place a BUY or SELL order through Interactive Brokers. Supports stocks (STK), forex (CASH), and other instrument types. For limit orders, a limit_price is required. Orders may require confirmation prompts which are auto-accepted. This is a write operation that will affect your account.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "symbol": {
+                    "type": "string",
+                    "description": "Ticker symbol (e.g., 'AAPL', 'TSLA'). For FX pairs use slash notation (e.g., 'EUR/USD')."
+                },
+                "side": {
+                    "type": "string",
+                    "enum": ["BUY", "SELL"],
+                    "description": "Order direction: BUY to go long, SELL to close or go short."
+                },
+                "quantity": {
+                    "type": "integer",
+                    "description": "Number of shares, contracts, or units to trade."
+                },
+                "order_type": {
+                    "type": "string",
+                    "enum": ["MKT", "LMT", "STP", "TRAIL"],
+                    "description": "Order type: MKT (market, fills immediately at best price), LMT (limit, fills at specified price or better), STP (stop), TRAIL (trailing stop)."
+                },
+                "limit_price": {
+                    "type": "number",
+                    "description": "Required for LMT orders. The maximum (BUY) or minimum (SELL) price you are willing to accept."
+                },
+                "aux_price": {
+                    "type": "number",
+                    "description": "Auxiliary price for STP orders (the trigger/stop price)."
+                },
+                "trailing_amt": {
+                    "type": "number",
+                    "description": "Trailing amount for TRAIL orders."
+                },
+                "trailing_type": {
+                    "type": "string",
+                    "enum": ["amt", "pct"],
+                    "description": "Trailing type: 'amt' for fixed dollar amount, 'pct' for percentage."
+                },
+                "all_or_none": {
+                    "type": "boolean",
+                    "description": "If true, the order must fill completely or not at all."
+                },
+                "outside_rth": {
+                    "type": "boolean",
+                    "description": "If true, allows execution outside regular trading hours (pre-market/after-hours)."
+                }
+            },
+            "required": ["symbol", "side", "quantity", "order_type"]
+        },
+        "annotations": {
+            "title": "Place Order",
+            "readOnlyHint": False,
+            "destructiveHint": False,
+            "openWorldHint": True
+        }
+    },
+    {
+        "name": "modify_order",
+        "description": "Modify an existing open order. You can change the quantity, price, order type, or side. Requires the order_id from get_orders and the updated order details. Only works on orders that have not yet been fully filled.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "order_id": {
+                    "type": "string",
+                    "description": "The order ID to modify (from get_orders results)."
+                },
+                "symbol": {
+                    "type": "string",
+                    "description": "Ticker symbol for the order."
+                },
+                "side": {
+                    "type": "string",
+                    "enum": ["BUY", "SELL"],
+                    "description": "Updated order direction."
+                },
+                "quantity": {
+                    "type": "integer",
+                    "description": "Updated number of shares/contracts."
+                },
+                "order_type": {
+                    "type": "string",
+                    "enum": ["MKT", "LMT"],
+                    "description": "Updated order type."
+                },
+                "limit_price": {
+                    "type": "number",
+                    "description": "Updated limit price (required if order_type is LMT)."
+                }
+            },
+            "required": ["order_id", "symbol", "side", "quantity", "order_type"]
+        },
+        "annotations": {
+            "title": "Modify Order",
+            "readOnlyHint": False,
+            "destructiveHint": False,
+            "openWorldHint": False
+        }
+    },
+    {
+        "name": "cancel_order",
+        "description": "Cancel a pending/open order by its order ID. The order must not be fully filled. Get the order_id from the get_orders tool. This action cannot be undone.",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "order_id": {
+                    "type": "string",
+                    "description": "The order ID to cancel (from get_orders results)."
+                }
+            },
+            "required": ["order_id"]
+        },
+        "annotations": {
+            "title": "Cancel Order",
+            "readOnlyHint": False,
+            "destructiveHint": True,
+            "openWorldHint": False
+        }
+    }
+])
+IBKR_TOOLS_JSON = encode_json(IBKR_TOOLS)
+
+
+def _flight_key(value, unordered=False):
+    """
+    Hashable form of a call argument (['1', 2] == [1, 2]). Sequences keep their
+    order unless unordered, for arguments that are sets ([2, 1] == [1, 2]).
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _flight_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        items = (_flight_key(v) for v in value)
+        return tuple(sorted(items, key=repr)) if unordered or isinstance(value, set) else tuple(items)
+    if value is None:
+        return None
+    return str(value).strip()
+
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent callers with the same key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Any, Future] = {}
+        self._stats = {"calls": 0, "shared": 0}
+        self._shared_by_name: Dict[str, int] = {}
+
+    def run(self, key, fn, *args, **kwargs):
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self._stats["shared"] += 1
+                self._shared_by_name[key[0]] = self._shared_by_name.get(key[0], 0) + 1
+        if not leader:
+            # Followers get their own copy: a caller mutating its result must not change another's
+            return copy.deepcopy(future.result())
+        try:
+            result = fn(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls seen, gateway calls saved by sharing, and calls currently in flight"""
+        with self._lock:
+            return {**self._stats, "inFlight": len(self._calls), "sharedByCall": dict(self._shared_by_name)}
+
+
+def single_flight(method=None, *, sets=()):
+    """
+    Coalesce concurrent identical calls of a read-only method onto one gateway request.
+    sets names the arguments whose order does not matter (e.g. conids).
+    """
+    if method is None:
+        return functools.partial(single_flight, sets=sets)
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = tuple((name, _flight_key(value, unordered=name in sets))
+                    for name, value in bound.arguments.items() if name != 'self')
+        return self._flights.run((method.__name__, key), method, self, *args, **kwargs)
+
+    return wrapper
 
 
 class IBKRGatewayClient:
@@ -34,6 +358,8 @@ class IBKRGatewayClient:
         # Cache: key -> (timestamp, data)
         self._cache = {}
         self._cache_lock = threading.Lock()
+        # Concurrent identical read-only calls share one request
+        self._flights = SingleFlight()
 
     def _get_session(self) -> requests.Session:
         """Get or create a per-thread requests.Session"""
@@ -89,6 +415,10 @@ class IBKRGatewayClient:
         with self._cache_lock:
             self._cache[key] = (time.time(), value)
 
+    def single_flight_stats(self) -> Dict[str, Any]:
+        """How many read-only calls were served by sharing an identical in-flight request"""
+        return self._flights.stats()
+
     def invalidate_cache(self, key: str = None):
         """Clear cache entry or all cache"""
         with self._cache_lock:
@@ -129,246 +459,9 @@ class IBKRGatewayClient:
             return {"error": str(e), "authenticated": False}
 
     def list_tools(self) -> List[Dict[str, Any]]:
-        """List available IBKR operations as MCP-compatible tool definitions with rich metadata."""
-        return [
-            {
-                "name": "get_accounts",
-                "description": "List all available Interactive Brokers trading accounts. Returns account IDs that can be passed to other tools. Call this first if you need to target a specific account.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                },
-                "annotations": {
-                    "title": "List Trading Accounts",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": False
-                }
-            },
-            {
-                "name": "get_positions",
-                "description": "Get current portfolio positions from Interactive Brokers. Returns all open positions including symbol, quantity, average cost, market value, unrealized P&L, and asset class. Use this to answer questions about holdings, portfolio composition, or profit/loss.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "account_id": {
-                            "type": "string",
-                            "description": "Optional IBKR account ID. If omitted, uses the first available account."
-                        }
-                    },
-                    "required": []
-                },
-                "annotations": {
-                    "title": "Get Portfolio Positions",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": False
-                }
-            },
-            {
-                "name": "get_account_summary",
-                "description": "Get account summary with balance, buying power, margin, net liquidation value, and equity from Interactive Brokers. Use this to answer questions about available funds, account value, or margin usage.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "account_id": {
-                            "type": "string",
-                            "description": "Optional IBKR account ID. If omitted, uses the first available account."
-                        }
-                    },
-                    "required": []
-                },
-                "annotations": {
-                    "title": "Get Account Summary",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": False
-                }
-            },
-            {
-                "name": "get_orders",
-                "description": "Get list of current and recent orders from Interactive Brokers. Returns order ID, symbol, side, quantity, order type, status, and fill details. Use this to check order status, pending orders, or recent trade history.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {},
-                    "required": []
-                },
-                "annotations": {
-                    "title": "Get Orders",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": False
-                }
-            },
-            {
-                "name": "search_contract",
-                "description": "Search for tradeable contracts/instruments by ticker symbol. Returns matching contracts with conid (contract ID), company name, asset class (STK, CASH, OPT, FUT), and exchange. Use this to look up instruments before placing orders or to find contract IDs.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "symbol": {
-                            "type": "string",
-                            "description": "Ticker symbol to search for (e.g., 'AAPL', 'MSFT', 'EUR.USD'). For FX pairs use dot notation."
-                        }
-                    },
-                    "required": ["symbol"]
-                },
-                "annotations": {
-                    "title": "Search Contracts",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": True
-                }
-            },
-            {
-                "name": "get_market_data_snapshot",
-                "description": "Get a real-time market data snapshot for one or more contracts. Returns last price, bid, ask, volume, and other fields. Requires contract IDs (conids) — use search_contract first if you only have a ticker symbol.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "conids": {
-                            "type": "array",
-                            "items": {"type": "integer"},
-                            "description": "List of contract IDs (conids) to get market data for. Use search_contract to find conids from ticker symbols."
-                        },
-                        "fields": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "Optional list of field IDs to request (e.g., ['31','84','86'] for last/bid/ask). If omitted, returns default fields."
-                        }
-                    },
-                    "required": ["conids"]
-                },
-                "annotations": {
-                    "title": "Get Market Data Snapshot",
-                    "readOnlyHint": True,
-                    "destructiveHint": False,
-                    "openWorldHint": True
-                }
-            },
-            {
-                "name": "place_order",
-                "description": "Place a BUY or SELL order through Interactive Brokers. Supports stocks (STK), forex (CASH), and other instrument types. For limit orders, a limit_price is required. Orders may require confirmation prompts which are auto-accepted. This is a write operation that will affect your account.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "symbol": {
-                            "type": "string",
-                            "description": "Ticker symbol (e.g., 'AAPL', 'TSLA'). For FX pairs use slash notation (e.g., 'EUR/USD')."
-                        },
-                        "side": {
-                            "type": "string",
-                            "enum": ["BUY", "SELL"],
-                            "description": "Order direction: BUY to go long, SELL to close or go short."
-                        },
-                        "quantity": {
-                            "type": "integer",
-                            "description": "Number of shares, contracts, or units to trade."
-                        },
-                        "order_type": {
-                            "type": "string",
-                            "enum": ["MKT", "LMT", "STP", "TRAIL"],
-                            "description": "Order type: MKT (market, fills immediately at best price), LMT (limit, fills at specified price or better), STP (stop), TRAIL (trailing stop)."
-                        },
-                        "limit_price": {
-                            "type": "number",
-                            "description": "Required for LMT orders. The maximum (BUY) or minimum (SELL) price you are willing to accept."
-                        },
-                        "aux_price": {
-                            "type": "number",
-                            "description": "Auxiliary price for STP orders (the trigger/stop price)."
-                        },
-                        "trailing_amt": {
-                            "type": "number",
-                            "description": "Trailing amount for TRAIL orders."
-                        },
-                        "trailing_type": {
-                            "type": "string",
-                            "enum": ["amt", "pct"],
-                            "description": "Trailing type: 'amt' for fixed dollar amount, 'pct' for percentage."
-                        },
-                        "all_or_none": {
-                            "type": "boolean",
-                            "description": "If true, the order must fill completely or not at all."
-                        },
-                        "outside_rth": {
-                            "type": "boolean",
-                            "description": "If true, allows execution outside regular trading hours (pre-market/after-hours)."
-                        }
-                    },
-                    "required": ["symbol", "side", "quantity", "order_type"]
-                },
-                "annotations": {
-                    "title": "Place Order",
-                    "readOnlyHint": False,
-                    "destructiveHint": False,
-                    "openWorldHint": True
-                }
-            },
-            {
-                "name": "modify_order",
-                "description": "Modify an existing open order. You can change the quantity, price, order type, or side. Requires the order_id from get_orders and the updated order details. Only works on orders that have not yet been fully filled.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "order_id": {
-                            "type": "string",
-                            "description": "The order ID to modify (from get_orders results)."
-                        },
-                        "symbol": {
-                            "type": "string",
-                            "description": "Ticker symbol for the order."
-                        },
-                        "side": {
-                            "type": "string",
-                            "enum": ["BUY", "SELL"],
-                            "description": "Updated order direction."
-                        },
-                        "quantity": {
-                            "type": "integer",
-                            "description": "Updated number of shares/contracts."
-                        },
-                        "order_type": {
-                            "type": "string",
-                            "enum": ["MKT", "LMT"],
-                            "description": "Updated order type."
-                        },
-                        "limit_price": {
-                            "type": "number",
-                            "description": "Updated limit price (required if order_type is LMT)."
-                        }
-                    },
-                    "required": ["order_id", "symbol", "side", "quantity", "order_type"]
-                },
-                "annotations": {
-                    "title": "Modify Order",
-                    "readOnlyHint": False,
-                    "destructiveHint": False,
-                    "openWorldHint": False
-                }
-            },
-            {
-                "name": "cancel_order",
-                "description": "Cancel a pending/open order by its order ID. The order must not be fully filled. Get the order_id from the get_orders tool. This action cannot be undone.",
-                "inputSchema": {
-                    "type": "object",
-                    "properties": {
-                        "order_id": {
-                            "type": "string",
-                            "description": "The order ID to cancel (from get_orders results)."
-                        }
-                    },
-                    "required": ["order_id"]
-                },
-                "annotations": {
-                    "title": "Cancel Order",
-                    "readOnlyHint": False,
-                    "destructiveHint": True,
-                    "openWorldHint": False
-                }
-            }
-        ]
+        """List available IBKR operations as MCP-compatible tool definitions with rich metadata.
+        Returns fresh plain dicts; IBKR_TOOLS / IBKR_TOOLS_JSON are the frozen and encoded forms."""
+        return json.loads(IBKR_TOOLS_JSON)
 
     def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
         """Call a tool by name with arguments"""
@@ -414,6 +507,7 @@ class IBKRGatewayClient:
         else:
             return {"error": f"Tool not found: {name}"}
 
+    @single_flight
     def get_accounts(self) -> List[str]:
         """Get list of available trading accounts"""
         cached = self._cache_get('accounts')
@@ -433,6 +527,7 @@ class IBKRGatewayClient:
             print(f"[IBKR Gateway] Error getting accounts: {e}")
             return []
 
+    @single_flight
     def get_positions(self, account_id: Optional[str] = None) -> Dict[str, Any]:
         """Get current portfolio positions (cached 30s)"""
         cache_key = f'positions:{account_id or "default"}'
@@ -458,6 +553,7 @@ class IBKRGatewayClient:
         except Exception as e:
             return {"error": str(e)}
 
+    @single_flight
     def get_account_summary(self, account_id: Optional[str] = None) -> Dict[str, Any]:
         """Get account summary with balance and buying power (cached 30s)"""
         cache_key = f'summary:{account_id or "default"}'
@@ -482,6 +578,7 @@ class IBKRGatewayClient:
         except Exception as e:
             return {"error": str(e)}
 
+    @single_flight
     def get_orders(self) -> Dict[str, Any]:
         """Get list of current orders (cached 30s)"""
         cached = self._cache_get('orders')
@@ -499,6 +596,7 @@ class IBKRGatewayClient:
         except Exception as e:
             return {"error": str(e)}
 
+    @single_flight
     def search_contracts(self, symbol: str) -> List[Dict[str, Any]]:
         """Search for contracts by symbol"""
         try:
@@ -521,6 +619,7 @@ class IBKRGatewayClient:
             print(f"[IBKR Gateway] Search error: {e}")
             return []
 
+    @single_flight
     def search_contract(self, symbol: str) -> Dict[str, Any]:
         """Search for a contract by symbol"""
         try:
@@ -763,6 +862,7 @@ class IBKRGatewayClient:
         except Exception as e:
             return {"error": str(e)}
 
+    @single_flight(sets=('conids',))
     def get_market_data_snapshot(self, conids: List[int], fields: Optional[List[str]] = None) -> Dict[str, Any]:
         """Get market data snapshot for one or more contracts"""
         try:
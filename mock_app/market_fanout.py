@@ -0,0 +1,236 @@
+"""
+Conflating Market-Data Fan-out
+
+Relays market-data updates from the IBKR WebSocket to /ibkr/stream clients.
+Each client has one slot per key (symbol, or a control key such as
+"connected") holding only the latest message; a newer update for a key that
+has not been sent yet replaces it. The client drains all pending keys at
+once, at most max_rate times per second.
+
+A slow consumer therefore receives fresh prices less often instead of a stale
+backlog, memory per client is bounded by the number of keys, and nobody is
+ever disconnected for falling behind.
+
+Clients may declare the symbols they want. An inverted symbol -> clients index
+(plus the set of unfiltered clients) means publish() only touches interested
+clients, so fan-out cost follows actual interest rather than clients x
+symbols. Control messages go to everyone through broadcast().
+
+Messages are opaque to the fan-out; the relay passes ready-to-write SSE frames
+from sse_frame(), encoded once per update and shared by every client, so the
+per-client cost is a dict store and a bytes join.
+
+Usage:
+    fanout = MarketFanout(max_rate=5)
+    client = fanout.add_client(symbols=["AAPL", "MSFT"])   # None = every symbol
+    fanout.publish("AAPL", sse_frame({"type": "marketData", ...}))
+    fanout.broadcast("connected", sse_frame({"type": "connected", "status": True}))
+    batch = client.drain(timeout=5)   # list of frames, [] on timeout, None once closed
+    fanout.set_interest(client.client_id, ["AAPL"])
+    fanout.remove_client(client)
+"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+COUNTERS = ("offered", "conflated", "delivered", "drains")
+
+SSE_KEEPALIVE = b": keepalive\n\n"
+
+
+def sse_frame(message: Any) -> bytes:
+    """A complete SSE data frame for a JSON message"""
+    return b"data: " + json.dumps(message).encode('utf-8') + b"\n\n"
+
+
+class ConflatingClient:
+    """Latest-value-per-key slots for one consumer, drained at a bounded rate"""
+
+    def __init__(self, client_id: int, max_rate: float):
+        self.client_id = client_id
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self._cond = threading.Condition()
+        self._pending: Dict[str, Any] = {}  # key -> latest unsent message, in first-dirty order
+        self._next_drain = 0.0
+        self.symbols: Optional[FrozenSet[str]] = None  # None = every symbol
+        self.closed = False
+        self.connected_at = time.time()
+        self._stats = dict.fromkeys(COUNTERS, 0)
+
+    def offer(self, key: str, message: Any):
+        with self._cond:
+            if self.closed:
+                return
+            self._stats["offered"] += 1
+            if key in self._pending:
+                self._stats["conflated"] += 1
+            self._pending[key] = message
+            self._cond.notify()
+
+    def drain(self, timeout: float) -> Optional[List[Any]]:
+        """
+        Pending messages (one per key), waiting up to timeout for any and for
+        the rate limit. [] if nothing could be sent in time; None once closed.
+        """
+        items = self.drain_items(timeout)
+        return None if items is None else [message for _, message in items]
+
+    def drain_items(self, timeout: float) -> Optional[List[Tuple[str, Any]]]:
+        """drain() as (key, message) pairs, for consumers that re-encode by key"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.closed:
+                now = time.monotonic()
+                if self._pending and now >= self._next_drain:
+                    break
+                if now >= deadline:
+                    return []
+                wake = min(self._next_drain, deadline) if self._pending else deadline
+                self._cond.wait(max(wake - now, 0.001))
+            if self.closed:
+                return None
+            batch = list(self._pending.items())
+            self._pending.clear()
+            self._next_drain = now + self.min_interval
+            self._stats["delivered"] += len(batch)
+            self._stats["drains"] += 1
+            return batch
+
+    def discard(self, keys: Iterable[str]):
+        """Forget unsent messages for keys the client is no longer interested in"""
+        with self._cond:
+            for key in keys:
+                self._pending.pop(key, None)
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+        stats["symbols"] = sorted(self.symbols) if self.symbols is not None else None
+        stats["conflationRatio"] = _ratio(stats)
+        return stats
+
+
+def _ratio(stats: Dict[str, Any]) -> float:
+    return round(stats["conflated"] / stats["offered"], 4) if stats["offered"] else 0.0
+
+
+class MarketFanout:
+    """Set of conflating clients, indexed by the symbols they are interested in"""
+
+    def __init__(self, max_rate: float = 5.0):
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        self._clients: Dict[int, ConflatingClient] = {}
+        self._unfiltered: Set[ConflatingClient] = set()
+        self._interest: Dict[str, Set[ConflatingClient]] = {}  # symbol -> clients that asked for it
+        self._next_id = 0
+        self._retired = dict.fromkeys(COUNTERS, 0)  # counters of disconnected clients
+        self._published = 0
+        self._fanout = 0  # offers made by publish(), i.e. sum of interested clients per update
+
+    def add_client(self, max_rate: Optional[float] = None,
+                   symbols: Optional[Iterable[str]] = None) -> ConflatingClient:
+        """Register a consumer; max_rate may lower (never raise) the default drain rate"""
+        rate = self.max_rate if not max_rate or max_rate <= 0 else min(max_rate, self.max_rate)
+        with self._lock:
+            self._next_id += 1
+            client = ConflatingClient(self._next_id, rate)
+            self._clients[client.client_id] = client
+            self._index(client, symbols)
+        return client
+
+    def get_client(self, client_id: int) -> Optional[ConflatingClient]:
+        return self._clients.get(client_id)
+
+    def set_interest(self, client_id: int, symbols: Optional[Iterable[str]]) -> Optional[ConflatingClient]:
+        """Replace a client's interest set (None = every symbol); None if the client is gone"""
+        with self._lock:
+            client = self._clients.get(client_id)
+            if client is None:
+                return None
+            previous = client.symbols
+            self._unindex(client)
+            self._index(client, symbols)
+        if client.symbols is not None and previous is not None:
+            client.discard(previous - client.symbols)
+        return client
+
+    def remove_client(self, client: ConflatingClient):
+        client.close()
+        stats = client.stats()
+        with self._lock:
+            if self._clients.pop(client.client_id, None) is not None:
+                self._unindex(client)
+                for name in COUNTERS:
+                    self._retired[name] += stats[name]
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def publish(self, key: str, message: Any):
+        """Offer the latest message for a symbol to the clients interested in it"""
+        with self._lock:
+            clients = list(self._unfiltered)
+            clients.extend(self._interest.get(key, ()))
+            self._published += 1
+            self._fanout += len(clients)
+        for client in clients:
+            client.offer(key, message)
+
+    def broadcast(self, key: str, message: Any):
+        """Offer a control message (connection status, errors) to every client"""
+        with self._lock:
+            clients = list(self._clients.values())
+        for client in clients:
+            client.offer(key, message)
+
+    def _index(self, client: ConflatingClient, symbols: Optional[Iterable[str]]):
+        # Caller holds the lock
+        client.symbols = frozenset(symbols) if symbols is not None else None
+        if client.symbols is None:
+            self._unfiltered.add(client)
+            return
+        for symbol in client.symbols:
+            self._interest.setdefault(symbol, set()).add(client)
+
+    def _unindex(self, client: ConflatingClient):
+        # Caller holds the lock
+        self._unfiltered.discard(client)
+        for symbol in client.symbols or ():
+            clients = self._interest.get(symbol)
+            if clients is not None:
+                clients.discard(client)
+                if not clients:
+                    del self._interest[symbol]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = list(self._clients.values())
+            totals = dict(self._retired)
+        per_client = {c.client_id: c.stats() for c in clients}
+        for stats in per_client.values():
+            for name in COUNTERS:
+                totals[name] += stats[name]
+        with self._lock:
+            published, fanout = self._published, self._fanout
+            unfiltered, symbols = len(self._unfiltered), len(self._interest)
+        totals.update({
+            "clients": len(per_client),
+            "unfilteredClients": unfiltered,
+            "indexedSymbols": symbols,
+            "published": published,
+            "avgFanout": round(fanout / published, 2) if published else 0.0,
+            "maxRate": self.max_rate,
+            "conflationRatio": _ratio(totals),
+            "perClient": per_client,
+        })
+        return totals
@@ -0,0 +1,267 @@
+"""
+Market-Data Ingest Process
+
+Runs the IBKR WebSocket client outside the web process, so receiving and
+parsing ticks does not compete with HTTP handlers for the web process's GIL.
+Quotes are written into a SharedQuoteTable created by the web process, and
+updates are signalled over a localhost UDP socket:
+
+    b"T" <d sent time> then <qB> per updated conid (flags: 1 last, 2 lastSize)
+    b"S" <B state>     0 closed, 1 open, 2 sts received (ready to subscribe)
+    b"E" <utf-8 text>  error
+
+The web process (IngestProcess, below) starts this script, reads the table in
+place when signalled and runs the usual publishing (fan-out, bars, MCP
+resources). It sends raw WebSocket commands (smd+..., umd+...) to this process
+as lines on stdin, and polled snapshot quotes as "#quotes <json>" lines so this
+process stays the table's only writer. Within this process the WebSocket and
+stdin threads both write, so every table update goes through one QuoteWriter
+lock. Closing stdin stops the process once no update is in progress.
+
+Usage (done by serve_mock when IBKR_INGEST_PROCESS=1):
+    ingest = IngestProcess(table.name, on_ticks, on_status)
+    ingest.start(ws_url, cookies)
+    ingest.send('smd+265598+{"fields":["31"]}')
+"""
+
+import argparse
+import json
+import os
+import socket
+import ssl
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from shared_quotes import SharedQuoteTable, TableFull
+
+TICK = struct.Struct('<qB')
+SENT = struct.Struct('<d')
+FLAG_LAST = 1
+FLAG_SIZE = 2
+STATE_CLOSED, STATE_OPEN, STATE_READY = 0, 1, 2
+MAX_DATAGRAM = 60000
+RECONNECT_DELAY = 5
+STOP_TIMEOUT = 5  # seconds to wait for a clean exit after closing stdin
+HEARTBEAT_INTERVAL = 10
+QUOTES_COMMAND = '#quotes '
+
+
+def tick_datagrams(updates: List[Tuple[int, int]], sent: float) -> List[bytes]:
+    """b"T" datagrams for (conid, flags) pairs, split to stay under MAX_DATAGRAM"""
+    per = (MAX_DATAGRAM - 1 - SENT.size) // TICK.size
+    return [b"T" + SENT.pack(sent) + b"".join(TICK.pack(c, f) for c, f in updates[i:i + per])
+            for i in range(0, len(updates), per)]
+
+
+def parse_datagram(data: bytes):
+    """(kind, payload): ("T", (sent, [(conid, flags), ...])), ("S", state) or ("E", text)"""
+    kind = data[:1]
+    if kind == b"T":
+        sent = SENT.unpack_from(data, 1)[0]
+        return "T", (sent, list(TICK.iter_unpack(data[1 + SENT.size:])))
+    if kind == b"S":
+        return "S", data[1]
+    return "E", data[1:].decode('utf-8', errors='replace')
+
+
+# ─── Ingest process side ───
+
+class QuoteWriter:
+    """Serializes table updates from the ingest process's threads (the table allows one writer)"""
+
+    def __init__(self, table: SharedQuoteTable):
+        self.table = table
+        self.lock = threading.Lock()
+
+    def apply(self, items: list) -> Tuple[List[Tuple[int, int]], List[str]]:
+        """Write IBKR items; returns ((conid, flags) updates, errors)"""
+        updates, errors = [], []
+        with self.lock:
+            for item in items:
+                if not isinstance(item, dict) or not item.get('conid'):
+                    continue
+                try:
+                    self.table.update(item['conid'], item)
+                except TableFull as e:
+                    errors.append(str(e))
+                    continue
+                updates.append((item['conid'], (FLAG_LAST if '31' in item else 0) | (FLAG_SIZE if '7059' in item else 0)))
+        return updates, errors
+
+
+def run_ingest(shm_name: str, notify_port: int, ws_url: str, cookies: Optional[str]):
+    import websocket
+
+    writer = QuoteWriter(SharedQuoteTable(name=shm_name))
+    notify = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    target = ('127.0.0.1', notify_port)
+    state = {"ws": None, "connected": False}
+
+    def signal(datagram: bytes):
+        try:
+            notify.sendto(datagram, target)
+        except OSError:
+            pass
+
+    def on_message(ws, message):
+        try:
+            data = json.loads(message)
+        except ValueError:
+            return  # heartbeat replies and other non-JSON frames
+        if isinstance(data, dict) and data.get('topic') == 'sts':
+            signal(b"S" + bytes([STATE_READY]))
+            return
+        updates, errors = writer.apply(data if isinstance(data, list) else [data])
+        for error in errors:
+            signal(b"E" + error.encode('utf-8'))
+        for datagram in tick_datagrams(updates, time.time()):
+            signal(datagram)
+
+    def on_open(ws):
+        state["connected"] = True
+        signal(b"S" + bytes([STATE_OPEN]))
+
+    def on_close(ws, code, msg):
+        state["connected"] = False
+        signal(b"S" + bytes([STATE_CLOSED]))
+
+    def on_error(ws, error):
+        signal(b"E" + str(error).encode('utf-8', errors='replace'))
+
+    def read_commands():
+        # Commands from the web process; EOF means it went away
+        for line in sys.stdin:
+            line = line.strip()
+            if line.startswith(QUOTES_COMMAND):
+                on_message(None, line[len(QUOTES_COMMAND):])
+            elif line and state["ws"] is not None and state["connected"]:
+                try:
+                    state["ws"].send(line)
+                except Exception as e:
+                    signal(b"E" + f"send failed: {e}".encode('utf-8'))
+        with writer.lock:  # never exit halfway through a row update
+            os._exit(0)
+
+    def heartbeat():
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if state["ws"] is not None and state["connected"]:
+                try:
+                    state["ws"].send("hb")
+                except Exception:
+                    pass
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    threading.Thread(target=heartbeat, daemon=True).start()
+    while True:
+        state["ws"] = websocket.WebSocketApp(ws_url, on_message=on_message, on_open=on_open,
+                                             on_close=on_close, on_error=on_error, cookie=cookies or None)
+        state["ws"].run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+        time.sleep(RECONNECT_DELAY)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IBKR market-data ingest process (started by serve_mock)")
+    parser.add_argument('--shm', required=True, help="SharedQuoteTable name")
+    parser.add_argument('--notify-port', type=int, required=True, help="localhost UDP port for update signals")
+    parser.add_argument('--ws-url', required=True)
+    args = parser.parse_args()
+    # Cookies come through the environment rather than the (world-readable) command line
+    run_ingest(args.shm, args.notify_port, args.ws_url, os.environ.get('IBKR_INGEST_COOKIES'))
+
+
+# ─── Web process side ───
+
+class IngestProcess:
+    """Starts and talks to the ingest process; ticks and status arrive on a listener thread"""
+
+    def __init__(self, shm_name: str, on_ticks: Callable[[float, List[Tuple[int, int]]], None],
+                 on_status: Callable[[int], None], on_error: Callable[[str], None] = lambda text: None):
+        self.shm_name = shm_name
+        self.on_ticks = on_ticks
+        self.on_status = on_status
+        self.on_error = on_error
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self._sock.bind(('127.0.0.1', 0))
+        self.port = self._sock.getsockname()[1]
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._stats = {"datagrams": 0, "ticks": 0, "errors": 0, "restarts": 0}
+        threading.Thread(target=self._listen, name='ingest-listener', daemon=True).start()
+
+    def start(self, ws_url: str, cookies: Optional[str]):
+        """(Re)start the process with fresh gateway cookies"""
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                self._shutdown()
+                self._stats["restarts"] += 1
+            env = dict(os.environ, IBKR_INGEST_COOKIES=cookies or '')
+            self._proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--shm', self.shm_name,
+                 '--notify-port', str(self.port), '--ws-url', ws_url],
+                stdin=subprocess.PIPE, env=env, text=True, bufsize=1)
+
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def send(self, command: str):
+        """Forward a raw WebSocket command (same call as on the websocket-client object)"""
+        with self._lock:
+            if not self.alive():
+                raise ConnectionError("Ingest process is not running")
+            self._proc.stdin.write(command.replace('\n', ' ') + '\n')
+
+    def write(self, items: list):
+        """Have the ingest process write quotes (e.g. polled snapshots) into the table"""
+        self.send(QUOTES_COMMAND + json.dumps(items))
+
+    def stop(self):
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                self._shutdown()
+
+    def _shutdown(self):
+        # Caller holds the lock. Closing stdin lets the process exit between table
+        # updates; terminate() could stop it halfway through one.
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+    def _listen(self):
+        while True:
+            data, _ = self._sock.recvfrom(65536)
+            self._stats["datagrams"] += 1
+            try:
+                kind, payload = parse_datagram(data)
+                if kind == "T":
+                    self._stats["ticks"] += len(payload[1])
+                    self.on_ticks(*payload)
+                elif kind == "S":
+                    self.on_status(payload)
+                else:
+                    self._stats["errors"] += 1
+                    self.on_error(payload)
+            except Exception as e:
+                self._stats["errors"] += 1
+                self.on_error(f"listener: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        stats = dict(self._stats)
+        stats.update({"pid": self._proc.pid if self._proc is not None else None, "alive": self.alive(),
+                      "notifyPort": self.port})
+        return stats
+
+
+if __name__ == '__main__':
+    main()
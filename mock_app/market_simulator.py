@@ -0,0 +1,98 @@
+"""
+Vectorized Price Simulator
+
+Server-side market for instruments without live IBKR data, so every browser
+sees the same simulated prices and none of them burns CPU on its own random
+walk. All instruments advance together in one NumPy step of geometric
+Brownian motion with per-symbol volatility and spread:
+
+    last *= exp(-sigma^2 dt / 2 + sigma sqrt(dt) Z),   Z ~ N(0, 1)
+    bid, ask = last * (1 -/+ spread / 2)
+    chg = % change from the reference (previous close) price
+
+Symbols that start receiving live data are switched off with set_live();
+when the live feed drops, resume() simulates them again, continuing from
+their last live prices.
+
+Usage:
+    sim = PriceSimulator({"AAPL": {"price": 189.45, "reference": 187.13, "volatility": 0.0002,
+                                   "spread": 0.0005, "decimals": 2}})
+    for quote in sim.step(dt=1.0): ...   # {"symbol", "last", "bid", "ask", "chg"} per simulated symbol
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+class PriceSimulator:
+    """GBM over a fixed instrument universe, stepped as whole arrays"""
+
+    def __init__(self, instruments: Dict[str, Dict[str, float]], seed: Optional[int] = None):
+        self.symbols = list(instruments)
+        self._index = {s: i for i, s in enumerate(self.symbols)}
+        spec = [instruments[s] for s in self.symbols]
+        self._last = np.array([i["price"] for i in spec], dtype=np.float64)
+        self._reference = np.array([i.get("reference", i["price"]) for i in spec], dtype=np.float64)
+        self._sigma = np.array([i["volatility"] for i in spec], dtype=np.float64)
+        self._half_spread = np.array([i["spread"] / 2 for i in spec], dtype=np.float64)
+        self._decimals = [int(i.get("decimals", 2)) for i in spec]
+        self._active = np.ones(len(spec), dtype=bool)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.steps = 0
+
+    def set_live(self, symbol: str) -> bool:
+        """Stop simulating a symbol that now has real market data; True if it was simulated"""
+        i = self._index.get(symbol)
+        if i is None:
+            return False
+        with self._lock:
+            if not self._active[i]:
+                return False
+            self._active[i] = False
+        return True
+
+    def resume(self, prices: Dict[str, float]) -> List[str]:
+        """Simulate live symbols again, starting from the given last prices; returns those resumed"""
+        resumed = []
+        with self._lock:
+            for symbol, price in prices.items():
+                i = self._index.get(symbol)
+                if i is None or self._active[i]:
+                    continue
+                if price:
+                    self._last[i] = price
+                self._active[i] = True
+                resumed.append(symbol)
+        return resumed
+
+    def is_simulated(self, symbol: str) -> bool:
+        i = self._index.get(symbol)
+        return i is not None and bool(self._active[i])
+
+    def step(self, dt: float = 1.0) -> List[Dict[str, Any]]:
+        """Advance every instrument by dt seconds; quotes for the ones still simulated"""
+        with self._lock:
+            z = self._rng.standard_normal(self._last.shape[0])
+            self._last *= np.exp(-0.5 * self._sigma ** 2 * dt + self._sigma * np.sqrt(dt) * z)
+            bid = self._last * (1 - self._half_spread)
+            ask = self._last * (1 + self._half_spread)
+            chg = (self._last - self._reference) / self._reference * 100
+            active = np.flatnonzero(self._active)
+            last, bid, ask, chg = (a[active].tolist() for a in (self._last, bid, ask, chg))
+            self.steps += 1
+        quotes = []
+        for k, i in enumerate(active.tolist()):
+            d = self._decimals[i]
+            quotes.append({"symbol": self.symbols[i], "last": round(last[k], d), "bid": round(bid[k], d),
+                           "ask": round(ask[k], d), "chg": round(chg[k], 2)})
+        return quotes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "instruments": len(self.symbols),
+            "simulated": [s for s in self.symbols if self.is_simulated(s)],
+            "steps": self.steps,
+        }
@@ -0,0 +1,187 @@
+"""
+Binary Delta Wire Format for Market Data
+
+Compact alternative to the JSON SSE frames of /ibkr/stream, used by the
+/ibkr/ws WebSocket. Every JSON frame repeats each key; here a client gets a
+symbol dictionary once (JSON text frame) and then binary frames carrying only
+the fields that changed since the last state sent to that client, as integer
+deltas. Several symbols are batched per frame.
+
+Text frame (JSON), sent before the first binary frame that uses a new id:
+    {"type": "symbols", "symbols": {"0": "AAPL", "1": "EUR/USD"}}
+
+Binary frame:
+    byte     0x01 (FRAME_DELTAS)
+    varint   number of entries
+    entry    varint symbol id, byte mask, then
+             [flags byte]   if mask bit 7: bit 0 isDelayed, bit 1 isSimulated
+             [nulls byte]   if mask bit 6: bit i = FIELDS[i] is now null
+             zigzag varint  for each FIELDS[i] with mask bit i set: change of
+                            round(value * PRICE_SCALE) against the last value
+                            sent (0 if never sent or null)
+
+A client that starts from all fields null and applies every frame in order
+holds exactly the server's quotes (to 1 / PRICE_SCALE).
+
+Usage:
+    encoder = DeltaEncoder()
+    symbols, frame = encoder.encode([{"symbol": "AAPL", "last": 190.5, ...}])
+    decoder = DeltaDecoder()
+    decoder.add_symbols(symbols)
+    decoder.decode(frame)   # [{"symbol": "AAPL", "last": 190.5, ...}]
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+FIELDS = ('last', 'bid', 'ask', 'chg')
+FLAGS = ('isDelayed', 'isSimulated')
+PRICE_SCALE = 10 ** 6
+FRAME_DELTAS = 0x01
+MASK_NULLS = 0x40
+MASK_FLAGS = 0x80
+
+
+def _write_varint(out: bytearray, n: int):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+def _flags(quote: Dict[str, Any]) -> int:
+    return sum(1 << i for i, name in enumerate(FLAGS) if quote.get(name))
+
+
+class DeltaEncoder:
+    """Symbol dictionary and last-sent state for one client"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._state: Dict[int, list] = {}  # id -> [scaled value or None per field] + [flags]
+        self.ticks = 0
+        self.frames = 0
+        self.bytes = 0
+
+    def encode(self, quotes: Iterable[Dict[str, Any]]) -> Tuple[Dict[str, str], Optional[bytes]]:
+        """
+        (new dictionary entries, binary frame) for a batch of quotes; the
+        frame is None when nothing changed. Send the entries first.
+        """
+        new_symbols = {}
+        entries = bytearray()
+        count = 0
+        for quote in quotes:
+            symbol = quote['symbol']
+            sid = self._ids.get(symbol)
+            if sid is None:
+                sid = self._ids[symbol] = len(self._ids)
+                self._state[sid] = [None] * len(FIELDS) + [0]
+                new_symbols[str(sid)] = symbol
+            state = self._state[sid]
+            mask = nulls = 0
+            deltas = []
+            for i, name in enumerate(FIELDS):
+                value = quote.get(name)
+                scaled = None if value is None else round(value * PRICE_SCALE)
+                if scaled == state[i]:
+                    continue
+                if scaled is None:
+                    nulls |= 1 << i
+                else:
+                    mask |= 1 << i
+                    deltas.append(scaled - (state[i] or 0))
+                state[i] = scaled
+            flags = _flags(quote)
+            if flags != state[-1]:
+                mask |= MASK_FLAGS
+                state[-1] = flags
+            if nulls:
+                mask |= MASK_NULLS
+            if not mask:
+                continue
+            _write_varint(entries, sid)
+            entries.append(mask)
+            if mask & MASK_FLAGS:
+                entries.append(flags)
+            if nulls:
+                entries.append(nulls)
+            for delta in deltas:
+                _write_varint(entries, _zigzag(delta))
+            count += 1
+        if not count:
+            return new_symbols, None
+        frame = bytearray([FRAME_DELTAS])
+        _write_varint(frame, count)
+        frame += entries
+        self.ticks += count
+        self.frames += 1
+        self.bytes += len(frame)
+        return new_symbols, bytes(frame)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"symbols": len(self._ids), "ticks": self.ticks, "frames": self.frames, "bytes": self.bytes,
+                "bytesPerTick": round(self.bytes / self.ticks, 2) if self.ticks else 0.0}
+
+
+class DeltaDecoder:
+    """Client side of the format: rebuilds full quotes from dictionary and delta frames"""
+
+    def __init__(self):
+        self._symbols: Dict[int, str] = {}
+        self._state: Dict[int, list] = {}
+
+    def add_symbols(self, symbols: Dict[str, str]):
+        for sid, symbol in symbols.items():
+            self._symbols[int(sid)] = symbol
+            self._state[int(sid)] = [None] * len(FIELDS) + [0]
+
+    def decode(self, frame: bytes) -> List[Dict[str, Any]]:
+        """Full current quotes for the symbols a frame touched"""
+        if frame[0] != FRAME_DELTAS:
+            raise ValueError(f"Unknown frame type: {frame[0]}")
+        count, pos = _read_varint(frame, 1)
+        quotes = []
+        for _ in range(count):
+            sid, pos = _read_varint(frame, pos)
+            state = self._state[sid]
+            mask = frame[pos]
+            pos += 1
+            if mask & MASK_FLAGS:
+                state[-1] = frame[pos]
+                pos += 1
+            if mask & MASK_NULLS:
+                nulls = frame[pos]
+                pos += 1
+                for i in range(len(FIELDS)):
+                    if nulls & (1 << i):
+                        state[i] = None
+            for i in range(len(FIELDS)):
+                if mask & (1 << i):
+                    delta, pos = _read_varint(frame, pos)
+                    state[i] = (state[i] or 0) + _unzigzag(delta)
+            quote = {'symbol': self._symbols[sid]}
+            for i, name in enumerate(FIELDS):
+                quote[name] = None if state[i] is None else state[i] / PRICE_SCALE
+            for i, name in enumerate(FLAGS):
+                quote[name] = bool(state[-1] & (1 << i))
+            quotes.append(quote)
+        return quotes
@@ -0,0 +1,240 @@
+"""
+Bounded MCP Session Queues
+
+Outbound message queue for one MCP session (SSE or Streamable HTTP). Messages
+are serialized once on put(), directly into a ready-to-write SSE frame with
+an event id of "<session_id>:<seq>", so the queue can account for its size
+in bytes and the SSE writer does not re-encode them.
+
+When a consumer stalls, the queue stays within its limits according to a policy:
+    drop_oldest_notifications  evict the oldest notifications to make room;
+                               responses are never dropped, and if they alone
+                               exceed the limits the session is disconnected
+    disconnect                 close the session on the first overflow
+
+Resumption: delivered frames are kept in a small ring buffer (count + TTL).
+A reconnecting client sends the last id it saw (Last-Event-ID); attach()
+makes the new connection the queue's only consumer, and replay_after()
+returns the frames the old connection may have lost. Undelivered frames stay
+queued and simply flow to the new consumer.
+
+A closed queue returns None from get(), which ends the session's SSE stream.
+
+Usage:
+    q = SessionQueue("abc", max_messages=256, max_bytes=8 * 1024 * 1024)
+    q.put({"jsonrpc": "2.0", "id": 1, "result": {}})
+    owner = q.attach()
+    frame = q.get(timeout=5, owner=owner)   # SSE frame, '' on timeout, None once closed/superseded
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+POLICY_DROP_OLDEST_NOTIFICATIONS = 'drop_oldest_notifications'
+POLICY_DISCONNECT = 'disconnect'
+POLICIES = (POLICY_DROP_OLDEST_NOTIFICATIONS, POLICY_DISCONNECT)
+
+
+def is_notification(message: Any) -> bool:
+    """JSON-RPC notifications carry a method and no id; responses (and batches) do not"""
+    return isinstance(message, dict) and 'method' in message and message.get('id') is None
+
+
+def encode_message(message: Any) -> str:
+    """JSON text of a message or batch; a str is taken as already-encoded JSON (pre-serialized results)"""
+    if isinstance(message, str):
+        return message
+    if isinstance(message, list):
+        return "[" + ",".join(encode_message(m) for m in message) + "]"
+    return json.dumps(message)
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[Optional[str], int]:
+    """Split a "<session_id>:<seq>" event id; (None, 0) if it is missing or malformed"""
+    session_id, _, seq = (event_id or '').rpartition(':')
+    if not session_id or not seq.isdigit():
+        return None, 0
+    return session_id, int(seq)
+
+
+class SessionQueue:
+    """Byte- and length-bounded FIFO of SSE frames, with a replay buffer for resumption"""
+
+    def __init__(self, session_id: str, max_messages: int = 256, max_bytes: int = 8 * 1024 * 1024,
+                 policy: str = POLICY_DROP_OLDEST_NOTIFICATIONS, replay_size: int = 64,
+                 replay_ttl: float = 60.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow-consumer policy: {policy}")
+        self.session_id = session_id
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.replay_ttl = replay_ttl
+        self._cond = threading.Condition()
+        self._items = deque()  # (seq, frame, size, is_notification)
+        self._bytes = 0
+        self._seq = 0
+        self._delivered_seq = 0
+        self._replay = deque(maxlen=replay_size)  # (seq, delivered_at, frame)
+        self._evicted_seq = 0  # newest delivered frame no longer in the replay buffer
+        self._owner = 0
+        self.attached = False
+        self.detached_at = None
+        self.closed = False
+        self.close_reason = None
+        self.created = time.time()
+        self.last_active = time.monotonic()
+        self._stats = {
+            "enqueued": 0,
+            "delivered": 0,
+            "replayed": 0,
+            "droppedNotifications": 0,
+            "rejectedClosed": 0,
+            "highWaterMessages": 0,
+            "highWaterBytes": 0,
+        }
+
+    def put(self, message: Any) -> bool:
+        """Serialize and enqueue a message. Returns False if the session is (or becomes) closed."""
+        payload = encode_message(message)
+        notification = is_notification(message)
+        with self._cond:
+            if self.closed:
+                self._stats["rejectedClosed"] += 1
+                return False
+            self._seq += 1
+            frame = f"id: {self.session_id}:{self._seq}\nevent: message\ndata: {payload}\n\n"
+            size = len(frame)
+            if not self._fits(size) and not self._make_room(size):
+                self._close("slow_consumer")
+                return False
+            self._items.append((self._seq, frame, size, notification))
+            self._bytes += size
+            self._stats["enqueued"] += 1
+            self._stats["highWaterMessages"] = max(self._stats["highWaterMessages"], len(self._items))
+            self._stats["highWaterBytes"] = max(self._stats["highWaterBytes"], self._bytes)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout: Optional[float] = None, owner: Optional[int] = None) -> Optional[str]:
+        """
+        Next SSE frame; '' if none arrived within timeout. None once the queue is
+        closed, or once another connection has attached in place of owner.
+        """
+        with self._cond:
+            self.last_active = time.monotonic()
+            if not self._items and not self.closed and (owner is None or owner == self._owner):
+                self._cond.wait(timeout)
+            if self.closed or (owner is not None and owner != self._owner):
+                return None
+            if not self._items:
+                return ''
+            seq, frame, size, _ = self._items.popleft()
+            self._bytes -= size
+            self._delivered_seq = seq
+            if len(self._replay) == self._replay.maxlen:
+                self._evicted_seq = self._replay[0][0]
+            self._replay.append((seq, time.monotonic(), frame))
+            self._stats["delivered"] += 1
+            return frame
+
+    def attach(self) -> int:
+        """Make the calling connection the only consumer; returns its owner token"""
+        with self._cond:
+            self._owner += 1
+            self.attached = True
+            self.detached_at = None
+            self.last_active = time.monotonic()
+            self._cond.notify_all()  # wake a superseded consumer so it exits
+            return self._owner
+
+    def detach(self, owner: int):
+        """The consumer's connection dropped; the session waits for a resume"""
+        with self._cond:
+            if owner == self._owner and not self.closed:
+                self.attached = False
+                self.detached_at = time.monotonic()
+
+    def detached_for(self) -> float:
+        detached_at = self.detached_at
+        return time.monotonic() - detached_at if detached_at is not None else 0.0
+
+    def replay_after(self, seq: int) -> Optional[List[str]]:
+        """
+        Delivered frames newer than seq, oldest first. None if some of them have
+        already left the buffer (evicted or older than the TTL), i.e. a gap.
+        """
+        with self._cond:
+            if seq >= self._delivered_seq:
+                return []
+            if self._evicted_seq > seq:
+                return None
+            cutoff = time.monotonic() - self.replay_ttl
+            frames = []
+            for s, at, frame in self._replay:
+                if s > seq:
+                    if at < cutoff:
+                        return None
+                    frames.append(frame)
+            self._stats["replayed"] += len(frames)
+            return frames
+
+    def touch(self):
+        """Record client activity that does not drain the queue (e.g. an incoming POST)"""
+        self.last_active = time.monotonic()
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_active
+
+    def close(self, reason: str = 'closed'):
+        with self._cond:
+            self._close(reason)
+
+    def _close(self, reason: str):
+        if not self.closed:
+            self.closed = True
+            self.close_reason = reason
+            self._items.clear()
+            self._replay.clear()
+            self._bytes = 0
+            self._cond.notify_all()
+
+    def _fits(self, size: int) -> bool:
+        return len(self._items) < self.max_messages and self._bytes + size <= self.max_bytes
+
+    def _make_room(self, size: int) -> bool:
+        # Caller holds the lock
+        if self.policy != POLICY_DROP_OLDEST_NOTIFICATIONS:
+            return False
+        # Oldest first: drop notifications until the new message fits, keep every response
+        count = len(self._items)
+        kept = deque()
+        for item in self._items:
+            over = count >= self.max_messages or self._bytes + size > self.max_bytes
+            if over and item[3]:
+                count -= 1
+                self._bytes -= item[2]
+                self._stats["droppedNotifications"] += 1
+            else:
+                kept.append(item)
+        self._items = kept
+        return self._fits(size)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "depth": len(self._items),
+                "bytes": self._bytes,
+                "lastSeq": self._seq,
+                "replayBuffered": len(self._replay),
+                "policy": self.policy,
+                "attached": self.attached,
+                "closed": self.closed,
+                "closeReason": self.close_reason,
+                "idleSeconds": round(self.idle_for(), 1),
+            })
+        return stats
@@ -0,0 +1,154 @@
+"""
+Array-backed Quote Table
+
+Latest market data per instrument, stored in flat preallocated float64
+columns (array('d')) with a conid -> row index instead of a growing dict of
+raw string fields per conid. Each update parses only the fields it carries,
+writes them in place and bumps the row's sequence number and timestamp, so
+memory and per-tick CPU stay flat as the instrument universe grows.
+
+Missing values are NaN internally and None in quote() output.
+
+Usage:
+    store = QuoteStore()
+    store.update(265598, {"31": "C190.5", "84": "190.4", "6509": "DPB"})
+    store.quote(265598)  # {"last": 190.5, "bid": 190.4, ..., "isDelayed": True, "seq": 1, "updated": ...}
+"""
+
+import math
+import threading
+import time
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+# IBKR snapshot field id -> column
+FIELD_COLUMNS = {
+    '31': 'last',
+    '84': 'bid',
+    '85': 'askSize',
+    '86': 'ask',
+    '88': 'volume',
+    '83': 'chg',
+    '7059': 'lastSize',
+}
+COLUMNS = tuple(FIELD_COLUMNS.values())
+COLUMN_INDEX = {name: i for i, name in enumerate(COLUMNS)}
+_FIELD_INDEX = {field: COLUMN_INDEX[name] for field, name in FIELD_COLUMNS.items()}
+AVAILABILITY_FIELD = '6509'  # 'R' real-time, 'D' delayed, 'Z' frozen
+NAN = float('nan')
+
+
+def parse_price(value: Any) -> float:
+    """
+    Numeric value of an IBKR field; NaN if there is none. Plain numbers take
+    the float() fast path; prefixed or formatted values (e.g. 'C270.01' for
+    delayed prices, '1,234') fall back to keeping digits, '.', '-' and 'e'.
+    """
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    s = str(value)
+    cleaned = ''.join(c for i, c in enumerate(s) if c.isdigit() or c == '.' or c == '-' or (i > 0 and c == 'e'))
+    try:
+        return float(cleaned) if cleaned else NAN
+    except ValueError:
+        return NAN
+
+
+class QuoteStore:
+    """conid-indexed rows of float64 columns plus per-row seq, timestamp and delayed flag"""
+
+    def __init__(self, capacity: int = 64):
+        self._lock = threading.Lock()
+        self._rows: Dict[int, int] = {}  # conid -> row
+        self._conids: List[int] = []     # row -> conid
+        self._capacity = 0
+        self._values = array('d')
+        self._seq = array('Q')
+        self._updated = array('d')
+        self._delayed = array('b')
+        self._grow(capacity)
+
+    def _grow(self, capacity: int):
+        # Caller holds the lock (or is __init__)
+        extra = capacity - self._capacity
+        self._values.extend([NAN] * (extra * len(COLUMNS)))
+        self._seq.extend([0] * extra)
+        self._updated.extend([0.0] * extra)
+        self._delayed.extend([0] * extra)
+        self._capacity = capacity
+
+    def _row_for(self, conid: int) -> int:
+        # Caller holds the lock
+        row = self._rows.get(conid)
+        if row is None:
+            row = len(self._conids)
+            if row == self._capacity:
+                self._grow(self._capacity * 2)
+            self._rows[conid] = row
+            self._conids.append(conid)
+        return row
+
+    def update(self, conid: int, fields: Dict[str, Any]) -> int:
+        """Apply a (partial) IBKR update in place; returns the row's new sequence number"""
+        with self._lock:
+            row = self._row_for(conid)
+            base = row * len(COLUMNS)
+            values = self._values
+            for field, value in fields.items():
+                col = _FIELD_INDEX.get(field)
+                if col is not None:
+                    values[base + col] = parse_price(value)
+                elif field == AVAILABILITY_FIELD:
+                    self._delayed[row] = 'D' in str(value)
+            self._seq[row] += 1
+            self._updated[row] = time.time()
+            return self._seq[row]
+
+    def __contains__(self, conid: int) -> bool:
+        return conid in self._rows
+
+    def __len__(self) -> int:
+        return len(self._conids)
+
+    def conids(self) -> List[int]:
+        with self._lock:
+            return list(self._conids)
+
+    def get(self, conid: int, column: str) -> Optional[float]:
+        """One column of one instrument; None if unknown or not yet received"""
+        with self._lock:
+            row = self._rows.get(conid)
+            if row is None:
+                return None
+            value = self._values[row * len(COLUMNS) + COLUMN_INDEX[column]]
+        return None if math.isnan(value) else value
+
+    def quote(self, conid: int, columns: Iterable[str] = COLUMNS) -> Optional[Dict[str, Any]]:
+        """Selected columns plus isDelayed/seq/updated for one instrument; None if unknown"""
+        with self._lock:
+            row = self._rows.get(conid)
+            if row is None:
+                return None
+            base = row * len(COLUMNS)
+            quote = {}
+            for name in columns:
+                value = self._values[base + COLUMN_INDEX[name]]
+                quote[name] = None if math.isnan(value) else value
+            quote.update({
+                'isDelayed': bool(self._delayed[row]),
+                'seq': self._seq[row],
+                'updated': self._updated[row],
+            })
+        return quote
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = len(self._conids)
+            nbytes = sum(a.itemsize * len(a) for a in (self._values, self._seq, self._updated, self._delayed))
+            updates = sum(self._seq[:rows])
+        return {"rows": rows, "capacity": self._capacity, "columns": list(COLUMNS),
+                "bytes": nbytes, "updates": updates}
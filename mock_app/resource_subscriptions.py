@@ -0,0 +1,130 @@
+"""
+MCP Resource Subscriptions
+
+Tracks which sessions have subscribed (resources/subscribe) to which live
+resource URIs, and turns data feeds into notifications/resources/updated.
+
+Feeds call publish(uri, content) whenever they have fresh data, as often as
+they like: a URI nobody watches costs one dict lookup, and a watched one only
+notifies when the content digest differs from the last one seen. Content
+passed to subscribe() is the baseline and does not notify. A URI subscribed
+before it has any content (e.g. a quote with no tick yet) starts from
+NO_CONTENT, so its first published content notifies.
+
+Usage:
+    subs = ResourceSubscriptions(notify=lambda sid, msg: queue_for(sid).put(msg))
+    subs.subscribe("abc", "ibkr://live/quote/AAPL", content=current_quote)
+    subs.publish("ibkr://live/quote/AAPL", new_quote)   # notifies "abc" if it changed
+    subs.drop_session("abc")                              # on disconnect
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+NO_CONTENT = "-"  # digest of a subscribed URI that has no content yet; never equals a real digest
+
+
+def content_digest(content: Any) -> str:
+    """Stable digest of a JSON-serializable resource body"""
+    encoded = json.dumps(content, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def resource_updated(uri: str) -> Dict[str, Any]:
+    return {"jsonrpc": "2.0", "method": "notifications/resources/updated", "params": {"uri": uri}}
+
+
+class ResourceSubscriptions:
+    """uri -> subscribed sessions, with change detection per uri"""
+
+    def __init__(self, notify: Callable[[str, Dict[str, Any]], bool]):
+        # notify(session_id, message) returns False once the session is gone
+        self._notify = notify
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._digests: Dict[str, str] = {}
+        self._stats = {
+            "published": 0,
+            "unchanged": 0,
+            "notifications": 0,
+        }
+
+    def subscribe(self, session_id: str, uri: str, content: Optional[Any] = None):
+        """Watch uri for session_id; content (None = not available yet) becomes the change baseline"""
+        digest = content_digest(content) if content is not None else NO_CONTENT
+        with self._lock:
+            self._subscribers.setdefault(uri, set()).add(session_id)
+            if uri not in self._digests:
+                self._digests[uri] = digest
+
+    def unsubscribe(self, session_id: str, uri: str) -> bool:
+        with self._lock:
+            sessions = self._subscribers.get(uri)
+            if not sessions or session_id not in sessions:
+                return False
+            sessions.discard(session_id)
+            if not sessions:
+                self._forget(uri)
+            return True
+
+    def drop_session(self, session_id: str) -> int:
+        """Remove every subscription held by a session; returns how many there were"""
+        with self._lock:
+            uris = [uri for uri, sessions in self._subscribers.items() if session_id in sessions]
+            for uri in uris:
+                sessions = self._subscribers[uri]
+                sessions.discard(session_id)
+                if not sessions:
+                    self._forget(uri)
+        return len(uris)
+
+    def watching(self, uri: str) -> bool:
+        return uri in self._subscribers
+
+    def watched(self, prefix: str = '') -> List[str]:
+        with self._lock:
+            return [uri for uri in self._subscribers if uri.startswith(prefix)]
+
+    def publish(self, uri: str, content: Any) -> int:
+        """Fresh content for uri; notifies its subscribers if it changed. Returns sessions notified."""
+        if uri not in self._subscribers:
+            return 0
+        digest = content_digest(content)
+        with self._lock:
+            sessions = self._subscribers.get(uri)
+            if not sessions:
+                return 0
+            self._stats["published"] += 1
+            previous = self._digests.get(uri, NO_CONTENT)
+            self._digests[uri] = digest
+            if previous == digest:
+                self._stats["unchanged"] += 1
+                return 0
+            targets = list(sessions)
+
+        message = resource_updated(uri)
+        gone = [sid for sid in targets if not self._notify(sid, message)]
+        for sid in gone:
+            self.drop_session(sid)
+        sent = len(targets) - len(gone)
+        with self._lock:
+            self._stats["notifications"] += sent
+        return sent
+
+    def _forget(self, uri: str):
+        # Caller holds the lock
+        del self._subscribers[uri]
+        self._digests.pop(uri, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "uris": len(self._subscribers),
+                "subscriptions": sum(len(s) for s in self._subscribers.values()),
+                "sessions": len(set().union(*self._subscribers.values())) if self._subscribers else 0,
+            })
+        return stats
@@ -9,26 +9,225 @@ import ssl
 import queue
 import uuid
 import random
+import contextvars
+import atexit
+from concurrent.futures import ThreadPoolExecutor, CancelledError, TimeoutError as FutureTimeoutError
 # Import IBKR Gateway client (bypasses broken FastMCP)
 import sys
 import os
 sys.path.insert(0, os.path.dirname(__file__))
-from ibkr_gateway_client import ibkr_gateway_client as mcp_client
-
-log_lock = threading.Lock()
-def log_to_file(message):
-    log_path = os.path.join(DIRECTORY, "ibkr_proxy.log")
-    with log_lock:
-        try:
-            with open(log_path, "a", encoding='utf-8') as f:
-                f.write(f"[{time.ctime()}] {message}\n")
-        except:
-            pass
+# Shared FDC3 log helpers live in analyst/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyst"))
+from ibkr_gateway_client import ibkr_gateway_client as mcp_client, IBKR_TOOLS, IBKR_TOOLS_JSON
+from fdc3_state import build_context
+from tool_pool import ToolCallPool, ToolPoolFull
+from mcp_sessions import SessionQueue, parse_event_id, encode_message
+from tool_registry import ToolRegistry, splice_json, jsonrpc_result, encode_json
+from resource_subscriptions import ResourceSubscriptions
+from market_fanout import MarketFanout, sse_frame, SSE_KEEPALIVE
+from quote_store import QuoteStore
+from shared_quotes import SharedQuoteTable
+from market_ingest import IngestProcess, FLAG_LAST, FLAG_SIZE, STATE_CLOSED, STATE_OPEN, STATE_READY
+from tick_history import TickHistory
+from tick_capture import TickCapture, route_market_data
+from subscription_manager import SubscriptionManager, PRIORITY_POSITION, PRIORITY_WATCHLIST, PRIORITY_OTHER
+from market_wire import DeltaEncoder
+from async_log import AsyncLogger
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:  # binary /ibkr/ws needs flask-sock; the SSE /ibkr/stream works without it
+    Sock = None
+try:
+    from market_simulator import PriceSimulator
+except ImportError:  # numpy not installed: browsers fall back to their own random walk
+    PriceSimulator = None
+
+# Buffered, batched and rotated by a writer thread; callers only enqueue
+server_log = AsyncLogger(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ibkr_proxy.log"),
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
+    max_bytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+    backups=int(os.environ.get('LOG_BACKUPS', 3)),
+)
+
+def log_to_file(message, level='INFO', sample=None):
+    """Log a line; sample= keys per-tick messages so at most one per second is kept"""
+    server_log.log(level, message, sample)
+
+def log_enabled(level):
+    return server_log.enabled(level)
 
 app = Flask(__name__)
 CORS(app)
 
 
+# ═══════════════════════════════════════════════════════════
+# SERVER METRICS — Counters exposed via /metrics
+# ═══════════════════════════════════════════════════════════
+metrics_lock = threading.Lock()
+server_metrics = {}  # counter name -> int
+
+def incr_metric(name, amount=1):
+    """Increment a named server counter"""
+    with metrics_lock:
+        server_metrics[name] = server_metrics.get(name, 0) + amount
+
+server_latencies = {}  # timer name -> {"count", "totalMs", "maxMs"}
+
+def record_latency(name, seconds):
+    """Add one observation to a named latency timer"""
+    ms = seconds * 1000
+    with metrics_lock:
+        timer = server_latencies.setdefault(name, {"count": 0, "totalMs": 0.0, "maxMs": 0.0})
+        timer["count"] += 1
+        timer["totalMs"] += ms
+        timer["maxMs"] = max(timer["maxMs"], ms)
+
+def latency_snapshot():
+    """Latency timers with averages, for /metrics"""
+    with metrics_lock:
+        return {
+            name: {**timer, "avgMs": timer["totalMs"] / timer["count"]}
+            for name, timer in server_latencies.items()
+        }
+
+
+# ═══════════════════════════════════════════════════════════
+# CANCELLATION — Stop upstream work when the client goes away
+# ═══════════════════════════════════════════════════════════
+
+class AnalysisCancelled(Exception):
+    """Raised inside an analysis when its client has disconnected."""
+
+
+class CancelToken:
+    """
+    Per-request cancellation flag.
+    Upstream HTTP responses (anything with close()) and pending futures (anything
+    with cancel()) can be registered; they are closed/cancelled the moment the
+    token is cancelled, or simply closed on release() when the request finishes.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._resources = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def register(self, resource):
+        """Track an upstream response or future; returns it for inline use"""
+        with self._lock:
+            if not self._event.is_set():
+                self._resources.append(resource)
+                return resource
+        self._abort(resource)
+        return resource
+
+    def check(self):
+        """Raise AnalysisCancelled if the client has gone away"""
+        if self._event.is_set():
+            raise AnalysisCancelled()
+
+    def cancel(self):
+        """Cancel all registered work. Returns True only for the first call."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self._event.set()
+            resources, self._resources = self._resources, []
+        for resource in resources:
+            self._abort(resource)
+        return True
+
+    def release(self):
+        """Close registered upstream responses after normal completion"""
+        with self._lock:
+            resources, self._resources = self._resources, []
+        for resource in resources:
+            if hasattr(resource, 'close'):
+                try:
+                    resource.close()
+                except Exception:
+                    pass
+
+    @staticmethod
+    def _abort(resource):
+        try:
+            if hasattr(resource, 'cancel'):
+                if resource.cancel():
+                    incr_metric('tool_futures_cancelled')
+            elif hasattr(resource, 'close'):
+                resource.close()
+                incr_metric('upstream_streams_closed')
+        except Exception as e:
+            log_to_file(f"[Cancel] Failed to abort {type(resource).__name__}: {e}", level='WARNING')
+
+
+# Worker threads for blocking calls made from /analyze streams, so the stream can
+# keep writing keepalives (and notice a dropped client) while they run
+ANALYZE_KEEPALIVE_INTERVAL = 2  # seconds
+analysis_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='analysis')
+
+def run_with_keepalive(cancel_token, fn, *args, **kwargs):
+    """
+    Generator helper: run fn off-thread and yield SSE keepalive comments until it
+    finishes. Use as `result = yield from run_with_keepalive(token, fn, ...)`.
+    """
+    # copy_context() carries per-request state (e.g. tool usage tracking) onto the worker
+    future = cancel_token.register(analysis_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs))
+    while True:
+        cancel_token.check()
+        try:
+            return future.result(timeout=ANALYZE_KEEPALIVE_INTERVAL)
+        except FutureTimeoutError:
+            yield ": keepalive\n\n"
+        except CancelledError:
+            raise AnalysisCancelled()
+
+
+# ═══════════════════════════════════════════════════════════
+# TOOL USAGE TRACKING — Per-request, safe for concurrent analyses
+# ═══════════════════════════════════════════════════════════
+
+class ToolUsage:
+    """Tools called while serving one request (reported as _meta.toolsUsed)"""
+
+    def __init__(self):
+        self.tools = []
+
+    def record_tool(self, name):
+        if name and name not in self.tools:
+            self.tools.append(name)
+
+
+# The active ToolUsage for the current request context (None = not tracking)
+current_tool_usage = contextvars.ContextVar('current_tool_usage', default=None)
+
+def record_tool_use(name):
+    """Attribute a tool call to the request running in this context, if any"""
+    usage = current_tool_usage.get()
+    if usage is not None:
+        usage.record_tool(name)
+
+def with_tool_usage(generator, usage):
+    """Run each step of a streaming generator in a context where usage is the active ToolUsage"""
+    context = contextvars.copy_context()
+    context.run(current_tool_usage.set, usage)
+    try:
+        while True:
+            try:
+                item = context.run(next, generator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        context.run(generator.close)
+
+
 # ═══════════════════════════════════════════════════════════
 # PENDING TRADES STORAGE (for AI-proposed trades awaiting confirmation)
 # ═══════════════════════════════════════════════════════════
@@ -74,18 +273,24 @@ ASK_ANALYST_TOOL = {
 }
 
 
+# Tools offered to Gemini in the analyst flow
+GEMINI_ANALYST_TOOLS = frozenset({
+    'get_positions', 'get_account_summary', 'get_orders',
+    'place_order', 'cancel_order'
+})
+
+
 def get_all_mcp_tools():
     """Get the complete list of MCP tools from the gateway client + ask_analyst.
-    This is the single source of truth for all tool definitions."""
-    tools = mcp_client.list_tools()
-    tools.append(ASK_ANALYST_TOOL)
-    return tools
+    This is the single source of truth for all tool definitions (frozen, built once)."""
+    return tool_registry.tools
 
 
 def tools_to_openai_format(tools=None):
-    """Convert MCP tool definitions to OpenAI function calling format."""
+    """Convert MCP tool definitions to OpenAI function calling format.
+    Without arguments, returns the registry's prebuilt array."""
     if tools is None:
-        tools = get_all_mcp_tools()
+        return tool_registry.openai_tools
     return [{
         "type": "function",
         "function": {
@@ -97,15 +302,12 @@ def tools_to_openai_format(tools=None):
 
 
 def tools_to_gemini_format(tools=None):
-    """Convert MCP tool definitions to Gemini function declaration format."""
+    """Convert MCP tool definitions to Gemini function declaration format.
+    Without arguments, returns the registry's prebuilt declarations."""
     if tools is None:
-        tools = get_all_mcp_tools()
+        return tool_registry.gemini_tools
     # Filter to only tools useful for the Gemini analyst flow
-    analyst_tool_names = {
-        'get_positions', 'get_account_summary', 'get_orders',
-        'place_order', 'cancel_order'
-    }
-    filtered = [t for t in tools if t['name'] in analyst_tool_names]
+    filtered = [t for t in tools if t['name'] in GEMINI_ANALYST_TOOLS]
     return [{
         "function_declarations": [{
             "name": t["name"],
@@ -115,9 +317,13 @@ def tools_to_gemini_format(tools=None):
     }]
 
 # ═══════════════════════════════════════════════════════════
-# MCP RESOURCES — Static reference data for clients
+# MCP RESOURCES — Static reference data and live, subscribable data
 # ═══════════════════════════════════════════════════════════
 
+LIVE_POSITIONS_URI = "ibkr://live/positions"
+LIVE_ORDERS_URI = "ibkr://live/orders"
+LIVE_QUOTE_URI_PREFIX = "ibkr://live/quote/"
+
 MCP_RESOURCES = [
     {
         "uri": "ibkr://reference/exchanges",
@@ -154,9 +360,39 @@ MCP_RESOURCES = [
         "name": "Server Capabilities",
         "description": "Current server status, supported features, and connection information.",
         "mimeType": "application/json"
+    },
+    {
+        "uri": LIVE_POSITIONS_URI,
+        "name": "Live Positions",
+        "description": "Current portfolio positions. Subscribe to be notified when they change instead of polling get_positions.",
+        "mimeType": "application/json"
+    },
+    {
+        "uri": LIVE_ORDERS_URI,
+        "name": "Live Orders",
+        "description": "Current open and recent orders. Subscribe to be notified when they change.",
+        "mimeType": "application/json"
+    }
+]
+
+MCP_RESOURCE_TEMPLATES = [
+    {
+        "uriTemplate": LIVE_QUOTE_URI_PREFIX + "{symbol}",
+        "name": "Live Quote",
+        "description": "Streaming last/bid/ask/change for a symbol (e.g. ibkr://live/quote/AAPL). Subscribe to be notified on every price change.",
+        "mimeType": "application/json"
     }
 ]
 
+# Built once at import: frozen tool/resource definitions plus pre-encoded JSON for
+# tools/list, resources/list and the OpenAI/Gemini tool payloads
+tool_registry = ToolRegistry(
+    list(IBKR_TOOLS) + [ASK_ANALYST_TOOL],
+    resources=MCP_RESOURCES,
+    gemini_tool_names=GEMINI_ANALYST_TOOLS,
+    resource_templates=MCP_RESOURCE_TEMPLATES
+)
+
 
 def get_resource_content(uri: str) -> dict:
     """Return the content for a given MCP resource URI."""
@@ -226,21 +462,34 @@ def get_resource_content(uri: str) -> dict:
             "note": "FX orders route via IDEALPRO. Minimum order size is typically 25,000 units of base currency."
         }
     elif uri == "ibkr://reference/server-capabilities":
+        reference = [r for r in MCP_RESOURCES if r["uri"].startswith("ibkr://reference/")]
+        live = len(MCP_RESOURCES) - len(reference) + len(MCP_RESOURCE_TEMPLATES)
         return {
             "server": "IBKR-Mock-MCP",
             "version": "1.1.0",
             "features": [
                 "tools — 10 trading tools (orders, positions, account, search, market data, analyst)",
-                "resources — 6 reference data items (exchanges, fields, order types, symbols)",
-                "prompts — 5 pre-built analyst prompt templates"
+                f"resources — {len(reference)} reference data items (exchanges, fields, order types, symbols)",
+                f"live resources — {live} (positions, orders and quotes), with resources/subscribe change notifications",
+                f"prompts — {len(MCP_PROMPTS)} pre-built analyst prompt templates"
             ],
             "connections": {
                 "ibkr_gateway": "https://localhost:5000",
                 "flask_server": f"http://0.0.0.0:{PORT}",
-                "websocket_relay": f"wss://127.0.0.1:5000/v1/api/ws"
+                "websocket_relay": IBKR_WS_URL
             },
             "gatewayAvailable": mcp_client.is_available()
         }
+    elif uri == LIVE_POSITIONS_URI:
+        return mcp_client.get_positions()
+    elif uri == LIVE_ORDERS_URI:
+        return mcp_client.get_orders()
+    elif uri.startswith(LIVE_QUOTE_URI_PREFIX):
+        symbol = uri[len(LIVE_QUOTE_URI_PREFIX):]
+        conid = SYMBOL_CONID_MAP.get(symbol)
+        if conid is None:
+            return {"error": f"Unknown symbol: {symbol} (subscribe to the resource to look it up)"}
+        return live_quote(symbol, conid)
     else:
         return {"error": f"Resource not found: {uri}"}
 
@@ -355,8 +604,20 @@ def build_prompt_messages(name: str, arguments: dict) -> list:
 # ═══════════════════════════════════════════════════════════
 # IBKR PROXY CONFIGURATION
 # ═══════════════════════════════════════════════════════════
-IBKR_BASE_URL = "https://127.0.0.1:5000"
-IBKR_WS_URL = "wss://127.0.0.1:5000/v1/api/ws"
+# Overridable to point the relay at ibkr_feed_simulator.py (e.g. http://127.0.0.1:5001, ws://127.0.0.1:5001/v1/api/ws)
+IBKR_BASE_URL = os.environ.get('IBKR_BASE_URL', "https://127.0.0.1:5000")
+IBKR_WS_URL = os.environ.get('IBKR_WS_URL', "wss://127.0.0.1:5000/v1/api/ws")
+
+# Optional raw capture of the IBKR WebSocket feed (replay with tick_capture.py)
+IBKR_CAPTURE_DIR = os.environ.get('IBKR_CAPTURE_DIR')
+IBKR_CAPTURE_MAX_BYTES = int(os.environ.get('IBKR_CAPTURE_MAX_BYTES', 64 * 1024 * 1024))
+IBKR_CAPTURE_MAX_FILES = int(os.environ.get('IBKR_CAPTURE_MAX_FILES', 10))
+ibkr_capture = TickCapture(IBKR_CAPTURE_DIR, IBKR_CAPTURE_MAX_BYTES, IBKR_CAPTURE_MAX_FILES) if IBKR_CAPTURE_DIR else None
+
+# Optional: receive and parse IBKR ticks in a separate process (market_ingest.py)
+# that writes a shared-memory quote table, keeping tick work off this process's GIL
+IBKR_INGEST_PROCESS = os.environ.get('IBKR_INGEST_PROCESS', '0') == '1'
+IBKR_INGEST_CAPACITY = int(os.environ.get('IBKR_INGEST_CAPACITY', 1024))  # quote table rows (fixed)
 
 # Symbol -> ConId mapping (starts with common symbols, dynamically expands)
 SYMBOL_CONID_MAP = {
@@ -375,49 +636,39 @@ SYMBOL_CONID_MAP = {
 CONID_SYMBOL_MAP = {v: k for k, v in SYMBOL_CONID_MAP.items()}
 IBKR_FIELDS = ['31', '84', '85', '86', '88', '83', '7059', '6509']
 
-def subscribe_to_symbol(symbol, ws=None):
-    """Subscribe to market data for a symbol (looks up conid if needed)"""
-    global SYMBOL_CONID_MAP, CONID_SYMBOL_MAP, ibkr_ws
-    
-    # Already subscribed
-    if symbol in SYMBOL_CONID_MAP:
-        conid = SYMBOL_CONID_MAP[symbol]
-        log_to_file(f"[IBKR] Symbol {symbol} already mapped to conid {conid}")
-    else:
-        # Look up conid from IBKR
-        try:
-            search_results = mcp_client.search_contracts(symbol)
-            if search_results and len(search_results) > 0:
-                conid = search_results[0].get('conid')
-                if conid:
-                    SYMBOL_CONID_MAP[symbol] = int(conid)
-                    CONID_SYMBOL_MAP[int(conid)] = symbol
-                    log_to_file(f"[IBKR] Mapped {symbol} to conid {conid}")
-                else:
-                    log_to_file(f"[IBKR] No conid found for {symbol}")
-                    return False
-            else:
-                log_to_file(f"[IBKR] No search results for {symbol}")
-                return False
-        except Exception as e:
-            log_to_file(f"[IBKR] Error looking up {symbol}: {e}")
-            return False
-    
-    # Subscribe via websocket if connected
-    websocket = ws or ibkr_ws
-    if websocket and ibkr_ws_connected:
-        try:
-            conid = SYMBOL_CONID_MAP[symbol]
-            sub_msg = f'smd+{conid}+{json.dumps({"fields": IBKR_FIELDS})}'
-            websocket.send(sub_msg)
-            log_to_file(f"[IBKR] Subscribed to {symbol} (conid: {conid})")
-            return True
-        except Exception as e:
-            log_to_file(f"[IBKR] Error subscribing to {symbol}: {e}")
-            return False
+IBKR_MAX_LINES = int(os.environ.get('IBKR_MAX_LINES', 100))  # concurrent streaming lines the gateway allows
+IBKR_SNAPSHOT_INTERVAL = float(os.environ.get('IBKR_SNAPSHOT_INTERVAL', 5))  # seconds; symbols without a line
+IBKR_POSITIONS_REFRESH = 30  # seconds between portfolio demand refreshes
+
+def send_ibkr_command(message):
+    """Send a raw command (smd/umd) on the market-data connection; False when not connected"""
+    websocket = ibkr_ws
+    if websocket is None or not ibkr_ws_connected:
+        return False
+    try:
+        websocket.send(message)
+        log_to_file(f"[IBKR] Sent {message[:40]}", level='DEBUG')
+        return True
+    except Exception as e:
+        log_to_file(f"[IBKR] Error sending {message[:40]}: {e}", level='ERROR')
+        return False
+
+def lookup_conid(symbol):
+    """First contract search hit for a symbol (runs on the subscription manager's lookup pool)"""
+    results = mcp_client.search_contracts(symbol)
+    conid = results[0].get('conid') if results else None
+    log_to_file(f"[IBKR] Mapped {symbol} to conid {conid}" if conid else f"[IBKR] No conid found for {symbol}")
+    return conid
+
+def fetch_market_snapshot(conids):
+    return mcp_client.get_market_data_snapshot(conids, IBKR_FIELDS)
+
+def apply_market_snapshot(items):
+    """Polled quotes take the same path as streamed ticks"""
+    if ibkr_ingest is not None:
+        ibkr_ingest.write(items)  # the ingest process is the shared table's only writer
     else:
-        log_to_file(f"[IBKR] WebSocket not connected, will subscribe when connected")
-        return True  # Will subscribe when WS connects
+        process_ibkr_payload(items)
 
 
 # Session to maintain cookies across IBKR requests
@@ -429,12 +680,58 @@ import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # Global state for WebSocket relay
-ibkr_ws_clients = []  # List of SSE queues for connected clients
+MARKET_STREAM_MAX_RATE = float(os.environ.get('MARKET_STREAM_MAX_RATE', 5))  # per-client /ibkr/stream flushes per second; updates in between are conflated
+market_fanout = MarketFanout(max_rate=MARKET_STREAM_MAX_RATE)  # one conflating slot set per SSE client
+market_frames = {}  # symbol -> latest marketData SSE frame (bytes), for snapshots on connect
+market_quotes = {}  # symbol -> latest marketData message (dict), re-encoded per client by /ibkr/ws
+# Held while the relay or the simulator stores and publishes a quote, so their
+# writes land in one order and snapshots of market_quotes/market_frames are consistent
+market_state_lock = threading.Lock()
+market_ws_encoders = {}  # fan-out client id -> DeltaEncoder of an open /ibkr/ws
 ibkr_ws = None
 ibkr_ws_lock = threading.Lock()
 ibkr_ws_connected = False
 ibkr_sts_received = False
-ibkr_market_data = {}  # conid -> {field: value}
+if IBKR_INGEST_PROCESS:
+    # Written by the ingest process, read here in place
+    quote_store = SharedQuoteTable(create=True, capacity=IBKR_INGEST_CAPACITY)
+    atexit.register(lambda: (quote_store.close(), quote_store.unlink()))
+else:
+    quote_store = QuoteStore()  # conid -> row of last/bid/ask/... columns
+ibkr_ingest = None  # IngestProcess, created on the first /ibkr/connect in ingest mode
+
+# Which symbols hold one of the gateway's streaming lines; the rest are polled
+subscriptions = SubscriptionManager(
+    send=send_ibkr_command,
+    resolve=lookup_conid,
+    snapshot=fetch_market_snapshot,
+    on_snapshot=apply_market_snapshot,
+    symbol_conids=SYMBOL_CONID_MAP,
+    conid_symbols=CONID_SYMBOL_MAP,
+    fields=IBKR_FIELDS,
+    max_lines=IBKR_MAX_LINES,
+)
+subscription_poller_started = False
+
+tick_history = TickHistory()  # symbol -> tick ring + 1s/1m/5m OHLCV bars
+
+# Server-side simulation for the default instruments until live IBKR data arrives
+# for them; every browser sees the same prices through /ibkr/stream (isSimulated).
+# price/reference (previous close) match the frontend's initial instruments;
+# volatility is per sqrt(second), spread a fraction of last.
+SIMULATED_INSTRUMENTS = {
+    'AAPL': {'price': 189.45, 'reference': 187.13, 'volatility': 0.0003, 'spread': 0.0005, 'decimals': 2},
+    'MSFT': {'price': 420.55, 'reference': 417.00, 'volatility': 0.0003, 'spread': 0.0005, 'decimals': 2},
+    'NVDA': {'price': 950.02, 'reference': 953.07, 'volatility': 0.0005, 'spread': 0.0005, 'decimals': 2},
+    'TSLA': {'price': 175.30, 'reference': 177.97, 'volatility': 0.0005, 'spread': 0.0005, 'decimals': 2},
+    'EUR/USD': {'price': 1.0850, 'reference': 1.0830, 'volatility': 0.0001, 'spread': 0.0001, 'decimals': 4},
+    'GBP/USD': {'price': 1.2640, 'reference': 1.2612, 'volatility': 0.0001, 'spread': 0.0001, 'decimals': 4},
+    'USD/JPY': {'price': 154.50, 'reference': 154.27, 'volatility': 0.0001, 'spread': 0.0001, 'decimals': 3},
+}
+MARKET_SIM_INTERVAL = float(os.environ.get('MARKET_SIM_INTERVAL', '1.0'))  # seconds per step
+market_simulator = (PriceSimulator(SIMULATED_INSTRUMENTS)
+                    if PriceSimulator is not None and os.environ.get('MARKET_SIMULATOR', '1') != '0' else None)
+market_simulator_started = False
 
 PORT = 5500
 DIRECTORY = os.path.dirname(os.path.abspath(__file__))
@@ -471,72 +768,194 @@ def ibkr_ssodh_init():
         print(f"[IBKR Proxy] SSO init error: {e}")
         return jsonify({"error": str(e)}), 500
 
-def broadcast_to_clients(message):
-    """Send message to all connected SSE clients"""
-    dead_clients = []
-    for q in ibkr_ws_clients:
-        try:
-            q.put_nowait(message)
-        except queue.Full:
-            dead_clients.append(q)
-    for q in dead_clients:
-        if q in ibkr_ws_clients:
-            ibkr_ws_clients.remove(q)
-
-def parse_ibkr_price(value):
-    """Strip leading letter prefix from IBKR delayed prices (e.g., 'C270.01' -> 270.01)"""
+def broadcast_to_clients(key, message):
+    """Send message to all connected SSE clients; an unsent message with the same key is replaced"""
+    market_fanout.broadcast(key, sse_frame(message))
+
+def parse_symbol_list(value):
+    """Symbols from "AAPL,msft" or ["AAPL", "MSFT"], upper-cased; None when not given (= every symbol)"""
     if value is None:
         return None
-    s = str(value)
-    # Strip leading letters
-    cleaned = ''.join(c for i, c in enumerate(s) if c.isdigit() or c == '.' or c == '-' or (i > 0 and c == 'e'))
-    if not cleaned:
-        return None
-    try:
-        return float(cleaned)
-    except:
-        return None
+    if isinstance(value, str):
+        value = value.split(',')
+    return [str(s).strip().upper() for s in value if str(s).strip()]
+
+LIVE_QUOTE_COLUMNS = ('last', 'bid', 'ask', 'chg')
+
+def live_quote(symbol, conid):
+    """Quote fields for a symbol from the quote store (all None before its first tick)"""
+    row = quote_store.quote(conid, LIVE_QUOTE_COLUMNS)
+    quote = {'symbol': symbol}
+    for name in LIVE_QUOTE_COLUMNS:
+        quote[name] = row[name] if row else None
+    quote['isDelayed'] = row['isDelayed'] if row else False
+    return quote
+
+def market_snapshot(symbols=None):
+    """(symbol, frame) of the latest update for every symbol, optionally limited to symbols"""
+    with market_state_lock:
+        frames = list(market_frames.items())
+    return [(symbol, frame) for symbol, frame in frames if symbols is None or symbol in symbols]
 
 def process_market_data(data):
     """Process incoming market data and broadcast updates"""
-    global ibkr_market_data
-
     conid = data.get('conid')
     if not conid:
         return
 
-    # Merge with existing state
-    if conid not in ibkr_market_data:
-        ibkr_market_data[conid] = {}
+    # Parse only the fields in this update, in place
+    quote_store.update(conid, data)
+    publish_market_data(conid, '31' in data, '7059' in data)
 
-    for key, value in data.items():
-        if key != 'conid':
-            ibkr_market_data[conid][key] = value
-
-    # Build update message for frontend
+def publish_market_data(conid, has_last, has_size):
+    """Publish a conid's stored quote: bars, /ibkr/stream and /ibkr/ws fan-out, MCP quote resources"""
     symbol = CONID_SYMBOL_MAP.get(conid)
     if not symbol:
-        log_to_file(f"[IBKR] No symbol for conid {conid}")
+        log_to_file(f"[IBKR] No symbol for conid {conid}", level='WARNING', sample=f'unmapped-conid-{conid}')
         return
 
-    state = ibkr_market_data[conid]
-    last = parse_ibkr_price(state.get('31'))
-    bid = parse_ibkr_price(state.get('84'))
-    ask = parse_ibkr_price(state.get('86'))
-    chg = parse_ibkr_price(state.get('83'))
-    is_delayed = 'D' in str(state.get('6509', ''))
-
-    if last is not None:
-        update = {
-            'type': 'marketData',
-            'symbol': symbol,
-            'last': last,
-            'bid': bid,
-            'ask': ask,
-            'chg': chg,
-            'isDelayed': is_delayed
-        }
-        broadcast_to_clients(json.dumps(update))
+    quote = live_quote(symbol, conid)
+    if market_simulator is not None and quote['last'] is not None and market_simulator.set_live(symbol):
+        log_to_file(f"[MARKET SIM] Live data for {symbol}, simulation stopped")
+    if has_last and quote['last'] is not None:
+        size = quote_store.get(conid, 'lastSize') if has_size else None
+        tick_history.record(symbol, time.time(), quote['last'], size or 0.0)
+    if quote['last'] is not None:
+        # Encoded once; every subscriber queue shares the same bytes
+        frame = sse_frame({'type': 'marketData', **quote})
+        with market_state_lock:
+            market_quotes[symbol] = quote
+            market_frames[symbol] = frame
+            market_fanout.publish(symbol, frame)
+    resource_subscriptions.publish(LIVE_QUOTE_URI_PREFIX + symbol, quote)
+
+def resume_market_simulation():
+    """The live feed dropped: simulate its symbols again from their last prices instead of freezing them"""
+    if market_simulator is None:
+        return
+    with market_state_lock:
+        prices = {symbol: quote['last'] for symbol, quote in market_quotes.items() if not quote.get('isSimulated')}
+    resumed = market_simulator.resume(prices)
+    if resumed:
+        log_to_file(f"[MARKET SIM] Live feed closed, simulating {', '.join(resumed)} again")
+
+def start_market_simulator():
+    """Start the simulator thread once (on the first /ibkr/stream client)"""
+    global market_simulator_started
+    if market_simulator is None:
+        return
+    with ibkr_ws_lock:
+        if market_simulator_started:
+            return
+        market_simulator_started = True
+    threading.Thread(target=run_market_simulator, name='market-simulator', daemon=True).start()
+    print(f"[MARKET SIM] Simulating {len(market_simulator.symbols)} instruments every {MARKET_SIM_INTERVAL}s")
+
+def run_market_simulator():
+    """Step every simulated instrument at once and publish through the shared fan-out"""
+    while True:
+        time.sleep(MARKET_SIM_INTERVAL)
+        now = time.time()
+        for quote in market_simulator.step(MARKET_SIM_INTERVAL):
+            symbol = quote['symbol']
+            quote.update(isDelayed=False, isSimulated=True)
+            frame = sse_frame({'type': 'marketData', **quote})
+            with market_state_lock:
+                # set_live() runs before the relay takes this lock, so a live quote is never overwritten
+                if not market_simulator.is_simulated(symbol):
+                    continue  # went live during this step
+                market_quotes[symbol] = quote
+                market_frames[symbol] = frame
+                market_fanout.publish(symbol, frame)
+            tick_history.record(symbol, now, quote['last'])
+
+def process_ibkr_payload(data):
+    """Route a decoded IBKR WebSocket message's market data to process_market_data; returns updates handled"""
+    return route_market_data(data, process_market_data)
+
+def start_subscription_poller():
+    """Start the snapshot poller / portfolio demand thread once"""
+    global subscription_poller_started
+    with ibkr_ws_lock:
+        if subscription_poller_started:
+            return
+        subscription_poller_started = True
+    threading.Thread(target=run_subscription_poller, name='ibkr-snapshot-poller', daemon=True).start()
+
+def run_subscription_poller():
+    """Poll snapshots for symbols beyond the line budget; refresh position demand now and then"""
+    next_positions = 0.0
+    while True:
+        if time.time() >= next_positions:
+            next_positions = time.time() + IBKR_POSITIONS_REFRESH
+            try:
+                refresh_position_demand()
+            except Exception as e:
+                log_to_file(f"[IBKR] Position demand refresh failed: {e}", level='WARNING')
+        try:
+            subscriptions.poll_once()
+        except Exception as e:
+            log_to_file(f"[IBKR] Snapshot poll failed: {e}", level='WARNING', sample='ibkr-snapshot-poll')
+        time.sleep(IBKR_SNAPSHOT_INTERVAL)
+
+def refresh_position_demand():
+    """Held instruments get first claim on streaming lines"""
+    result = mcp_client.get_positions()
+    if "error" in result:
+        return
+    symbols = []
+    for position in result.get("positions") or []:
+        conid = position.get('conid')
+        symbol = position.get('ticker') or position.get('contractDesc')
+        if not conid or not symbol or not position.get('position'):
+            continue
+        # Keep the relay's name for known conids (e.g. EUR/USD, not EUR.USD)
+        symbols.append(subscriptions.learn(symbol, conid))
+    subscriptions.set_source('portfolio', symbols, PRIORITY_POSITION)
+
+def on_ingest_ticks(sent, updates):
+    """Ticks the ingest process wrote to the shared table: publish them from here"""
+    record_latency('ibkr_ingest_signal', time.time() - sent)
+    for conid, flags in updates:
+        publish_market_data(conid, flags & FLAG_LAST, flags & FLAG_SIZE)
+
+def on_ingest_status(state):
+    """Mirror the ingest process's WebSocket state (same transitions as the in-process client)"""
+    global ibkr_ws, ibkr_ws_connected, ibkr_sts_received
+    if state == STATE_OPEN:
+        ibkr_ws = ibkr_ingest  # send_ibkr_command() writes to it like a websocket
+        ibkr_ws_connected = True
+        log_to_file("[IBKR INGEST] Connected, waiting for sts...")
+    elif state == STATE_READY:
+        log_to_file("[IBKR INGEST] Received sts")
+        if not ibkr_sts_received:
+            ibkr_sts_received = True
+            subscriptions.resubscribe()
+            broadcast_to_clients('connected', {'type': 'connected', 'status': True})
+    elif state == STATE_CLOSED:
+        ibkr_ws_connected = False
+        ibkr_sts_received = False
+        subscriptions.disconnected()
+        resume_market_simulation()
+        log_to_file("[IBKR INGEST] WebSocket closed")
+        broadcast_to_clients('connected', {'type': 'connected', 'status': False})
+
+def on_ingest_error(text):
+    log_to_file(f"[IBKR INGEST] Error: {text}", level='ERROR', sample='ibkr-ingest-error')
+
+def start_ingest_process():
+    """Start (or restart after re-auth) the ingest process with the current gateway cookies"""
+    global ibkr_ingest, ibkr_ws_connected, ibkr_sts_received
+    with ibkr_ws_lock:
+        if ibkr_ingest is None:
+            ibkr_ingest = IngestProcess(quote_store.name, on_ingest_ticks, on_ingest_status, on_ingest_error)
+    # A replaced process never reports its close; the new one subscribes again on sts
+    ibkr_ws_connected = False
+    ibkr_sts_received = False
+    subscriptions.disconnected()
+    cookies = "; ".join([f"{c.name}={c.value}" for c in ibkr_session.cookies])
+    ibkr_ingest.start(IBKR_WS_URL, cookies)
+    print(f"[IBKR] Started ingest process (pid {ibkr_ingest.stats()['pid']})", flush=True)
 
 def ibkr_websocket_thread():
     """Background thread that maintains IBKR WebSocket connection"""
@@ -553,51 +972,45 @@ def ibkr_websocket_thread():
     def on_message(ws, message):
         global ibkr_sts_received
 
+        if ibkr_capture is not None:
+            ibkr_capture.write(message)
+
         try:
             if isinstance(message, bytes):
                 message = message.decode('utf-8')
             data = json.loads(message)
-            log_to_file(f"[IBKR WS] Received message: {message[:100]}...")
-
-            # Handle arrays of updates
-            if isinstance(data, list):
-                for item in data:
-                    if isinstance(item, dict) and 'conid' in item:
-                        process_market_data(item)
+            log_to_file(f"[IBKR WS] Received message: {message[:100]}...", level='DEBUG', sample='ibkr-ws-message')
 
             # Handle sts message
-            elif isinstance(data, dict):
-                topic = data.get('topic')
-                if topic == 'sts':
-                    log_to_file(f"[IBKR WS] Received sts: {data}")
-                    if not ibkr_sts_received:
-                        ibkr_sts_received = True
-                        # Subscribe to all symbols
-                        for symbol, conid in SYMBOL_CONID_MAP.items():
-                            sub_msg = f'smd+{conid}+{json.dumps({"fields": IBKR_FIELDS})}'
-                            log_to_file(f"[IBKR WS] Subscribing: {sub_msg}")
-                            ws.send(sub_msg)
-                        broadcast_to_clients(json.dumps({'type': 'connected', 'status': True}))
-
-                elif 'conid' in data:
-                    process_market_data(data)
+            if isinstance(data, dict) and data.get('topic') == 'sts':
+                log_to_file(f"[IBKR WS] Received sts: {data}")
+                if not ibkr_sts_received:
+                    ibkr_sts_received = True
+                    subscriptions.resubscribe()
+                    broadcast_to_clients('connected', {'type': 'connected', 'status': True})
+
+            # Market data: a single update or an array of them
+            else:
+                process_ibkr_payload(data)
 
         except json.JSONDecodeError:
             # Non-JSON message (heartbeat response, etc.)
             pass
         except Exception as e:
-            log_to_file(f"[IBKR WS] Message error: {e}")
+            log_to_file(f"[IBKR WS] Message error: {e}", level='WARNING', sample='ibkr-ws-error')
 
     def on_error(ws, error):
-        log_to_file(f"[IBKR WS] Error: {error}")
-        broadcast_to_clients(json.dumps({'type': 'error', 'message': str(error)}))
+        log_to_file(f"[IBKR WS] Error: {error}", level='ERROR')
+        broadcast_to_clients('error', {'type': 'error', 'message': str(error)})
 
     def on_close(ws, close_status_code, close_msg):
         global ibkr_ws_connected, ibkr_sts_received
         ibkr_ws_connected = False
         ibkr_sts_received = False
+        subscriptions.disconnected()
+        resume_market_simulation()
         log_to_file(f"[IBKR WS] Closed: {close_status_code} {close_msg}")
-        broadcast_to_clients(json.dumps({'type': 'connected', 'status': False}))
+        broadcast_to_clients('connected', {'type': 'connected', 'status': False})
 
     def on_open(ws):
         global ibkr_ws_connected
@@ -635,52 +1048,57 @@ def ibkr_websocket_thread():
             ibkr_ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
 
         except Exception as e:
-            log_to_file(f"[IBKR WS] Main Loop Error: {e}")
+            log_to_file(f"[IBKR WS] Main Loop Error: {e}", level='ERROR')
 
         print("[IBKR WS] Reconnecting in 5 seconds...")
         time.sleep(5)
 
 @app.route('/ibkr/stream')
 def ibkr_stream():
-    """SSE endpoint that streams IBKR market data to frontend"""
+    """
+    SSE endpoint that streams IBKR market data to frontend.
+    ?symbols=AAPL,MSFT limits the stream to those symbols (default: all) and
+    holds market-data demand for them while it is open; ?maxRate= lowers the
+    flush rate. The first event carries the stream's
+    clientId for POST /ibkr/stream/<clientId>/symbols.
+    """
 
-    # Create a queue for this client
-    client_queue = queue.Queue(maxsize=100)
-    ibkr_ws_clients.append(client_queue)
-    print(f"[IBKR SSE] Client connected. Total clients: {len(ibkr_ws_clients)}")
+    # Conflating slots for this client: a slow reader gets fewer, fresher updates
+    client = market_fanout.add_client(
+        max_rate=request.args.get('maxRate', type=float),
+        symbols=parse_symbol_list(request.args.get('symbols'))
+    )
+    print(f"[IBKR SSE] Client connected. Total clients: {market_fanout.client_count()}")
+    start_market_simulator()
+    if client.symbols is not None:
+        subscriptions.set_source(f"stream:{client.client_id}", client.symbols, PRIORITY_WATCHLIST)
 
     def generate():
         try:
+            symbols = sorted(client.symbols) if client.symbols is not None else None
+            yield sse_frame({'type': 'stream', 'clientId': client.client_id, 'symbols': symbols})
+
             # Send current connection status
-            yield f"data: {json.dumps({'type': 'connected', 'status': ibkr_ws_connected})}\n\n"
-
-            # Send current market data snapshot
-            for conid, state in ibkr_market_data.items():
-                symbol = CONID_SYMBOL_MAP.get(conid)
-                if symbol:
-                    last = parse_ibkr_price(state.get('31'))
-                    if last is not None:
-                        update = {
-                            'type': 'marketData',
-                            'symbol': symbol,
-                            'last': last,
-                            'bid': parse_ibkr_price(state.get('84')),
-                            'ask': parse_ibkr_price(state.get('86')),
-                            'isDelayed': 'D' in str(state.get('6509', ''))
-                        }
-                        yield f"data: {json.dumps(update)}\n\n"
+            yield sse_frame({'type': 'connected', 'status': ibkr_ws_connected})
+
+            # Send current market data snapshot (cached frames, no re-encoding)
+            snapshot = b"".join(frame for _, frame in market_snapshot(client.symbols))
+            if snapshot:
+                yield snapshot
 
             while True:
-                try:
-                    message = client_queue.get(timeout=5)
-                    yield f"data: {message}\n\n"
-                except queue.Empty:
+                batch = client.drain(timeout=5)
+                if batch is None:
+                    break
+                if batch:
+                    yield b"".join(batch)
+                else:
                     # Send keepalive comment
-                    yield ": keepalive\n\n"
+                    yield SSE_KEEPALIVE
         finally:
-            if client_queue in ibkr_ws_clients:
-                ibkr_ws_clients.remove(client_queue)
-            print(f"[IBKR SSE] Client disconnected. Total clients: {len(ibkr_ws_clients)}")
+            market_fanout.remove_client(client)
+            subscriptions.release_source(f"stream:{client.client_id}")
+            print(f"[IBKR SSE] Client disconnected. Total clients: {market_fanout.client_count()}")
 
     return Response(
         generate(),
@@ -692,6 +1110,133 @@ def ibkr_stream():
         }
     )
 
+@app.route('/ibkr/stream/<int:client_id>/symbols', methods=['POST'])
+def ibkr_stream_symbols(client_id):
+    """
+    Change the symbols an open /ibkr/stream receives.
+    Body: {"symbols": [...]} replaces the set (null = every symbol), or
+    {"add": [...], "remove": [...]} edits it. Newly added symbols get their
+    latest quote right away.
+    """
+    data = request.get_json(silent=True) or {}
+    client = market_fanout.get_client(client_id)
+    if client is None:
+        return jsonify({"error": f"Unknown stream client: {client_id}"}), 404
+
+    if "symbols" in data:
+        symbols = parse_symbol_list(data["symbols"])
+    elif client.symbols is None:
+        if data.get("remove"):
+            return jsonify({"error": "Stream is unfiltered; set symbols before removing any"}), 400
+        symbols = None
+    else:
+        symbols = (set(client.symbols) | set(parse_symbol_list(data.get("add")) or [])) \
+            - set(parse_symbol_list(data.get("remove")) or [])
+
+    previous = client.symbols
+    if market_fanout.set_interest(client_id, symbols) is None:
+        return jsonify({"error": f"Unknown stream client: {client_id}"}), 404
+    subscriptions.set_source(f"stream:{client_id}", client.symbols, PRIORITY_WATCHLIST)
+    if client.symbols is not None:
+        added = client.symbols - previous if previous is not None else set()
+        for symbol, frame in market_snapshot(added):
+            client.offer(symbol, frame)
+    elif previous is not None:
+        for symbol, frame in market_snapshot():
+            if symbol not in previous:
+                client.offer(symbol, frame)
+
+    return jsonify({
+        "clientId": client_id,
+        "symbols": sorted(client.symbols) if client.symbols is not None else None
+    })
+
+def send_market_ws_batch(ws, encoder, items):
+    """Write drained (key, SSE frame) pairs to a /ibkr/ws client as one delta frame"""
+    quotes, sse_bytes = [], 0
+    for key, frame in items:
+        quote = market_quotes.get(key)
+        if quote is None:
+            # Control message (connected, error, ...): its JSON as a text frame
+            ws.send(frame[len(b"data: "):-2].decode('utf-8'))
+            continue
+        quotes.append(quote)
+        sse_bytes += len(frame)
+    new_symbols, delta = encoder.encode(quotes)
+    if new_symbols:
+        ws.send(json.dumps({'type': 'symbols', 'symbols': new_symbols}))
+    if delta is not None:
+        ws.send(delta)
+    incr_metric('market_ws_quotes', len(quotes))
+    incr_metric('market_ws_sse_bytes', sse_bytes)
+
+def market_ws_stats():
+    """Bytes sent per tick by /ibkr/ws against the SSE frames the same updates would have cost"""
+    encoders = list(market_ws_encoders.values())
+    with metrics_lock:
+        totals = {name: server_metrics.get(f'market_ws_{name}', 0)
+                  for name in ('ticks', 'bytes', 'frames', 'quotes', 'sse_bytes')}
+    for encoder in encoders:
+        live = encoder.stats()
+        for name in ('ticks', 'bytes', 'frames'):
+            totals[name] += live[name]
+    ticks, quotes = totals['ticks'], totals['quotes']
+    return {
+        "available": Sock is not None,
+        "clients": len(encoders),
+        "ticks": ticks,
+        "frames": totals['frames'],
+        "bytes": totals['bytes'],
+        "bytesPerTick": round(totals['bytes'] / ticks, 2) if ticks else 0.0,
+        "sseBytesPerTick": round(totals['sse_bytes'] / quotes, 2) if quotes else 0.0,
+        "perClient": {client_id: encoder.stats() for client_id, encoder in list(market_ws_encoders.items())},
+    }
+
+if Sock is not None:
+    app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25}
+    sock = Sock(app)
+
+    @sock.route('/ibkr/ws')
+    def ibkr_ws_stream(ws):
+        """
+        Binary market-data stream (format in market_wire): a JSON symbol
+        dictionary, then frames holding only the fields that changed since
+        the last frame, batched per flush. Takes the same ?symbols=&maxRate=
+        as /ibkr/stream and shares its fan-out, so
+        POST /ibkr/stream/<clientId>/symbols works here too. Control messages
+        arrive as JSON text frames.
+        """
+        client = market_fanout.add_client(
+            max_rate=request.args.get('maxRate', type=float),
+            symbols=parse_symbol_list(request.args.get('symbols'))
+        )
+        encoder = market_ws_encoders[client.client_id] = DeltaEncoder()
+        print(f"[IBKR WS-OUT] Client connected. Total clients: {market_fanout.client_count()}")
+        start_market_simulator()
+        if client.symbols is not None:
+            subscriptions.set_source(f"stream:{client.client_id}", client.symbols, PRIORITY_WATCHLIST)
+        try:
+            symbols = sorted(client.symbols) if client.symbols is not None else None
+            ws.send(json.dumps({'type': 'stream', 'clientId': client.client_id, 'symbols': symbols}))
+            ws.send(json.dumps({'type': 'connected', 'status': ibkr_ws_connected}))
+            items = market_snapshot(client.symbols)
+            while ws.connected:
+                if items:
+                    send_market_ws_batch(ws, encoder, items)
+                items = client.drain_items(timeout=5)
+                if items is None:
+                    break
+        except ConnectionClosed:
+            pass
+        finally:
+            market_fanout.remove_client(client)
+            subscriptions.release_source(f"stream:{client.client_id}")
+            market_ws_encoders.pop(client.client_id, None)
+            final = encoder.stats()
+            for name in ('ticks', 'bytes', 'frames'):
+                incr_metric(f'market_ws_{name}', final[name])
+            print(f"[IBKR WS-OUT] Client disconnected. Total clients: {market_fanout.client_count()}")
+
 @app.route('/ibkr/connect', methods=['POST'])
 def ibkr_connect():
     """Initialize IBKR connection (auth + start WebSocket)"""
@@ -717,17 +1262,22 @@ def ibkr_connect():
         )
         print(f"[IBKR] SSO init: {sso_resp.json()}", flush=True)
 
-        # Step 3: Start WebSocket thread if not running
-        ws_thread = None
-        for t in threading.enumerate():
-            if t.name == 'ibkr_ws_thread':
-                ws_thread = t
-                break
+        # Step 3: Start WebSocket thread (or ingest process) if not running
+        start_subscription_poller()
+        if IBKR_INGEST_PROCESS:
+            if ibkr_ingest is None or not ibkr_ingest.alive():
+                start_ingest_process()
+        else:
+            ws_thread = None
+            for t in threading.enumerate():
+                if t.name == 'ibkr_ws_thread':
+                    ws_thread = t
+                    break
 
-        if ws_thread is None or not ws_thread.is_alive():
-            print("[IBKR] Starting WebSocket thread...", flush=True)
-            t = threading.Thread(target=ibkr_websocket_thread, name='ibkr_ws_thread', daemon=True)
-            t.start()
+            if ws_thread is None or not ws_thread.is_alive():
+                print("[IBKR] Starting WebSocket thread...", flush=True)
+                t = threading.Thread(target=ibkr_websocket_thread, name='ibkr_ws_thread', daemon=True)
+                t.start()
 
         return jsonify({
             "success": True,
@@ -753,10 +1303,24 @@ def ibkr_status():
     return jsonify({
         "connected": ibkr_ws_connected,
         "stsReceived": ibkr_sts_received,
-        "clientCount": len(ibkr_ws_clients),
-        "symbols": list(ibkr_market_data.keys())
+        "clientCount": market_fanout.client_count(),
+        "symbols": quote_store.conids()
     })
 
+@app.route('/marketdata/bars')
+def marketdata_bars():
+    """OHLCV bars from the server-side tick history: ?symbol=AAPL&interval=1m&since=<epoch seconds>"""
+    symbol = (request.args.get('symbol') or '').strip().upper()
+    interval = request.args.get('interval', '1m')
+    since = request.args.get('since', type=float)
+    if not symbol:
+        return jsonify({"error": "symbol is required"}), 400
+    try:
+        bars = tick_history.bars(symbol, interval, since)
+    except KeyError:
+        return jsonify({"error": f"Unsupported interval: {interval} (use one of {', '.join(tick_history.intervals)})"}), 400
+    return jsonify({"symbol": symbol, "interval": interval, "bars": bars})
+
 @app.route('/all_status')
 def all_status():
     """Get all connectivity statuses in one call"""
@@ -771,6 +1335,29 @@ def all_status():
         }
     })
 
+@app.route('/metrics')
+def server_metrics_endpoint():
+    """Server-side counters (cancelled work, etc.) for capacity monitoring"""
+    with metrics_lock:
+        counters = dict(server_metrics)
+    return jsonify({
+        "counters": counters,
+        "latencies": latency_snapshot(),
+        "mcpToolPool": mcp_tool_pool.stats(),
+        "gatewaySingleFlight": mcp_client.single_flight_stats(),
+        "mcpResourceSubscriptions": resource_subscriptions.stats(),
+        "marketFanout": market_fanout.stats(),
+        "quoteStore": quote_store.stats(),
+        "tickHistory": tick_history.stats(),
+        "marketSimulator": market_simulator.stats() if market_simulator is not None else None,
+        "marketWebSocket": market_ws_stats(),
+        "log": server_log.stats(),
+        "marketDataLines": subscriptions.stats(),
+        "ibkrIngest": ibkr_ingest.stats() if ibkr_ingest is not None else None,
+        "ibkrCapture": ibkr_capture.stats() if ibkr_capture is not None else None,
+        "mcpSessions": mcp_session_stats()
+    })
+
 @app.route('/ibkr/search/<symbol>')
 def ibkr_search(symbol):
     """Search for a contract by symbol to find its conid"""
@@ -812,10 +1399,10 @@ def mcp_status():
     """Check if MCP server is reachable"""
     available = mcp_client.is_available()
     if available:
-        tools = mcp_client.list_tools()
         return jsonify({
             "available": True,
-            "tools_count": len(tools),
+            "tools_count": len(IBKR_TOOLS),
+            "registryVersion": tool_registry.version,
             "url": "http://localhost:5002/mcp/"
         })
     return jsonify({
@@ -826,8 +1413,8 @@ def mcp_status():
 @app.route('/mcp/tools')
 def mcp_tools():
     """List available MCP tools"""
-    tools = mcp_client.list_tools()
-    return jsonify({"tools": tools})
+    # Encoded once at import
+    return Response(splice_json({}, "tools", IBKR_TOOLS_JSON), mimetype='application/json')
 
 @app.route('/mcp/positions')
 def mcp_positions():
@@ -947,8 +1534,21 @@ def mcp_subscribe():
     if not symbol:
         return jsonify({'success': False, 'error': 'No symbol provided'})
     
-    success = subscribe_to_symbol(symbol)
-    return jsonify({'success': success, 'symbol': symbol})
+    # Conid lookup (if needed) runs in the background; ticks follow once it resolves
+    state = subscriptions.acquire(symbol, 'watchlist', PRIORITY_WATCHLIST)
+    return jsonify({'success': state != 'unresolved', 'symbol': symbol, 'state': state})
+
+@app.route('/mcp/unsubscribe', methods=['POST'])
+def mcp_unsubscribe():
+    """Drop a watchlist's interest in a symbol; its line is released when nobody else wants it"""
+    data = request.get_json()
+    symbol = data.get('symbol', '')
+
+    if not symbol:
+        return jsonify({'success': False, 'error': 'No symbol provided'})
+
+    subscriptions.release(symbol, 'watchlist')
+    return jsonify({'success': True, 'symbol': symbol, 'state': subscriptions.state(symbol)})
 
 @app.route('/mcp/place_order', methods=['POST'])
 def mcp_place_order():
@@ -1098,44 +1698,223 @@ def mcp_cancel_proposal():
 # STANDARD MCP-OVER-SSE TRANSPORT
 # ═══════════════════════════════════════════════════════════
 
-# Store active MCP SSE clients: sessionId -> queue
+# tools/call worker pool: shared across sessions, bounded queue, per-session cap
+MCP_TOOL_WORKERS = int(os.environ.get('MCP_TOOL_WORKERS', 8))
+MCP_TOOL_QUEUE_SIZE = int(os.environ.get('MCP_TOOL_QUEUE_SIZE', 32))
+# Every tools/call counts against the per-session cap, including each entry of a
+# JSON-RPC batch: entries beyond it get the "server busy" error in their slot
+MCP_SESSION_MAX_INFLIGHT = int(os.environ.get('MCP_SESSION_MAX_INFLIGHT', 4))
+MCP_ERROR_SERVER_BUSY = -32001  # JSON-RPC implementation-defined server error
+MCP_ERROR_REQUEST_CANCELLED = -32002
+mcp_tool_pool = ToolCallPool(
+    max_workers=MCP_TOOL_WORKERS,
+    max_queue=MCP_TOOL_QUEUE_SIZE,
+    max_per_session=MCP_SESSION_MAX_INFLIGHT
+)
+
+MCP_SSE_PROTOCOL_VERSION = "2024-11-05"
+MCP_HTTP_PROTOCOL_VERSION = "2025-03-26"
+MCP_SUPPORTED_PROTOCOL_VERSIONS = (MCP_HTTP_PROTOCOL_VERSION, MCP_SSE_PROTOCOL_VERSION)
+
+# Outbound session queues: bounded by count and bytes; a stalled consumer loses its
+# oldest notifications ('drop_oldest_notifications') or the session ('disconnect')
+MCP_SESSION_QUEUE_MAX_MESSAGES = 256
+MCP_SESSION_QUEUE_MAX_BYTES = 8 * 1024 * 1024
+MCP_SLOW_CONSUMER_POLICY = os.environ.get('MCP_SLOW_CONSUMER_POLICY', 'drop_oldest_notifications')
+MCP_SESSION_IDLE_TIMEOUT = 300  # seconds without client activity before a session is reaped
+MCP_SESSION_RESUME_GRACE = 30  # seconds a dropped SSE session (and its tool calls) waits for a Last-Event-ID resume
+MCP_SESSION_REAP_INTERVAL = 5
+MCP_REPLAY_BUFFER_SIZE = 64  # delivered events kept per session for replay
+MCP_REPLAY_TTL = 60
+
+# Store active MCP SSE clients: sessionId -> SessionQueue (kept through a short
+# detached period so a reconnecting EventSource can resume)
 mcp_sse_clients = {}
 mcp_sse_lock = threading.Lock()
+# Streamable HTTP sessions: sessionId -> {"queue": SessionQueue for GET /mcp}
+mcp_http_sessions = {}
+# In-flight tool calls per session: sessionId -> set of CancelToken
+mcp_session_tokens = {}
+# Queue high-water marks of sessions that have already ended
+mcp_queue_high_water = {"messages": 0, "bytes": 0}
+mcp_reaper_started = False
+
+def new_mcp_session_queue(session_id):
+    """Bounded outbound queue for a new session; also starts the idle reaper on first use"""
+    start_mcp_session_reaper()
+    return SessionQueue(
+        session_id,
+        max_messages=MCP_SESSION_QUEUE_MAX_MESSAGES,
+        max_bytes=MCP_SESSION_QUEUE_MAX_BYTES,
+        policy=MCP_SLOW_CONSUMER_POLICY,
+        replay_size=MCP_REPLAY_BUFFER_SIZE,
+        replay_ttl=MCP_REPLAY_TTL
+    )
+
+def retire_mcp_session_queue(session_id, client_queue):
+    """Close a finished session's queue and fold its stats into the server counters"""
+    client_queue.close()
+    resource_subscriptions.drop_session(session_id)
+    subscriptions.release_source(f"mcp:{session_id}")
+    stats = client_queue.stats()
+    with metrics_lock:
+        mcp_queue_high_water["messages"] = max(mcp_queue_high_water["messages"], stats["highWaterMessages"])
+        mcp_queue_high_water["bytes"] = max(mcp_queue_high_water["bytes"], stats["highWaterBytes"])
+    if stats["droppedNotifications"]:
+        incr_metric('mcp_notifications_dropped', stats["droppedNotifications"])
+    if stats["closeReason"] == 'slow_consumer':
+        incr_metric('mcp_slow_consumer_disconnects')
+        log_to_file(f"[MCP SSE] Disconnected slow consumer {session_id} (queue over limit)")
+
+def mcp_session_queue(session_id):
+    """Outbound queue for a session on either transport (None if unknown); call under mcp_sse_lock"""
+    if session_id in mcp_sse_clients:
+        return mcp_sse_clients[session_id]
+    session = mcp_http_sessions.get(session_id)
+    return session["queue"] if session else None
+
+def touch_mcp_http_session(session_id):
+    """Mark a Streamable HTTP session active; False if unknown (or just reaped)"""
+    with mcp_sse_lock:
+        session = mcp_http_sessions.get(session_id)
+    if session is None:
+        return False
+    session["queue"].touch()
+    return True
+
+def start_mcp_session_reaper():
+    """Start the idle-session reaper thread once"""
+    global mcp_reaper_started
+    with mcp_sse_lock:
+        if mcp_reaper_started:
+            return
+        mcp_reaper_started = True
+    threading.Thread(target=reap_idle_mcp_sessions, name='mcp-session-reaper', daemon=True).start()
+
+def reap_idle_mcp_sessions():
+    """Drop sessions whose queue was closed, whose client has gone quiet, or that were not resumed in time"""
+    while True:
+        time.sleep(MCP_SESSION_REAP_INTERVAL)
+        with mcp_sse_lock:
+            expired_sse = [(sid, q) for sid, q in mcp_sse_clients.items()
+                           if q.closed or q.idle_for() > MCP_SESSION_IDLE_TIMEOUT
+                           or q.detached_for() > MCP_SESSION_RESUME_GRACE]
+            for sid, _ in expired_sse:
+                del mcp_sse_clients[sid]
+            expired_http = [sid for sid, session in mcp_http_sessions.items()
+                            if session["queue"].closed or session["queue"].idle_for() > MCP_SESSION_IDLE_TIMEOUT]
+        for sid, client_queue in expired_sse:
+            retire_mcp_session_queue(sid, client_queue)
+            cancel_mcp_session_work(sid)
+        for sid in expired_http:
+            end_mcp_http_session(sid)
+        if expired_sse or expired_http:
+            incr_metric('mcp_sessions_reaped', len(expired_sse) + len(expired_http))
+            log_to_file(f"[MCP SSE] Reaped {len(expired_sse) + len(expired_http)} idle session(s)")
+
+def mcp_session_stats():
+    """Per-session queue stats plus overall high-water marks, for /metrics"""
+    with mcp_sse_lock:
+        queues = {sid: q for sid, q in mcp_sse_clients.items()}
+        queues.update({sid: session["queue"] for sid, session in mcp_http_sessions.items()})
+        sse_count, http_count = len(mcp_sse_clients), len(mcp_http_sessions)
+    sessions = {sid: q.stats() for sid, q in queues.items()}
+    with metrics_lock:
+        high_water = dict(mcp_queue_high_water)
+    for stats in sessions.values():
+        high_water["messages"] = max(high_water["messages"], stats["highWaterMessages"])
+        high_water["bytes"] = max(high_water["bytes"], stats["highWaterBytes"])
+    return {
+        "sse": sse_count,
+        "http": http_count,
+        "policy": MCP_SLOW_CONSUMER_POLICY,
+        "maxMessages": MCP_SESSION_QUEUE_MAX_MESSAGES,
+        "maxBytes": MCP_SESSION_QUEUE_MAX_BYTES,
+        "queueHighWaterMessages": high_water["messages"],
+        "queueHighWaterBytes": high_water["bytes"],
+        "sessions": sessions,
+    }
+
+def cancel_mcp_session_work(session_id):
+    """Cancel every in-flight tool call belonging to a disconnected session"""
+    with mcp_sse_lock:
+        tokens = mcp_session_tokens.pop(session_id, set())
+    cancelled = sum(1 for token in tokens if token.cancel())
+    if cancelled:
+        incr_metric('mcp_tool_calls_cancelled', cancelled)
+        log_to_file(f"[MCP SSE] Cancelled {cancelled} in-flight tool call(s) for {session_id}")
 
 @app.route('/mcp/sse')
 def mcp_sse_endpoint():
     """
     Standard MCP SSE Endpoint.
     Establishes the connection and returns the endpoint for sending messages.
+    A reconnect carrying Last-Event-ID resumes its session: missed events are
+    replayed and tool calls still in flight deliver to the new connection.
     """
-    session_id = str(uuid.uuid4())
-    client_queue = queue.Queue()
-    
+    resume_id, last_seq = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('lastEventId'))
+    replay = []
+
     with mcp_sse_lock:
-        mcp_sse_clients[session_id] = client_queue
-        
-    print(f"[MCP SSE] New client connected: {session_id}")
-    
+        client_queue = mcp_sse_clients.get(resume_id) if resume_id else None
+        if client_queue is not None and not client_queue.closed:
+            session_id = resume_id
+        else:
+            session_id = str(uuid.uuid4())
+            client_queue = None
+        if client_queue is not None:
+            owner = client_queue.attach()
+
+    if client_queue is not None:
+        replay = client_queue.replay_after(last_seq)
+        if replay is None:
+            incr_metric('mcp_resume_gaps')
+            log_to_file(f"[MCP SSE] Resume of {session_id} after event {last_seq}: replay buffer no longer covers it")
+            replay = []
+        incr_metric('mcp_sessions_resumed')
+        incr_metric('mcp_events_replayed', len(replay))
+        print(f"[MCP SSE] Client resumed: {session_id} (replaying {len(replay)} events)")
+    else:
+        if resume_id:
+            log_to_file(f"[MCP SSE] Cannot resume {resume_id} (expired or unknown), starting a new session")
+        client_queue = new_mcp_session_queue(session_id)
+        with mcp_sse_lock:
+            mcp_sse_clients[session_id] = client_queue
+            owner = client_queue.attach()
+        print(f"[MCP SSE] New client connected: {session_id}")
+
     def generate():
         try:
             # Send the endpoint event as per MCP spec
             # The client should POST messages to this URL
             endpoint_url = f"/mcp/messages?sessionId={session_id}"
             yield f"event: endpoint\ndata: {endpoint_url}\n\n"
-            
-            # Keep connection open
+            for frame in replay:
+                yield frame
+
+            # Keep connection open until the client leaves, the queue is closed,
+            # or a resumed connection takes over
             while True:
-                try:
-                    message = client_queue.get(timeout=5)
-                    yield f"event: message\ndata: {json.dumps(message)}\n\n"
-                except queue.Empty:
-                    # Keepalive
-                    yield ": keepalive\n\n"
-        finally:
-            with mcp_sse_lock:
-                if session_id in mcp_sse_clients:
-                    del mcp_sse_clients[session_id]
-            print(f"[MCP SSE] Client disconnected: {session_id}")
+                frame = client_queue.get(timeout=5, owner=owner)
+                if frame is None:
+                    break
+                # Empty frame = nothing to send, keepalive
+                yield frame or ": keepalive\n\n"
+        except GeneratorExit:
+            # Client dropped: keep the session and its in-flight tool calls for a
+            # resume; the reaper ends it after MCP_SESSION_RESUME_GRACE
+            client_queue.detach(owner)
+            print(f"[MCP SSE] Client detached: {session_id}")
+            return
+
+        if not client_queue.closed:
+            return  # superseded by a resumed connection
+        with mcp_sse_lock:
+            if mcp_sse_clients.get(session_id) is client_queue:
+                del mcp_sse_clients[session_id]
+        retire_mcp_session_queue(session_id, client_queue)
+        cancel_mcp_session_work(session_id)
+        print(f"[MCP SSE] Client disconnected: {session_id}")
 
     return Response(
         generate(),
@@ -1152,274 +1931,489 @@ def send_mcp_response(sid, mid, response):
     Send an MCP response back to the client via SSE.
     """
     with mcp_sse_lock:
-        if sid in mcp_sse_clients:
-            mcp_sse_clients[sid].put(response)
+        client_queue = mcp_session_queue(sid)
+    if client_queue is None:
+        print(f"[MCP] Session {sid} not found for async response {mid}")
+    elif not client_queue.put(response):
+        log_to_file(f"[MCP] Session {sid} closed ({client_queue.close_reason}), dropped response {mid}")
+
+# Live resources: sessions subscribe with resources/subscribe and get
+# notifications/resources/updated only when the content actually changes.
+# Quotes are fed by the market-data relay (process_market_data); positions and
+# orders by a poller that reads through the gateway client's cache.
+LIVE_PORTFOLIO_POLL_INTERVAL = 10  # seconds
+live_portfolio_poller_started = False
+
+def send_mcp_notification(sid, message):
+    """Queue a server-initiated notification; False if the session is gone or closed"""
+    with mcp_sse_lock:
+        client_queue = mcp_session_queue(sid)
+    return client_queue is not None and client_queue.put(message)
+
+resource_subscriptions = ResourceSubscriptions(notify=send_mcp_notification)
+
+def is_live_resource(uri):
+    return uri in (LIVE_POSITIONS_URI, LIVE_ORDERS_URI) or (
+        uri.startswith(LIVE_QUOTE_URI_PREFIX) and len(uri) > len(LIVE_QUOTE_URI_PREFIX))
+
+def subscribe_live_resource(session_id, uri):
+    """Register a subscription, baselined on the current content, and start its feed"""
+    if uri.startswith(LIVE_QUOTE_URI_PREFIX):
+        # Conid lookup and line assignment happen off the request thread; ticks publish as they arrive
+        subscriptions.acquire(uri[len(LIVE_QUOTE_URI_PREFIX):], f"mcp:{session_id}", PRIORITY_OTHER)
+    else:
+        start_live_portfolio_poller()
+    content = get_resource_content(uri)
+    resource_subscriptions.subscribe(session_id, uri, content=None if "error" in content else content)
+    incr_metric('mcp_resource_subscribes')
+    log_to_file(f"[MCP] Session {session_id} subscribed to {uri}")
+
+def start_live_portfolio_poller():
+    """Start the positions/orders poller thread once"""
+    global live_portfolio_poller_started
+    with mcp_sse_lock:
+        if live_portfolio_poller_started:
+            return
+        live_portfolio_poller_started = True
+    threading.Thread(target=poll_live_portfolio, name='mcp-live-portfolio', daemon=True).start()
+
+def poll_live_portfolio():
+    """Publish positions/orders for subscribed URIs; the gateway cache keeps this cheap"""
+    while True:
+        time.sleep(LIVE_PORTFOLIO_POLL_INTERVAL)
+        for uri in (LIVE_POSITIONS_URI, LIVE_ORDERS_URI):
+            if not resource_subscriptions.watching(uri):
+                continue
+            try:
+                content = get_resource_content(uri)
+            except Exception as e:
+                log_to_file(f"[MCP] Live resource refresh failed for {uri}: {e}", level='WARNING')
+                continue
+            if "error" not in content:
+                resource_subscriptions.publish(uri, content)
+
+class McpProgressReporter:
+    """
+    Progress listener for a tools/call that carried params._meta.progressToken.
+    Stages become notifications/progress; streamed answer text becomes
+    notifications/tools/partialResult, both sent ahead of the final result.
+    """
+
+    def __init__(self, progress_token, deliver):
+        self.progress_token = progress_token
+        self.deliver = deliver
+        self.progress = 0
+
+    def stage(self, message):
+        self.progress += 1
+        self.deliver({
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": {"progressToken": self.progress_token, "progress": self.progress, "message": message}
+        })
+
+    def text(self, chunk):
+        self.deliver({
+            "jsonrpc": "2.0",
+            "method": "notifications/tools/partialResult",
+            "params": {"progressToken": self.progress_token, "content": [{"type": "text", "text": chunk}]}
+        })
+
+def mcp_cancelled_response(mid):
+    return {
+        "jsonrpc": "2.0",
+        "id": mid,
+        "error": {"code": MCP_ERROR_REQUEST_CANCELLED, "message": "Request cancelled"}
+    }
+
+def run_mcp_tool(sid, mid, t_name, t_args, cancel_token, deliver, progress_token=None):
+    """
+    Execute one tools/call on the worker pool and hand the JSON-RPC response to
+    deliver(). A cancelled call delivers a "Request cancelled" error instead, so
+    every call gets exactly one response.
+    """
+    if cancel_token.cancelled:
+        log_to_file(f"[BG Tool] Skipping {t_name}: session {sid} already gone")
+        deliver(mcp_cancelled_response(mid))
+        return
+    log_to_file(f"[BG Tool] [MCP-MW] Starting {t_name} for session {sid}...")
+    tools_used = []
+
+    try:
+        # New MCP Tool: ask_analyst
+        if t_name == "ask_analyst":
+            query = t_args.get("query", "")
+            logs = t_args.get("logs", [])
+            config = t_args.get("config", {})
+            enable_trading = t_args.get("enable_trading", False)
+
+            # Sub-tool calls made by the analysis are recorded into this
+            # request's own ToolUsage via a context variable
+            usage = ToolUsage()
+            usage.record_tool("ask_analyst")
+            progress = McpProgressReporter(progress_token, deliver) if progress_token is not None else None
+            log_to_file(f"[BG Tool] Calling process_analysis for ask_analyst", level='DEBUG')
+            result = process_analysis(query, logs, config, stream=False, enable_trading=enable_trading,
+                                      cancel_token=cancel_token, tool_usage=usage, progress=progress)
+            log_to_file(f"[BG Tool] process_analysis returned: {str(result)[:100]}...", level='DEBUG')
+            tools_used.extend(usage.tools)
         else:
-            print(f"[MCP] Session {sid} not found for async response {mid}")
+            # Direct IBKR tool call
+            tools_used.append(t_name)
+            result = mcp_client.call_tool(t_name, t_args)
+
+        log_to_file(f"[BG Tool] [MCP-MW] Finished {t_name} (tools_used: {tools_used})")
+
+        # Format for MCP tool result
+        content = []
+        if isinstance(result, (dict, list)):
+            content.append({
+                "type": "text",
+                "text": json.dumps(result)
+            })
+        else:
+            content.append({
+                "type": "text",
+                "text": str(result)
+            })
 
-@app.route('/mcp/messages', methods=['POST'])
-def mcp_messages_endpoint():
+        response = {
+            "jsonrpc": "2.0",
+            "id": mid,
+            "result": {
+                "content": content,
+                "isError": False if "error" not in str(result) else True,
+                "_meta": {
+                    "toolsUsed": tools_used
+                }
+            }
+        }
+    except Exception as e:
+        log_to_file(f"[BG Tool] Error in {t_name}: {e}", level='ERROR')
+        response = {
+            "jsonrpc": "2.0",
+            "id": mid,
+            "error": {
+                "code": -32000,
+                "message": str(e)
+            },
+            "_meta": {
+                "toolsUsed": tools_used
+            }
+        }
+
+    with mcp_sse_lock:
+        mcp_session_tokens.get(sid, set()).discard(cancel_token)
+    if cancel_token.cancelled:
+        log_to_file(f"[BG Tool] Dropping result of {t_name}: session {sid} disconnected")
+        response = mcp_cancelled_response(mid)
+    deliver(response)
+    cancel_token.release()
+
+def submit_mcp_tool_call(session_id, msg_id, params, deliver):
     """
-    Handle incoming MCP JSON-RPC messages from clients.
+    Queue a tools/call on the shared worker pool.
+    The result, or a "server busy" error if the pool is full, is passed to deliver().
+    Returns the call's CancelToken.
     """
-    session_id = request.args.get('sessionId')
-    log_to_file(f"[MCP POST] Incoming request for session: {session_id}")
-    
-    if not session_id or session_id not in mcp_sse_clients:
-        log_to_file(f"[MCP POST] Error: Session {session_id} not found in {list(mcp_sse_clients.keys())}")
-        return jsonify({"error": "Session not found"}), 404
-        
+    name = params.get("name")
+    args = params.get("arguments", {})
+    progress_token = (params.get("_meta") or {}).get("progressToken")
+
+    token = CancelToken()
+    with mcp_sse_lock:
+        if mcp_session_queue(session_id) is not None:
+            mcp_session_tokens.setdefault(session_id, set()).add(token)
+        else:
+            token.cancel()
+
+    def on_done(future):
+        # A future cancelled while queued never runs run_mcp_tool, so answer for it here
+        if future.cancelled():
+            deliver(mcp_cancelled_response(msg_id))
+
     try:
-        message = request.json
-        log_to_file(f"[MCP POST] Received from {session_id}: {json.dumps(message)}")
-        
-        # Handle JSON-RPC message
-        jsonrpc = message.get("jsonrpc")
-        method = message.get("method")
-        msg_id = message.get("id")
-        params = message.get("params", {})
-        
-        response = None
-        
-        if method == "initialize":
+        # Queued futures are cancelled (freeing their slot) if the session drops
+        future = mcp_tool_pool.submit(session_id, run_mcp_tool, session_id, msg_id, name, args, token, deliver,
+                                      progress_token)
+        future.add_done_callback(on_done)
+        token.register(future)
+    except ToolPoolFull as e:
+        log_to_file(f"[MCP POST] Rejected {name} for {session_id}: {e.reason}")
+        with mcp_sse_lock:
+            mcp_session_tokens.get(session_id, set()).discard(token)
+        deliver({
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "error": {
+                "code": MCP_ERROR_SERVER_BUSY,
+                "message": str(e),
+                "data": {"reason": e.reason}
+            }
+        })
+    return token
+
+def handle_mcp_message(session_id, message, deliver=None, protocol_version=MCP_SSE_PROTOCOL_VERSION):
+    """
+    Dispatch one JSON-RPC message (shared by the SSE and Streamable HTTP transports).
+    Returns the response for methods answered inline (a dict, or JSON text for
+    pre-encoded results such as tools/list), or None for notifications.
+    tools/call runs on the worker pool and passes its response to deliver()
+    (default: the session's SSE queue) instead.
+    """
+    method = message.get("method")
+    msg_id = message.get("id")
+    params = message.get("params") or {}
+
+    response = None
+
+    if method == "initialize":
+        # Echo the client's protocol version when we speak it
+        requested = params.get("protocolVersion")
+        response = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "result": {
+                "protocolVersion": requested if requested in MCP_SUPPORTED_PROTOCOL_VERSIONS else protocol_version,
+                "capabilities": {
+                    "tools": {},
+                    "resources": {"subscribe": True, "listChanged": False},
+                    "prompts": {}
+                },
+                "serverInfo": {
+                    "name": "IBKR-Mock-MCP",
+                    "version": "1.1.0"
+                }
+            }
+        }
+
+    elif method == "notifications/initialized":
+        # Just acknowledgement, no response needed for notification
+        pass
+
+    elif method == "ping":
+        response = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "result": {}
+        }
+
+    elif method == "tools/list":
+        # Pre-encoded at import; returned as JSON text
+        response = jsonrpc_result(msg_id, tool_registry.mcp_tools_json)
+
+    elif method == "tools/call":
+        if deliver is None:
+            deliver = lambda r: send_mcp_response(session_id, msg_id, r)
+        submit_mcp_tool_call(session_id, msg_id, params, deliver)
+
+    elif method == "resources/list":
+        response = jsonrpc_result(msg_id, tool_registry.resources_json)
+
+    elif method == "resources/templates/list":
+        response = jsonrpc_result(msg_id, tool_registry.resource_templates_json)
+
+    elif method in ("resources/subscribe", "resources/unsubscribe"):
+        uri = params.get("uri", "")
+        if not is_live_resource(uri):
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
-                "result": {
-                    "protocolVersion": "2024-11-05",
-                    "capabilities": {
-                        "tools": {},
-                        "resources": {},
-                        "prompts": {}
-                    },
-                    "serverInfo": {
-                        "name": "IBKR-Mock-MCP",
-                        "version": "1.1.0"
-                    }
-                }
+                "error": {"code": -32602, "message": f"Resource does not support subscriptions: {uri}"}
             }
-        
-        elif method == "notifications/initialized":
-            # Just acknowledgement, no response needed for notification
-            pass
-            
-        elif method == "ping":
+        else:
+            if method == "resources/subscribe":
+                subscribe_live_resource(session_id, uri)
+            else:
+                resource_subscriptions.unsubscribe(session_id, uri)
+                if uri.startswith(LIVE_QUOTE_URI_PREFIX):
+                    subscriptions.release(uri[len(LIVE_QUOTE_URI_PREFIX):], f"mcp:{session_id}")
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
                 "result": {}
             }
-            
-        elif method == "tools/list":
-            tools = get_all_mcp_tools()
+
+    elif method == "resources/read":
+        uri = params.get("uri", "")
+        content = get_resource_content(uri)
+        if "error" in content:
+            response = {
+                "jsonrpc": "2.0",
+                "id": msg_id,
+                "error": {"code": -32602, "message": content["error"]}
+            }
+        else:
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
                 "result": {
-                    "tools": [{
-                        "name": t["name"],
-                        "description": t["description"],
-                        "inputSchema": t.get("inputSchema", {}),
-                        **({
-                            "annotations": t["annotations"]
-                        } if "annotations" in t else {})
-                    } for t in tools]
+                    "contents": [{
+                        "uri": uri,
+                        "mimeType": "application/json",
+                        "text": json.dumps(content)
+                    }]
                 }
             }
-            
-        elif method == "tools/call":
-            name = params.get("name")
-            args = params.get("arguments", {})
-
-            # Execute tool in background thread to avoid blocking the HTTP request
-            def run_tool_background(sid, mid, t_name, t_args):
-                log_to_file(f"[BG Tool] [MCP-MW] Starting {t_name} for session {sid}...")
-                tools_used = []
-                resources_used = []
-
-                try:
-                    # New MCP Tool: ask_analyst
-                    if t_name == "ask_analyst":
-                        tools_used.append("ask_analyst")
-                        query = t_args.get("query", "")
-                        logs = t_args.get("logs", [])
-                        config = t_args.get("config", {})
-                        enable_trading = t_args.get("enable_trading", False)
-
-                        # Wrap mcp_client.call_tool to track sub-tool calls
-                        original_call_tool = mcp_client.call_tool
-                        def tracking_call_tool(tool_name, tool_args):
-                            tools_used.append(tool_name)
-                            log_to_file(f"[BG Tool] Sub-tool call: {tool_name}")
-                            return original_call_tool(tool_name, tool_args)
-                        mcp_client.call_tool = tracking_call_tool
-
-                        # Also wrap execute_tool_call to track in-process tool calls
-                        original_execute = globals().get('execute_tool_call')
-                        def tracking_execute(tool_name, arguments):
-                            if tool_name not in tools_used:
-                                tools_used.append(tool_name)
-                            return original_execute(tool_name, arguments)
-                        globals()['execute_tool_call'] = tracking_execute
-
-                        try:
-                            log_to_file(f"[BG Tool] Calling process_analysis for ask_analyst")
-                            result = process_analysis(query, logs, config, stream=False, enable_trading=enable_trading)
-                            log_to_file(f"[BG Tool] process_analysis returned: {str(result)[:100]}...")
-                        finally:
-                            # Restore original functions
-                            mcp_client.call_tool = original_call_tool
-                            globals()['execute_tool_call'] = original_execute
-                    else:
-                        # Direct IBKR tool call
-                        tools_used.append(t_name)
-                        result = mcp_client.call_tool(t_name, t_args)
-                    
-                    log_to_file(f"[BG Tool] [MCP-MW] Finished {t_name} (tools_used: {tools_used})")
-                    
-                    # Format for MCP tool result
-                    content = []
-                    if isinstance(result, (dict, list)):
-                        content.append({
-                            "type": "text",
-                            "text": json.dumps(result)
-                        })
-                    else:
-                        content.append({
-                            "type": "text",
-                            "text": str(result)
-                        })
-                        
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": mid,
-                        "result": {
-                            "content": content,
-                            "isError": False if "error" not in str(result) else True,
-                            "_meta": {
-                                "toolsUsed": tools_used,
-                                "resourcesUsed": resources_used
-                            }
-                        }
-                    }
-                except Exception as e:
-                    log_to_file(f"[BG Tool] Error in {t_name}: {e}")
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": mid,
-                        "error": {
-                            "code": -32000,
-                            "message": str(e)
-                        },
-                        "_meta": {
-                            "toolsUsed": tools_used,
-                            "resourcesUsed": resources_used
-                        }
-                    }
 
-                # Send response back via SSE
-                with mcp_sse_lock:
-                    if sid in mcp_sse_clients:
-                        mcp_sse_clients[sid].put(response)
-
-            threading.Thread(
-                target=run_tool_background,
-                args=(session_id, msg_id, name, args),
-                daemon=True
-            ).start()
-            
-            # Return accepted immediately while tool runs in background
-            return "Accepted", 202
+    elif method == "prompts/list":
+        response = {
+            "jsonrpc": "2.0",
+            "id": msg_id,
+            "result": {
+                "prompts": MCP_PROMPTS
+            }
+        }
 
-        elif method == "resources/list":
+    elif method == "prompts/get":
+        prompt_name = params.get("name", "")
+        prompt_args = params.get("arguments", {})
+        # Verify the prompt exists
+        prompt_def = next((p for p in MCP_PROMPTS if p["name"] == prompt_name), None)
+        if not prompt_def:
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
-                "result": {
-                    "resources": MCP_RESOURCES
-                }
+                "error": {"code": -32602, "message": f"Prompt not found: {prompt_name}"}
             }
-
-        elif method == "resources/read":
-            uri = params.get("uri", "")
-            content = get_resource_content(uri)
-            if "error" in content:
+        else:
+            # Check required arguments
+            missing = [a["name"] for a in prompt_def.get("arguments", []) if a.get("required") and a["name"] not in prompt_args]
+            if missing:
                 response = {
                     "jsonrpc": "2.0",
                     "id": msg_id,
-                    "error": {"code": -32602, "message": content["error"]}
+                    "error": {"code": -32602, "message": f"Missing required arguments: {', '.join(missing)}"}
                 }
             else:
+                messages = build_prompt_messages(prompt_name, prompt_args)
                 response = {
                     "jsonrpc": "2.0",
                     "id": msg_id,
                     "result": {
-                        "contents": [{
-                            "uri": uri,
-                            "mimeType": "application/json",
-                            "text": json.dumps(content)
-                        }]
+                        "description": prompt_def["description"],
+                        "messages": messages
                     }
                 }
 
-        elif method == "prompts/list":
+    else:
+        # Unknown method
+        if msg_id is not None:
             response = {
                 "jsonrpc": "2.0",
                 "id": msg_id,
-                "result": {
-                    "prompts": MCP_PROMPTS
+                "error": {
+                    "code": -32601,
+                    "message": "Method not found"
                 }
             }
 
-        elif method == "prompts/get":
-            prompt_name = params.get("name", "")
-            prompt_args = params.get("arguments", {})
-            # Verify the prompt exists
-            prompt_def = next((p for p in MCP_PROMPTS if p["name"] == prompt_name), None)
-            if not prompt_def:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "error": {"code": -32602, "message": f"Prompt not found: {prompt_name}"}
-                }
-            else:
-                # Check required arguments
-                missing = [a["name"] for a in prompt_def.get("arguments", []) if a.get("required") and a["name"] not in prompt_args]
-                if missing:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "error": {"code": -32602, "message": f"Missing required arguments: {', '.join(missing)}"}
-                    }
-                else:
-                    messages = build_prompt_messages(prompt_name, prompt_args)
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": msg_id,
-                        "result": {
-                            "description": prompt_def["description"],
-                            "messages": messages
-                        }
-                    }
+    return response
+
+MCP_INVALID_REQUEST = {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "Invalid Request"}}
+
+class McpBatch:
+    """
+    Collects the responses of one JSON-RPC batch.
+    Inline responses are stored by the dispatcher, tools/call responses arrive from
+    the worker pool; whichever finishes last emits the whole batch, so no thread
+    sits waiting on it.
+    """
 
+    def __init__(self, size, on_complete):
+        self._lock = threading.Lock()
+        self._responses = [None] * size
+        self._pending = 1  # the dispatcher itself, released by seal()
+        self._on_complete = on_complete
+        self._started = time.monotonic()
+
+    def put(self, index, response):
+        self._responses[index] = response
+
+    def expect(self, index):
+        """Reserve a slot for an asynchronous response; returns its deliver() callback"""
+        with self._lock:
+            self._pending += 1
+        delivered = []
+
+        def deliver(message):
+            if "method" in message:
+                return  # notifications are not part of the batch response
+            with self._lock:
+                if delivered:
+                    return  # the slot already has its response
+                delivered.append(True)
+            self._responses[index] = message
+            self._release()
+        return deliver
+
+    def seal(self):
+        """Called once every message has been dispatched"""
+        self._release()
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+            if self._pending:
+                return
+        record_latency('mcp_batch', time.monotonic() - self._started)
+        # Responses in request order; notifications leave no entry
+        self._on_complete([r for r in self._responses if r is not None])
+
+def dispatch_mcp_batch(session_id, messages, on_complete, protocol_version=MCP_SSE_PROTOCOL_VERSION):
+    """
+    Dispatch a JSON-RPC batch. Independent tools/call entries run concurrently on
+    the worker pool; on_complete(responses) fires once with all of them
+    (an empty list if the batch held only notifications). Each tools/call counts
+    against the session's MCP_SESSION_MAX_INFLIGHT; a rejected or cancelled call
+    still fills its slot with an error response.
+    """
+    incr_metric('mcp_batches')
+    incr_metric('mcp_batch_messages', len(messages))
+    batch = McpBatch(len(messages), on_complete)
+    for index, message in enumerate(messages):
+        if not isinstance(message, dict):
+            batch.put(index, MCP_INVALID_REQUEST)
+        elif message.get("method") == "tools/call" and message.get("id") is not None:
+            submit_mcp_tool_call(session_id, message["id"], message.get("params") or {}, batch.expect(index))
         else:
-            # Unknown method
-            if msg_id is not None:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": msg_id,
-                    "error": {
-                        "code": -32601,
-                        "message": "Method not found"
-                    }
-                }
+            batch.put(index, handle_mcp_message(session_id, message, protocol_version=protocol_version))
+    batch.seal()
+
+@app.route('/mcp/messages', methods=['POST'])
+def mcp_messages_endpoint():
+    """
+    Handle incoming MCP JSON-RPC messages from clients.
+    """
+    session_id = request.args.get('sessionId')
+    log_to_file(f"[MCP POST] Incoming request for session: {session_id}", level='DEBUG')
+    
+    with mcp_sse_lock:
+        client_queue = mcp_sse_clients.get(session_id) if session_id else None
+    if client_queue is None:
+        log_to_file(f"[MCP POST] Error: Session {session_id} not found", level='WARNING')
+        return jsonify({"error": "Session not found"}), 404
+    client_queue.touch()
+        
+    try:
+        message = request.json
+        if log_enabled('DEBUG'):
+            log_to_file(f"[MCP POST] Received from {session_id}: {json.dumps(message)}", level='DEBUG')
+
+        if isinstance(message, list):
+            # JSON-RPC batch: one SSE event carrying the array of responses
+            if not message:
+                send_mcp_response(session_id, None, MCP_INVALID_REQUEST)
+            else:
+                dispatch_mcp_batch(session_id, message,
+                                   lambda responses: responses and send_mcp_response(session_id, None, responses))
+            return "Accepted", 202
 
         # Send response back via SSE for all methods that produced one
-        # (tools/call sends its own response from the background thread)
+        # (tools/call sends its own response from the worker pool)
+        response = handle_mcp_message(session_id, message)
         if response:
-            with mcp_sse_lock:
-                if session_id in mcp_sse_clients:
-                    mcp_sse_clients[session_id].put(response)
+            send_mcp_response(session_id, message.get("id"), response)
 
         return "Accepted", 202
         
@@ -1427,6 +2421,197 @@ def mcp_messages_endpoint():
         print(f"[MCP MSG] Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ═══════════════════════════════════════════════════════════
+# MCP STREAMABLE HTTP TRANSPORT
+# ═══════════════════════════════════════════════════════════
+#
+# Single endpoint per the 2025-03-26 MCP spec:
+#   POST /mcp    JSON-RPC request or batch -> response in the body (application/json), or
+#                for tools/call with "Accept: text/event-stream", an SSE stream
+#                carrying any notifications and then the response
+#   GET /mcp     SSE stream for server-initiated notifications
+#   DELETE /mcp  end the session
+# The session id is assigned on initialize and travels in the Mcp-Session-Id header.
+
+MCP_SESSION_HEADER = 'Mcp-Session-Id'
+
+def mcp_sse_event(message):
+    return f"event: message\ndata: {encode_message(message)}\n\n"
+
+def end_mcp_http_session(session_id):
+    """Forget a Streamable HTTP session and cancel its in-flight work"""
+    with mcp_sse_lock:
+        session = mcp_http_sessions.pop(session_id, None)
+    if session is None:
+        return False
+    retire_mcp_session_queue(session_id, session["queue"])
+    cancel_mcp_session_work(session_id)
+    print(f"[MCP HTTP] Session ended: {session_id}")
+    return True
+
+def stream_mcp_tool_call(session_id, token, results):
+    """SSE body for a tools/call POST: notifications as they arrive, then the response"""
+    try:
+        while True:
+            try:
+                message = results.get(timeout=ANALYZE_KEEPALIVE_INTERVAL)
+            except queue.Empty:
+                if token.cancelled:
+                    return  # session deleted; the result will never come
+                yield ": keepalive\n\n"
+                continue
+            yield mcp_sse_event(message)
+            if "method" not in message:
+                return  # the response closes the stream
+    except GeneratorExit:
+        with mcp_sse_lock:
+            mcp_session_tokens.get(session_id, set()).discard(token)
+        if token.cancel():
+            incr_metric('mcp_tool_calls_cancelled')
+            log_to_file(f"[MCP HTTP] Client closed tools/call stream, cancelled work for {session_id}")
+
+def mcp_http_batch(messages):
+    """Streamable HTTP batch: wait for every response and return them as one JSON array"""
+    session_id = request.headers.get(MCP_SESSION_HEADER)
+    if not session_id:
+        return jsonify({"error": f"{MCP_SESSION_HEADER} header required"}), 400
+    if not touch_mcp_http_session(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    if not messages:
+        return jsonify(MCP_INVALID_REQUEST), 400
+
+    log_to_file(f"[MCP HTTP] Batch of {len(messages)} from {session_id}")
+    done = queue.Queue()
+    dispatch_mcp_batch(session_id, messages, done.put, protocol_version=MCP_HTTP_PROTOCOL_VERSION)
+    while True:
+        try:
+            responses = done.get(timeout=ANALYZE_KEEPALIVE_INTERVAL)
+        except queue.Empty:
+            if session_id not in mcp_http_sessions:
+                return jsonify({"error": "Session ended"}), 404
+            continue
+        if not responses:
+            return "", 202
+        return Response(encode_message(responses), mimetype='application/json')
+
+@app.route('/mcp', methods=['POST'])
+def mcp_http_post():
+    """Streamable HTTP: a JSON-RPC message (or batch) per POST, answered on the same response"""
+    try:
+        message = request.get_json(force=True, silent=True)
+        if isinstance(message, list):
+            return mcp_http_batch(message)
+        if not isinstance(message, dict):
+            return jsonify({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32700, "message": "Parse error: expected a JSON-RPC message object"}
+            }), 400
+
+        method = message.get("method")
+        msg_id = message.get("id")
+        session_id = request.headers.get(MCP_SESSION_HEADER)
+        headers = {}
+
+        if method == "initialize":
+            session_id = str(uuid.uuid4())
+            session = {"queue": new_mcp_session_queue(session_id)}
+            with mcp_sse_lock:
+                mcp_http_sessions[session_id] = session
+            headers[MCP_SESSION_HEADER] = session_id
+            print(f"[MCP HTTP] New session: {session_id}")
+        elif not session_id:
+            return jsonify({"error": f"{MCP_SESSION_HEADER} header required"}), 400
+        elif not touch_mcp_http_session(session_id):
+            return jsonify({"error": "Session not found"}), 404
+
+        if log_enabled('DEBUG'):
+            log_to_file(f"[MCP HTTP] Received from {session_id}: {json.dumps(message)}", level='DEBUG')
+
+        if method == "tools/call" and msg_id is not None:
+            results = queue.Queue()
+            token = submit_mcp_tool_call(session_id, msg_id, message.get("params") or {}, results.put)
+
+            if 'text/event-stream' in request.headers.get('Accept', ''):
+                return Response(
+                    stream_mcp_tool_call(session_id, token, results),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    }
+                )
+
+            # JSON-only client: block until the tool finishes
+            while True:
+                try:
+                    response = results.get(timeout=ANALYZE_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    if token.cancelled:
+                        return jsonify({"error": "Session ended"}), 404
+                    continue
+                if "method" not in response:
+                    return jsonify(response)
+
+        response = handle_mcp_message(session_id, message, protocol_version=MCP_HTTP_PROTOCOL_VERSION)
+        if response is None:
+            return "", 202, headers
+        return Response(encode_message(response), mimetype='application/json', headers=headers)
+
+    except Exception as e:
+        print(f"[MCP HTTP] Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/mcp', methods=['GET'])
+def mcp_http_stream():
+    """
+    Streamable HTTP: SSE stream for server-initiated messages on an existing session.
+    A newer GET replaces the current stream; Last-Event-ID replays what was missed.
+    """
+    session_id = request.headers.get(MCP_SESSION_HEADER)
+    with mcp_sse_lock:
+        session = mcp_http_sessions.get(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404 if session_id else 400
+        client_queue = session["queue"]
+        owner = client_queue.attach()
+
+    last_id_session, last_seq = parse_event_id(request.headers.get('Last-Event-ID'))
+    replay = client_queue.replay_after(last_seq) if last_id_session == session_id else []
+    if replay is None:
+        incr_metric('mcp_resume_gaps')
+        replay = []
+    elif replay:
+        incr_metric('mcp_events_replayed', len(replay))
+
+    def generate():
+        for frame in replay:
+            yield frame
+        while True:
+            frame = client_queue.get(timeout=5, owner=owner)
+            if frame is None:
+                break  # session ended, slow consumer, or replaced by a newer stream
+            yield frame or ": keepalive\n\n"
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@app.route('/mcp', methods=['DELETE'])
+def mcp_http_delete():
+    """Streamable HTTP: client-initiated session termination"""
+    session_id = request.headers.get(MCP_SESSION_HEADER)
+    if not session_id:
+        return jsonify({"error": f"{MCP_SESSION_HEADER} header required"}), 400
+    if not end_mcp_http_session(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    return "", 204
+
 # ═══════════════════════════════════════════════════════════
 # TRADING TOOLS FOR GEMINI FUNCTION CALLING
 # ═══════════════════════════════════════════════════════════
@@ -1442,6 +2627,7 @@ def execute_tool_call(tool_name: str, arguments: dict) -> dict:
     For other tools, executes directly via MCP.
     """
     global pending_trades
+    record_tool_use(tool_name)
 
     if tool_name == "place_order":
         # Create a pending trade for user confirmation
@@ -1542,7 +2728,7 @@ def parse_gemini_sse(resp):
                     text_count += 1
                     return text
         except Exception as e:
-            log_to_file(f"[Gemini SSE] Parse error: {e} | Data: {data[:200]}")
+            log_to_file(f"[Gemini SSE] Parse error: {e} | Data: {data[:200]}", level='WARNING', sample='gemini-sse-parse')
         return None
 
     for line in resp.iter_lines():
@@ -1589,11 +2775,14 @@ def gemini_call(prompt, api_key, model, temp, system_prompt, stream=False, enabl
             "generationConfig": {"temperature": temp}
         }
 
-        # Add function calling tools if enabled
+        # Add function calling tools if enabled (spliced in pre-encoded)
         if enable_tools:
-            payload["tools"] = tools_to_gemini_format()
+            body = splice_json(payload, "tools", tool_registry.gemini_tools_json)
+        else:
+            body = encode_json(payload)
 
-        resp = requests.post(url, json=payload, timeout=60, stream=stream)
+        resp = requests.post(url, data=body.encode('utf-8'), headers={"Content-Type": "application/json"},
+                             timeout=60, stream=stream)
         if resp.status_code == 200:
             if stream: return resp
             return resp.json()
@@ -1619,35 +2808,47 @@ def openai_call(prompt, api_key, model, temp, system_prompt, base_url, stream=Fa
             "stream": stream
         }
 
-        # Add tools if provided (for function calling)
+        # Add tools if provided (for function calling); the registry's array is already encoded
         if tools:
-            payload["tools"] = tools
             payload["tool_choice"] = "auto"
+            encoded = tool_registry.encoded("openai_tools") if tools is tool_registry.openai_tools else encode_json(tools)
+            body = splice_json(payload, "tools", encoded)
+        else:
+            body = encode_json(payload)
 
-        resp = requests.post(url, headers=headers, json=payload, timeout=120, stream=stream)
+        headers["Content-Type"] = "application/json"
+        resp = requests.post(url, headers=headers, data=body.encode('utf-8'), timeout=120, stream=stream)
         if resp.status_code == 200:
             if stream: return resp
             result = resp.json()
             message = result['choices'][0]['message']
             # Return full message (may contain tool_calls)
-            log_to_file(f"[LLM Success] Received message: {str(message)[:100]}...")
+            log_to_file(f"[LLM Success] Received message: {str(message)[:100]}...", level='DEBUG')
             return message
-        log_to_file(f"[LLM Error] Status {resp.status_code}: {resp.text}")
+        log_to_file(f"[LLM Error] Status {resp.status_code}: {resp.text}", level='ERROR')
         raise Exception(f"OpenAI/Local {resp.status_code}: {resp.text}")
     except requests.exceptions.ConnectionError:
         raise Exception(f"Connection Refused. Is your local LLM server running at {base_url}?")
     except requests.exceptions.Timeout:
         raise Exception("Request timed out. Try a faster model or check your server load.")
     except requests.exceptions.RequestException as e:
-        log_to_file(f"[LLM Error] Local LLM Request Failed: {e}")
+        log_to_file(f"[LLM Error] Local LLM Request Failed: {e}", level='ERROR')
         raise Exception(f"Local LLM Error: {str(e)}")
 
-def process_analysis(query, logs, config, stream=False, enable_trading=True):
+def process_analysis(query, logs, config, stream=False, enable_trading=True, cancel_token=None, tool_usage=None,
+                     progress=None):
     """
     Core analysis logic shared between HTTP /analyze endpoint and MCP 'ask_analyst' tool.
     Retuns a generator if stream=True, or a dict if stream=False.
+    cancel_token lets the caller abort upstream LLM/tool work when its client disconnects.
+    tool_usage (ToolUsage) collects the tools called on behalf of this request, in
+    either mode.
+    progress (stage(message) / text(chunk)) receives stages and streamed answer text
+    in non-stream mode; the returned dict is the same either way.
     """
     tools_used = []  # Track which tools are invoked during analysis
+    if cancel_token is None:
+        cancel_token = CancelToken()
     # Session Persistence Logic
     if logs:
         try:
@@ -1701,11 +2902,10 @@ RULES:
     if enable_trading:
         enhanced_system_prompt += tool_addendum
 
-    log_context = ""
-    for entry in logs:
-        log_context += f"[{entry.get('origin')}] {entry.get('type')}: {json.dumps(entry.get('data'))}\\n"
+    # Reduced current state + short compact-encoded tail instead of the full chronological log
+    log_context = build_context(logs)
 
-    prompt = f"Captured FDC3 Contexts:\\n{log_context}\\n\\nUser Question: {query}"
+    prompt = f"Captured FDC3 Contexts:\n{log_context}\n\nUser Question: {query}"
 
     if not api_key and provider != 'local':
         if not stream:
@@ -1726,7 +2926,7 @@ RULES:
                 # First try with function calling (non-streaming)
                 if enable_trading:
                     try:
-                        response = gemini_call(prompt, api_key, model_name, temp, enhanced_system_prompt, stream=False, enable_tools=True)
+                        response = yield from run_with_keepalive(cancel_token, gemini_call, prompt, api_key, model_name, temp, enhanced_system_prompt, stream=False, enable_tools=True)
                         candidate = response.get('candidates', [{}])[0]
                         content = candidate.get('content', {})
                         parts = content.get('parts', [])
@@ -1747,7 +2947,7 @@ RULES:
                                 yield f"data: {json.dumps({'text': t + chr(10) + chr(10)})}\n\n"
 
                             # Execute the tool
-                            tool_result = execute_tool_call(tool_name, arguments)
+                            tool_result = yield from run_with_keepalive(cancel_token, execute_tool_call, tool_name, arguments)
 
                             # If it's a pending trade, send special response
                             if tool_result.get('type') == 'pending_trade':
@@ -1756,13 +2956,13 @@ RULES:
                             elif tool_result.get('error'):
                                 # Tool returned an error — show it directly
                                 err_msg = tool_result['error']
-                                log_to_file(f"[Native Stream] Tool error: {err_msg}")
+                                log_to_file(f"[Native Stream] Tool error: {err_msg}", level='WARNING')
                                 yield f"data: {json.dumps({'text': 'IBKR Error: ' + err_msg})}\n\n"
                             else:
                                 # For data queries, call LLM again to summarize
                                 tool_result_str = json.dumps(tool_result, indent=2)
                                 summary_prompt = f"User asked: {query}\n\nHere is the data from IBKR:\n{tool_result_str}\n\nPlease provide a clear, formatted summary of this data for the user."
-                                summary_resp = gemini_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, stream=True, enable_tools=False)
+                                summary_resp = cancel_token.register(gemini_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, stream=True, enable_tools=False))
 
                                 got_text = False
                                 for text in parse_gemini_sse(summary_resp):
@@ -1775,15 +2975,17 @@ RULES:
                             for t in text_parts:
                                 yield f"data: {json.dumps({'text': t})}\n\n"
 
+                    except AnalysisCancelled:
+                        raise
                     except Exception as e:
                         print(f"Function calling error, falling back to regular: {e}")
                         # Fall back to regular streaming
-                        target_resp = gemini_call(prompt, api_key, model_name, temp, system_prompt, stream=True)
+                        target_resp = cancel_token.register(gemini_call(prompt, api_key, model_name, temp, system_prompt, stream=True))
                         for text in parse_gemini_sse(target_resp):
                             yield f"data: {json.dumps({'text': text})}\n\n"
                 else:
                     # No function calling, regular streaming
-                    target_resp = gemini_call(prompt, api_key, model_name, temp, system_prompt, stream=True)
+                    target_resp = cancel_token.register(gemini_call(prompt, api_key, model_name, temp, system_prompt, stream=True))
                     for text in parse_gemini_sse(target_resp):
                         yield f"data: {json.dumps({'text': text})}\n\n"
             else:
@@ -1802,42 +3004,90 @@ RULES:
 
                     if direct_tool:
                         log_to_file(f"[Local LLM] Query intent detected → {direct_tool}")
-                        tool_result = execute_tool_call(direct_tool, {})
+                        tool_result = yield from run_with_keepalive(cancel_token, execute_tool_call, direct_tool, {})
                         if tool_result.get('error'):
                             yield f"data: {json.dumps({'text': 'IBKR Error: ' + tool_result['error']})}\n\n"
                         else:
                             tool_result_str = json.dumps(tool_result, indent=2)
                             summary_prompt = f"User asked: {query}\n\nHere is the real-time data from Interactive Brokers:\n{tool_result_str}\n\nProvide a clear, formatted summary. Only use the data above — do NOT make up any numbers or positions."
                             try:
-                                summary_resp = openai_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, stream=True)
+                                summary_resp = cancel_token.register(openai_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, stream=True))
                                 for text in parse_openai_sse(summary_resp):
                                     yield f"data: {json.dumps({'text': text})}\n\n"
                             except Exception as e:
-                                log_to_file(f"[Local LLM] Summary failed: {e}")
+                                log_to_file(f"[Local LLM] Summary failed: {e}", level='WARNING')
                                 yield f"data: {json.dumps({'text': f'IBKR Data:\\n```json\\n{tool_result_str}\\n```'})}\n\n"
                     else:
                         # No direct intent match — just stream from LLM directly
-                        target_resp = openai_call(prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, stream=True)
+                        target_resp = cancel_token.register(openai_call(prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, stream=True))
                         for text in parse_openai_sse(target_resp):
                             yield f"data: {json.dumps({'text': text})}\n\n"
                 else:
                     # No trading enabled, just stream
-                    target_resp = openai_call(prompt, api_key, model_name, temp, system_prompt, base_url, stream=True)
+                    target_resp = cancel_token.register(openai_call(prompt, api_key, model_name, temp, system_prompt, base_url, stream=True))
                     for text in parse_openai_sse(target_resp):
                         yield f"data: {json.dumps({'text': text})}\n\n"
+        except (GeneratorExit, AnalysisCancelled):
+            # Client closed the stream: stop pulling tokens from the provider
+            if cancel_token.cancel():
+                incr_metric('analyze_streams_cancelled')
+                log_to_file(f"[Native Stream] Client disconnected, cancelled upstream {provider} stream")
+            return
         except Exception as inner_e:
             print(f"Streaming Exception: {inner_e}")
             yield f"data: {json.dumps({'error': str(inner_e)})}\n\n"
+        finally:
+            cancel_token.release()
 
     if stream:
-        return stream_generator()
+        return with_tool_usage(stream_generator(), tool_usage) if tool_usage is not None else stream_generator()
     else:
         # NON-STREAMING Implementation (MCP mode) - uses function calling
+        def report(message):
+            if progress is not None:
+                progress.stage(message)
+
+        def gemini_text(text_prompt):
+            """Plain Gemini completion, streamed to progress when a listener is attached"""
+            cancel_token.check()
+            if progress is None:
+                text_response = gemini_call(text_prompt, api_key, model_name, temp, enhanced_system_prompt, stream=False, enable_tools=False)
+                text_parts = text_response.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+                return "".join(p.get('text', '') for p in text_parts)
+            chunks = []
+            for text in parse_gemini_sse(cancel_token.register(gemini_call(text_prompt, api_key, model_name, temp, enhanced_system_prompt, stream=True))):
+                cancel_token.check()
+                chunks.append(text)
+                progress.text(text)
+            return "".join(chunks)
+
+        def openai_text(text_prompt):
+            """Plain OpenAI/local completion, streamed to progress when a listener is attached"""
+            cancel_token.check()
+            if progress is None:
+                text_msg = openai_call(text_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url)
+                return text_msg.get('content', '') if isinstance(text_msg, dict) else str(text_msg)
+            chunks = []
+            for text in parse_openai_sse(cancel_token.register(openai_call(text_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, stream=True))):
+                cancel_token.check()
+                chunks.append(text)
+                progress.text(text)
+            return "".join(chunks)
+
+        usage_token = current_tool_usage.set(tool_usage) if tool_usage is not None else None
         try:
+            report(f"Querying {provider} model {model_name}")
+            if provider == 'gemini' and progress is not None and not enable_trading:
+                # No function calling to wait for, so the answer can stream straight away
+                text = gemini_text(prompt)
+                return {"analysis": text if text else "No response from AI.", "toolsUsed": tools_used}
+
             if provider == 'gemini':
                 # Call Gemini with function calling enabled
+                cancel_token.check()
                 response = gemini_call(prompt, api_key, model_name, temp, enhanced_system_prompt, enable_tools=enable_trading)
-                log_to_file(f"[Gemini] Raw response: {json.dumps(response)[:500]}")
+                if log_enabled('DEBUG'):
+                    log_to_file(f"[Gemini] Raw response: {json.dumps(response)[:500]}", level='DEBUG')
 
                 candidate = response.get('candidates', [{}])[0]
                 content = candidate.get('content', {})
@@ -1855,6 +3105,8 @@ RULES:
 
                     log_to_file(f"[Gemini] Function call: {tool_name}({arguments})")
                     tools_used.append(tool_name)
+                    report(f"Calling {tool_name}")
+                    cancel_token.check()
                     tool_result = execute_tool_call(tool_name, arguments)
 
                     if tool_result.get('type') == 'pending_trade':
@@ -1871,10 +3123,8 @@ RULES:
                     # Second call to summarize the tool result
                     tool_result_str = json.dumps(tool_result, indent=2)
                     summary_prompt = f"User asked: {query}\n\nHere is the data from IBKR:\n{tool_result_str}\n\nPlease provide a clear, formatted summary of this data for the user."
-                    summary_response = gemini_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, stream=False, enable_tools=False)
-                    summary_candidate = summary_response.get('candidates', [{}])[0]
-                    summary_parts = summary_candidate.get('content', {}).get('parts', [])
-                    summary_text = "".join(p.get('text', '') for p in summary_parts)
+                    report(f"Summarizing {tool_name} results")
+                    summary_text = gemini_text(summary_prompt)
 
                     return {"analysis": summary_text if summary_text else f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
 
@@ -1898,21 +3148,30 @@ RULES:
                 if direct_tool:
                     log_to_file(f"[Local LLM MCP] Query intent → {direct_tool}")
                     tools_used.append(direct_tool)
+                    report(f"Calling {direct_tool}")
+                    cancel_token.check()
                     tool_result = execute_tool_call(direct_tool, {})
                     if tool_result.get('error'):
                         return {"analysis": f"IBKR Error: {tool_result['error']}", "toolsUsed": tools_used}
                     tool_result_str = json.dumps(tool_result, indent=2)
                     summary_prompt = f"User asked: {query}\n\nHere is the real-time data from Interactive Brokers:\n{tool_result_str}\n\nProvide a clear, formatted summary. Only use the data above — do NOT make up any numbers."
+                    report(f"Summarizing {direct_tool} results")
                     try:
-                        summary_msg = openai_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url)
-                        summary_text = summary_msg.get('content', '') if isinstance(summary_msg, dict) else str(summary_msg)
+                        summary_text = openai_text(summary_prompt)
                         return {"analysis": summary_text if summary_text else f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
+                    except AnalysisCancelled:
+                        raise
                     except Exception:
                         return {"analysis": f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
 
                 tools = tools_to_openai_format() if enable_trading else None
-                message = openai_call(prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, tools=tools)
-                log_to_file(f"[Local LLM] Full response: {json.dumps(message, indent=2)}")
+                cancel_token.check()
+                if tools is None and progress is not None:
+                    message = {"content": openai_text(prompt)}
+                else:
+                    message = openai_call(prompt, api_key, model_name, temp, enhanced_system_prompt, base_url, tools=tools)
+                if log_enabled('DEBUG'):
+                    log_to_file(f"[Local LLM] Full response: {json.dumps(message, indent=2)}", level='DEBUG')
 
                 if isinstance(message, dict) and 'tool_calls' in message and message['tool_calls']:
                     tool_call = message['tool_calls'][0]
@@ -1925,6 +3184,8 @@ RULES:
 
                     log_to_file(f"[Local LLM] Tool call: {tool_name}({arguments})")
                     tools_used.append(tool_name)
+                    report(f"Calling {tool_name}")
+                    cancel_token.check()
                     tool_result = execute_tool_call(tool_name, arguments)
 
                     if tool_result.get('type') == 'pending_trade':
@@ -1936,10 +3197,12 @@ RULES:
                     # Call LLM again to summarize the tool result
                     tool_result_str = json.dumps(tool_result, indent=2)
                     summary_prompt = f"User asked: {query}\n\nHere is the data from IBKR:\n{tool_result_str}\n\nPlease provide a clear, formatted summary of this data for the user."
+                    report(f"Summarizing {tool_name} results")
                     try:
-                        summary_msg = openai_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url)
-                        summary_text = summary_msg.get('content', '') if isinstance(summary_msg, dict) else str(summary_msg)
+                        summary_text = openai_text(summary_prompt)
                         return {"analysis": summary_text if summary_text else f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
+                    except AnalysisCancelled:
+                        raise
                     except Exception:
                         return {"analysis": f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
 
@@ -1951,23 +3214,34 @@ RULES:
                     if detected_tool:
                         log_to_file(f"[Local LLM MCP] Detected text-based tool call: {detected_tool}")
                         tools_used.append(detected_tool)
+                        report(f"Calling {detected_tool}")
+                        cancel_token.check()
                         tool_result = execute_tool_call(detected_tool, {})
                         if tool_result.get('error'):
                             return {"analysis": f"IBKR Error: {tool_result['error']}", "toolsUsed": tools_used}
                         tool_result_str = json.dumps(tool_result, indent=2)
                         summary_prompt = f"User asked: {query}\n\nHere is the real-time data from IBKR:\n{tool_result_str}\n\nPlease provide a clear, formatted summary of this data for the user. Do NOT make up any data."
+                        report(f"Summarizing {detected_tool} results")
                         try:
-                            summary_msg = openai_call(summary_prompt, api_key, model_name, temp, enhanced_system_prompt, base_url)
-                            summary_text = summary_msg.get('content', '') if isinstance(summary_msg, dict) else str(summary_msg)
+                            summary_text = openai_text(summary_prompt)
                             return {"analysis": summary_text if summary_text else f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
+                        except AnalysisCancelled:
+                            raise
                         except Exception:
                             return {"analysis": f"IBKR Data:\n```json\n{tool_result_str}\n```", "toolsUsed": tools_used}
 
                 return {"analysis": content if content else "No response from AI.", "toolsUsed": tools_used}
 
+        except AnalysisCancelled:
+            incr_metric('analyses_cancelled')
+            log_to_file("[MCP] Analysis cancelled: client disconnected")
+            return {"analysis": "Cancelled: client disconnected.", "cancelled": True, "toolsUsed": tools_used}
         except Exception as e:
-            log_to_file(f"[MCP Error] {str(e)}")
+            log_to_file(f"[MCP Error] {str(e)}", level='ERROR')
             return {"analysis": f"Error: {str(e)}", "toolsUsed": tools_used}
+        finally:
+            if usage_token is not None:
+                current_tool_usage.reset(usage_token)
 
 @app.route('/analyze', methods=['POST'])
 def analyze():
@@ -0,0 +1,189 @@
+"""
+Shared-Memory Quote Table
+
+QuoteStore's columns in a multiprocessing.shared_memory block, so a separate
+ingest process (market_ingest.py) can write quotes that the web process reads
+in place, without pickling, pipes or the writer's GIL.
+
+Rows are versioned seqlock-style. The single writer makes a row's sequence
+odd, writes the fields, then makes it even again. A reader takes the
+sequence, copies the row, and retries if the sequence was odd or changed
+meanwhile, so it never sees a half-written quote and never blocks the writer.
+A writer killed mid-update leaves the sequence odd; the next writer's update
+of that row skips past it and makes it even again.
+Rows are assigned once per conid in arrival order, and the header's row count
+is bumped only after the row's conid is in place.
+
+Layout (little-endian, 8-byte fields):
+    header  magic "QUOTESHM", capacity, columns, rows in use (64 bytes)
+    row     seq, conid, updated (epoch seconds), delayed flag, COLUMNS values (NaN = missing)
+
+The read API matches QuoteStore (quote, get, conids, stats, in, len), so the
+relay can use either table.
+
+Usage:
+    table = SharedQuoteTable(create=True, capacity=1024)      # web process (owner)
+    writer = SharedQuoteTable(name=table.name)                # ingest process
+    writer.update(265598, {"31": "C190.5", "6509": "DPB"})
+    table.quote(265598)  # {"last": 190.5, ..., "isDelayed": True, "seq": 1, "updated": ...}
+    table.close(); table.unlink()
+"""
+
+import math
+import os
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Iterable, List, Optional
+
+from quote_store import AVAILABILITY_FIELD, COLUMN_INDEX, COLUMNS, FIELD_COLUMNS, parse_price
+
+MAGIC = b"QUOTESHM"
+HEADER = struct.Struct('<8sIIQ')
+HEADER_SIZE = 64
+ROW = struct.Struct(f'<Qqdd{len(COLUMNS)}d')
+SEQ = struct.Struct('<Q')
+_ROWS_OFFSET = 16  # rows-in-use field within the header
+_FIELD_INDEX = {field: COLUMN_INDEX[name] for field, name in FIELD_COLUMNS.items()}
+READ_RETRIES = 1000
+
+
+class TableFull(Exception):
+    """No free row for a new conid"""
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Open an existing block without taking ownership of it"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':
+            # Attaching registers the block with this process's resource tracker,
+            # which would unlink it when this (non-owner) process exits
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedQuoteTable:
+    """conid rows of float64 columns in shared memory; one writer, any number of readers"""
+
+    def __init__(self, name: Optional[str] = None, create: bool = False, capacity: int = 1024):
+        if create:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE + ROW.size * capacity)
+            HEADER.pack_into(self._shm.buf, 0, MAGIC, capacity, len(COLUMNS), 0)
+        else:
+            self._shm = _attach(name)
+            magic, capacity, columns, _ = HEADER.unpack_from(self._shm.buf, 0)
+            if magic != MAGIC or columns != len(COLUMNS):
+                raise ValueError(f"Not a quote table with columns {COLUMNS}: {name}")
+        self.name = self._shm.name
+        self.capacity = capacity
+        self._buf = self._shm.buf
+        self._rows: Dict[int, int] = {}  # conid -> row, filled lazily from the table
+        self.retries = 0  # reads that raced a write and went again
+
+    def _offset(self, row: int) -> int:
+        return HEADER_SIZE + row * ROW.size
+
+    def _rows_in_use(self) -> int:
+        return SEQ.unpack_from(self._buf, _ROWS_OFFSET)[0]
+
+    def _refresh(self):
+        """Pick up rows the writer added since the last lookup"""
+        for r in range(len(self._rows), self._rows_in_use()):
+            self._rows[struct.unpack_from('<q', self._buf, self._offset(r) + 8)[0]] = r
+
+    def _row(self, conid: int) -> Optional[int]:
+        row = self._rows.get(conid)
+        if row is None:
+            self._refresh()
+            row = self._rows.get(conid)
+        return row
+
+    # --- writer (ingest process) ---
+
+    def update(self, conid: int, fields: Dict[str, Any]) -> int:
+        """Apply a (partial) IBKR update in place; returns the row's new version"""
+        row = self._row(conid)
+        buf = self._buf
+        if row is None:
+            row = self._rows_in_use()
+            if row >= self.capacity:
+                raise TableFull(f"Quote table full ({self.capacity} rows)")
+            ROW.pack_into(buf, self._offset(row), 0, conid, 0.0, 0.0, *([math.nan] * len(COLUMNS)))
+            SEQ.pack_into(buf, _ROWS_OFFSET, row + 1)
+            self._rows[conid] = row
+        base = self._offset(row)
+        current = SEQ.unpack_from(buf, base)[0]
+        # odd: write in progress (already odd if a previous writer died mid-update)
+        seq = (current | 1) + 2 if current & 1 else current + 1
+        SEQ.pack_into(buf, base, seq)
+        for field, value in fields.items():
+            col = _FIELD_INDEX.get(field)
+            if col is not None:
+                struct.pack_into('<d', buf, base + 32 + 8 * col, parse_price(value))
+            elif field == AVAILABILITY_FIELD:
+                struct.pack_into('<d', buf, base + 24, 1.0 if 'D' in str(value) else 0.0)
+        struct.pack_into('<d', buf, base + 16, time.time())
+        SEQ.pack_into(buf, base, seq + 1)
+        return (seq + 1) // 2
+
+    # --- readers (web process) ---
+
+    def _read(self, row: int) -> tuple:
+        base = self._offset(row)
+        buf = self._buf
+        for _ in range(READ_RETRIES):
+            seq = SEQ.unpack_from(buf, base)[0]
+            if not seq & 1:
+                values = ROW.unpack_from(buf, base)
+                if SEQ.unpack_from(buf, base)[0] == seq:
+                    return values
+            self.retries += 1
+        raise RuntimeError(f"Quote row {row} kept changing while being read")
+
+    def __contains__(self, conid: int) -> bool:
+        return self._row(conid) is not None
+
+    def __len__(self) -> int:
+        return self._rows_in_use()
+
+    def conids(self) -> List[int]:
+        self._refresh()
+        return list(self._rows)
+
+    def get(self, conid: int, column: str) -> Optional[float]:
+        """One column of one instrument; None if unknown or not yet received"""
+        row = self._row(conid)
+        if row is None:
+            return None
+        value = self._read(row)[4 + COLUMN_INDEX[column]]
+        return None if math.isnan(value) else value
+
+    def quote(self, conid: int, columns: Iterable[str] = COLUMNS) -> Optional[Dict[str, Any]]:
+        """Selected columns plus isDelayed/seq/updated for one instrument; None if unknown"""
+        row = self._row(conid)
+        if row is None:
+            return None
+        seq, _, updated, delayed, *values = self._read(row)
+        quote = {}
+        for name in columns:
+            value = values[COLUMN_INDEX[name]]
+            quote[name] = None if math.isnan(value) else value
+        quote.update({'isDelayed': bool(delayed), 'seq': seq // 2, 'updated': updated})
+        return quote
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._rows_in_use()
+        updates = sum(SEQ.unpack_from(self._buf, self._offset(r))[0] // 2 for r in range(rows))
+        return {"rows": rows, "capacity": self.capacity, "columns": list(COLUMNS),
+                "bytes": self._shm.size, "updates": updates, "shared": self.name, "readRetries": self.retries}
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """Remove the block (owner only, after close)"""
+        self._shm.unlink()
@@ -0,0 +1,268 @@
+"""
+Demand-driven IBKR Market-Data Subscriptions
+
+Decides which instruments hold one of the gateway's limited streaming lines.
+Demand for a symbol is reference-counted per source (a stream client, a
+watchlist, the portfolio, an MCP session) at a priority:
+
+    PRIORITY_POSITION   instruments held in the portfolio
+    PRIORITY_WATCHLIST  visible watchlists and filtered market-data streams
+    PRIORITY_OTHER      everything else (e.g. MCP quote resources)
+
+After every change the demanded symbols are ranked (best priority, then most
+references, then first demanded). The top max_lines that have a conid stream
+(smd); a symbol that loses its line or all its demand is released (umd). The
+rest are polled by a batched snapshot poller, so they still get prices.
+On reconnect (sts) only the current streaming set is subscribed again.
+
+Conid lookups for unknown symbols run on a small thread pool and never block
+the caller; failed lookups are retried after LOOKUP_RETRY seconds when the
+symbol is demanded again.
+
+Usage:
+    manager = SubscriptionManager(send=ws_send, resolve=lookup_conid, snapshot=fetch_snapshot,
+                                  on_snapshot=process_items, symbol_conids=SYMBOL_CONID_MAP,
+                                  conid_symbols=CONID_SYMBOL_MAP, max_lines=100)
+    manager.acquire("TSLA", "watchlist", PRIORITY_WATCHLIST)   # -> "streaming" / "polled" / "pending" / ...
+    manager.set_source("stream:7", ["AAPL", "MSFT"], PRIORITY_WATCHLIST)
+    manager.release("TSLA", "watchlist")
+    manager.resubscribe()   # after sts
+    manager.poll_once()     # from a timer thread
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PRIORITY_POSITION = 0
+PRIORITY_WATCHLIST = 1
+PRIORITY_OTHER = 2
+PRIORITY_NAMES = {PRIORITY_POSITION: 'position', PRIORITY_WATCHLIST: 'watchlist', PRIORITY_OTHER: 'other'}
+LOOKUP_RETRY = 60.0
+SNAPSHOT_BATCH = 50  # conids per snapshot request
+
+
+class SubscriptionManager:
+    """Reference-counted demand mapped onto a budget of streaming lines plus a snapshot poller"""
+
+    def __init__(self, send: Callable[[str], bool], resolve: Callable[[str], Optional[int]],
+                 snapshot: Callable[[List[int]], Any], on_snapshot: Callable[[list], Any],
+                 symbol_conids: Dict[str, int], conid_symbols: Dict[int, str],
+                 fields: Iterable[str] = (), max_lines: int = 100, lookup_workers: int = 2):
+        self._send = send
+        self._resolve = resolve
+        self._snapshot = snapshot
+        self._on_snapshot = on_snapshot
+        self.symbol_conids = symbol_conids  # shared with the relay, which maps ticks back to symbols
+        self.conid_symbols = conid_symbols
+        self.fields = list(fields)
+        self.max_lines = max_lines
+        self._lock = threading.Lock()
+        # Held from computing smd/umd until they are sent, so overlapping rebalances
+        # reach the gateway in the order their state changes were made
+        self._send_lock = threading.Lock()
+        self._demand: Dict[str, Dict[str, list]] = {}  # symbol -> source -> [count, priority]
+        self._order: Dict[str, int] = {}  # symbol -> first-demand sequence (rank tie-break)
+        self._next_order = 0
+        self._streaming: Dict[str, int] = {}  # symbol -> conid holding a line
+        self._polled: List[str] = []
+        self._pending: set = set()
+        self._failed: Dict[str, float] = {}  # symbol -> time of the failed lookup
+        self._lookups = ThreadPoolExecutor(max_workers=lookup_workers, thread_name_prefix='conid-lookup')
+        self._stats = {"smd": 0, "umd": 0, "lookups": 0, "lookupFailures": 0, "polls": 0, "polledQuotes": 0}
+
+    # --- demand ---
+
+    def acquire(self, symbol: str, source: str, priority: int = PRIORITY_OTHER) -> str:
+        """Add one reference from source; returns the symbol's state after rebalancing"""
+        with self._lock:
+            self._add(symbol, source, priority)
+        self._rebalance()
+        return self.state(symbol)
+
+    def release(self, symbol: str, source: str):
+        """Drop one reference from source"""
+        with self._lock:
+            sources = self._demand.get(symbol)
+            entry = sources.get(source) if sources else None
+            if entry is None:
+                return
+            entry[0] -= 1
+            if entry[0] <= 0:
+                self._remove(symbol, source)
+        self._rebalance()
+
+    def set_source(self, source: str, symbols: Optional[Iterable[str]], priority: int):
+        """Replace everything a source demands with one reference per symbol (None/[] = nothing)"""
+        wanted = dict.fromkeys(symbols or ())  # ordered: earlier symbols rank first on ties
+        with self._lock:
+            for symbol in [s for s, sources in self._demand.items() if source in sources and s not in wanted]:
+                self._remove(symbol, source)
+            for symbol in wanted:
+                entry = self._demand.get(symbol, {}).get(source)
+                if entry is None:
+                    self._add(symbol, source, priority)
+                else:
+                    entry[0], entry[1] = 1, priority
+        self._rebalance()
+
+    def release_source(self, source: str):
+        """Forget all demand from a source (client gone)"""
+        self.set_source(source, None, PRIORITY_OTHER)
+
+    def _add(self, symbol: str, source: str, priority: int):
+        # Caller holds the lock
+        sources = self._demand.setdefault(symbol, {})
+        entry = sources.setdefault(source, [0, priority])
+        entry[0] += 1
+        entry[1] = min(entry[1], priority)
+        if symbol not in self._order:
+            self._order[symbol] = self._next_order
+            self._next_order += 1
+
+    def _remove(self, symbol: str, source: str):
+        # Caller holds the lock
+        sources = self._demand.get(symbol)
+        if sources is None:
+            return
+        sources.pop(source, None)
+        if not sources:
+            del self._demand[symbol]
+            self._order.pop(symbol, None)
+
+    # --- conid lookup ---
+
+    def learn(self, symbol: str, conid: int) -> str:
+        """
+        Record a known conid (e.g. from positions), avoiding a lookup. Returns
+        the symbol to use: the existing name if the conid is already mapped.
+        """
+        with self._lock:
+            existing = self.conid_symbols.get(int(conid))
+            if existing is not None:
+                return existing
+            self._map(symbol, int(conid))
+            return symbol
+
+    def _map(self, symbol: str, conid: int):
+        # Caller holds the lock
+        self.symbol_conids[symbol] = conid
+        self.conid_symbols[conid] = symbol
+        self._failed.pop(symbol, None)
+
+    def _lookup(self, symbol: str):
+        self._stats["lookups"] += 1
+        try:
+            conid = self._resolve(symbol)
+        except Exception:
+            conid = None
+        with self._lock:
+            self._pending.discard(symbol)
+            if conid:
+                self._map(symbol, int(conid))
+            else:
+                self._failed[symbol] = time.time()
+                self._stats["lookupFailures"] += 1
+        if conid:
+            self._rebalance()
+
+    # --- lines ---
+
+    def _rank(self) -> List[str]:
+        # Caller holds the lock
+        def key(symbol):
+            sources = self._demand[symbol]
+            return (min(p for _, p in sources.values()), -sum(c for c, _ in sources.values()), self._order[symbol])
+        return sorted(self._demand, key=key)
+
+    def _rebalance(self):
+        with self._send_lock:
+            self._rebalance_and_send()
+
+    def _rebalance_and_send(self):
+        # Caller holds the send lock
+        lookups, messages = [], []
+        with self._lock:
+            now = time.time()
+            ready = []
+            for symbol in self._rank():
+                if symbol in self.symbol_conids:
+                    ready.append(symbol)
+                elif symbol not in self._pending and now - self._failed.get(symbol, 0) >= LOOKUP_RETRY:
+                    self._pending.add(symbol)
+                    lookups.append(symbol)
+            wanted = ready[:self.max_lines]
+            self._polled = ready[self.max_lines:]
+            for symbol in [s for s in self._streaming if s not in wanted]:
+                messages.append(f'umd+{self._streaming.pop(symbol)}+{{}}')
+            for symbol in wanted:
+                if symbol not in self._streaming:
+                    conid = self.symbol_conids[symbol]
+                    self._streaming[symbol] = conid
+                    messages.append(f'smd+{conid}+{json.dumps({"fields": self.fields})}')
+        for symbol in lookups:
+            self._lookups.submit(self._lookup, symbol)
+        for message in messages:  # umd first, freeing lines before new smd
+            if not self._send(message):
+                break  # not connected: resubscribe() sends the current set on sts
+            self._stats[message[:3]] += 1
+
+    def resubscribe(self):
+        """The connection is (re)established: subscribe the current streaming set again"""
+        with self._send_lock:
+            with self._lock:
+                self._streaming.clear()
+            self._rebalance_and_send()
+
+    def disconnected(self):
+        """The connection dropped: no lines are held any more"""
+        with self._send_lock, self._lock:
+            self._streaming.clear()
+
+    def state(self, symbol: str) -> str:
+        with self._lock:
+            if symbol in self._streaming:
+                return 'streaming'
+            if symbol in self._polled:
+                return 'polled'
+            if symbol in self._pending:
+                return 'pending'
+            if symbol in self._failed:
+                return 'unresolved'
+            return 'queued' if symbol in self._demand else 'idle'
+
+    # --- snapshot poller ---
+
+    def poll_once(self) -> int:
+        """Fetch snapshots for the symbols without a line, in batches; returns quotes received"""
+        with self._lock:
+            conids = [self.symbol_conids[s] for s in self._polled if s in self.symbol_conids]
+        received = 0
+        for i in range(0, len(conids), SNAPSHOT_BATCH):
+            items = self._snapshot(conids[i:i + SNAPSHOT_BATCH])
+            if isinstance(items, list):
+                items = [item for item in items if isinstance(item, dict) and item.get('conid')]
+                if items:
+                    self._on_snapshot(items)
+                    received += len(items)
+        self._stats["polls"] += 1
+        self._stats["polledQuotes"] += received
+        return received
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            demand = {s: {"refs": sum(c for c, _ in src.values()),
+                          "priority": PRIORITY_NAMES[min(p for _, p in src.values())]}
+                      for s, src in self._demand.items()}
+            stats.update({
+                "maxLines": self.max_lines,
+                "streaming": sorted(self._streaming),
+                "polled": list(self._polled),
+                "pendingLookups": sorted(self._pending),
+                "unresolved": sorted(self._failed),
+                "demand": demand,
+            })
+        return stats
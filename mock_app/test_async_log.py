@@ -0,0 +1,39 @@
+"""
+Async Logger Tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+import async_log
+from async_log import AsyncLogger
+
+
+def test_rotation_failure_keeps_logging(tmp_path, monkeypatch):
+    path = str(tmp_path / "app.log")
+    log = AsyncLogger(path, max_bytes=200, backups=2, flush_interval=3600)
+    real_replace = os.replace
+
+    def locked(src, dst):
+        raise PermissionError("file in use")
+
+    monkeypatch.setattr(async_log.os, "replace", locked)
+    for batch in range(3):
+        log.log("INFO", f"batch {batch} " + "x" * 150)
+        log._flush()
+    stats = log.stats()
+    assert stats["written"] == 3
+    assert stats["rotationErrors"] == 1  # not retried on every flush
+    with open(path) as f:
+        content = f.read()
+    assert all(f"batch {batch} " in content for batch in range(3))
+    monkeypatch.setattr(async_log.os, "replace", real_replace)
+    log._rotate_after = 0.0
+    log.log("INFO", "after")
+    log._flush()
+    log.close()
+    assert log.stats()["rotations"] == 1
+    assert os.path.exists(path + ".1")
+    with open(path) as f:
+        assert "after" in f.read()
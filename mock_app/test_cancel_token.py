@@ -0,0 +1,83 @@
+"""
+Cancellation Tests
+
+A CancelToken closes upstream responses and cancels pending futures the moment
+its client goes away.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import serve_mock
+from serve_mock import AnalysisCancelled, CancelToken, run_with_keepalive
+
+
+class Upstream:
+    """Stands in for a streaming requests.Response"""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_cancel_aborts_registered_work():
+    token = CancelToken()
+    response, future = token.register(Upstream()), token.register(Future())
+    token.check()
+
+    assert token.cancel() is True
+    assert token.cancel() is False  # only the first call counts
+    assert token.cancelled and response.closed and future.cancelled()
+    with pytest.raises(AnalysisCancelled):
+        token.check()
+
+
+def test_register_after_cancel_aborts_immediately():
+    token = CancelToken()
+    token.cancel()
+    response = token.register(Upstream())
+    assert response.closed
+
+
+def test_release_closes_responses_without_cancelling():
+    token = CancelToken()
+    response, future = token.register(Upstream()), token.register(Future())
+    token.release()
+    assert response.closed and not future.cancelled()
+    assert not token.cancelled
+    token.cancel()
+    assert not future.cancelled()  # released resources are no longer tracked
+
+
+def test_keepalive_until_result(monkeypatch):
+    monkeypatch.setattr(serve_mock, "ANALYZE_KEEPALIVE_INTERVAL", 0.01)
+    done = threading.Event()
+    steps = run_with_keepalive(CancelToken(), lambda: done.wait(5) and "result")
+    assert next(steps) == ": keepalive\n\n"
+    done.set()
+    with pytest.raises(StopIteration) as finished:
+        while True:
+            next(steps)
+    assert finished.value.value == "result"
+
+
+def test_keepalive_stops_when_cancelled(monkeypatch):
+    monkeypatch.setattr(serve_mock, "ANALYZE_KEEPALIVE_INTERVAL", 0.01)
+    token, release = CancelToken(), threading.Event()
+    steps = run_with_keepalive(token, release.wait, 5)
+    next(steps)
+    token.cancel()
+    with pytest.raises(AnalysisCancelled):
+        next(steps)
+    release.set()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
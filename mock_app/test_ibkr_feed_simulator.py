@@ -0,0 +1,86 @@
+"""
+IBKR Feed Simulator Tests
+
+smd/umd/hb round trips over a real WebSocket to the simulator.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+import websocket
+
+sys.path.insert(0, os.path.dirname(__file__))
+from ibkr_feed_simulator import WS_PATH, FeedRequestHandler, FeedSimulator, ThreadingFeedServer
+
+CONID = 265598
+
+
+@pytest.fixture
+def feed():
+    simulator = FeedSimulator(prices={CONID: 190.0}, seed=1)
+    FeedRequestHandler.simulator = simulator
+    server = ThreadingFeedServer(('127.0.0.1', 0), FeedRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    ws = websocket.create_connection(f"ws://127.0.0.1:{server.server_address[1]}{WS_PATH}", timeout=5)
+    try:
+        assert json.loads(ws.recv())["topic"] == "sts"
+        yield simulator, ws
+    finally:
+        ws.close()
+        server.shutdown()
+        server.server_close()
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_smd_then_umd(feed):
+    simulator, ws = feed
+    ws.send(f'smd+{CONID}+{{"fields":["31","84","86"]}}')
+    wait_for(lambda: simulator.stats["subscriptions"] == 1)
+
+    simulator.step()
+    first = json.loads(ws.recv())
+    assert first["conid"] == CONID and first["topic"] == f"smd+{CONID}"
+    assert first["6509"] == "RB"  # availability only on the first update
+    simulator.step()
+    assert "6509" not in json.loads(ws.recv())
+
+    ws.send(f'umd+{CONID}+{{}}')
+    wait_for(lambda: not next(iter(simulator.connections)).subscriptions)
+    messages = simulator.stats["messages"]
+    simulator.step()
+    assert simulator.stats["messages"] == messages
+
+
+def test_heartbeats_are_counted(feed):
+    simulator, ws = feed
+    ws.send('hb')
+    ws.send('tic')
+    wait_for(lambda: simulator.stats["heartbeats"] == 2)
+
+
+def test_run_survives_a_failed_step(monkeypatch):
+    simulator = FeedSimulator(rate=100)
+    calls = []
+
+    def step():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("bad update")
+
+    monkeypatch.setattr(simulator, "step", step)
+    threading.Thread(target=simulator.run, daemon=True).start()
+    wait_for(lambda: len(calls) >= 3)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
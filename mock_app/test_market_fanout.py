@@ -0,0 +1,100 @@
+"""
+Conflating Market-Data Fan-out Tests
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from market_fanout import MarketFanout
+
+
+def test_latest_value_per_key():
+    fanout = MarketFanout(max_rate=0)
+    client = fanout.add_client()
+    for price in (1, 2, 3):
+        fanout.publish("AAPL", f"AAPL {price}")
+    fanout.publish("MSFT", "MSFT 1")
+    fanout.broadcast("connected", "up")
+    assert client.drain(timeout=1) == ["AAPL 3", "MSFT 1", "up"]  # first-dirty order
+    stats = client.stats()
+    assert (stats["offered"], stats["conflated"], stats["delivered"]) == (5, 2, 3)
+    assert stats["conflationRatio"] == 0.4
+
+
+def test_drain_rate_is_bounded():
+    fanout = MarketFanout(max_rate=10)
+    client = fanout.add_client()
+    fanout.publish("AAPL", "a")
+    assert client.drain(timeout=1) == ["a"]
+    fanout.publish("AAPL", "b")
+    started = time.monotonic()
+    assert client.drain(timeout=1) == ["b"]
+    assert time.monotonic() - started >= 0.08  # waited for the 100 ms interval
+    fanout.publish("AAPL", "c")
+    assert client.drain(timeout=0.01) == []  # not allowed to send yet
+
+
+def test_client_rate_can_only_be_lowered():
+    fanout = MarketFanout(max_rate=5)
+    assert fanout.add_client(max_rate=50).min_interval == pytest.approx(0.2)
+    assert fanout.add_client(max_rate=1).min_interval == pytest.approx(1.0)
+    assert fanout.add_client(max_rate=0).min_interval == pytest.approx(0.2)
+
+
+def test_removed_client_stops_and_keeps_its_counters():
+    fanout = MarketFanout(max_rate=0)
+    client = fanout.add_client()
+    fanout.publish("AAPL", "a")
+    fanout.publish("AAPL", "b")
+    fanout.remove_client(client)
+    assert client.drain(timeout=1) is None
+    fanout.publish("AAPL", "c")
+    stats = fanout.stats()
+    assert (stats["clients"], stats["offered"], stats["conflated"]) == (0, 2, 1)
+
+
+def test_publish_reaches_only_interested_clients():
+    fanout = MarketFanout(max_rate=0)
+    everything = fanout.add_client()
+    apple, microsoft = fanout.add_client(symbols=["AAPL"]), fanout.add_client(symbols=["MSFT"])
+    fanout.publish("AAPL", "a")
+    fanout.broadcast("connected", "up")  # control messages go to filtered clients too
+    assert everything.drain(timeout=1) == ["a", "up"]
+    assert apple.drain(timeout=1) == ["a", "up"]
+    assert microsoft.drain(timeout=1) == ["up"]
+    stats = fanout.stats()
+    assert (stats["unfilteredClients"], stats["indexedSymbols"], stats["avgFanout"]) == (1, 2, 2.0)
+
+
+def test_set_interest_moves_the_client():
+    fanout = MarketFanout(max_rate=0)
+    client = fanout.add_client(symbols=["AAPL", "MSFT"])
+    fanout.publish("AAPL", "a")
+    fanout.publish("MSFT", "m")
+    fanout.set_interest(client.client_id, ["MSFT", "NVDA"])
+    assert client.drain(timeout=1) == ["m"]  # the unsent AAPL update is discarded
+    fanout.publish("AAPL", "a2")
+    fanout.publish("NVDA", "n")
+    assert client.drain(timeout=1) == ["n"]
+
+    fanout.set_interest(client.client_id, None)
+    fanout.publish("AAPL", "a3")
+    assert client.drain(timeout=1) == ["a3"]
+    assert fanout.stats()["indexedSymbols"] == 0
+    assert fanout.set_interest(999, ["AAPL"]) is None
+
+
+def test_removed_client_leaves_the_index():
+    fanout = MarketFanout(max_rate=0)
+    client = fanout.add_client(symbols=["AAPL"])
+    fanout.remove_client(client)
+    fanout.publish("AAPL", "a")
+    assert fanout.stats()["indexedSymbols"] == 0 and fanout.stats()["avgFanout"] == 0.0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,37 @@
+"""
+Shared Market-Data Frame Tests
+
+Each quote update is encoded into one SSE frame that every /ibkr/stream client
+and the connect-time snapshot share.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+import serve_mock
+from serve_mock import SYMBOL_CONID_MAP, market_fanout, market_snapshot, process_market_data
+
+
+def test_one_frame_shared_by_every_client(monkeypatch):
+    monkeypatch.setattr(serve_mock, "market_simulator", None)
+    everything, apple = market_fanout.add_client(max_rate=1000), market_fanout.add_client(symbols=["AAPL"])
+    try:
+        process_market_data({"conid": SYMBOL_CONID_MAP["AAPL"], "31": "190.5", "84": "190.4", "86": "190.6"})
+        frame = dict(everything.drain_items(timeout=1))["AAPL"]
+        assert dict(apple.drain_items(timeout=1))["AAPL"] is frame
+        assert dict(market_snapshot(["AAPL"]))["AAPL"] is frame
+
+        assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+        message = json.loads(frame[len(b"data: "):])
+        assert message["type"] == "marketData" and message["symbol"] == "AAPL"
+        assert (message["last"], message["bid"], message["ask"]) == (190.5, 190.4, 190.6)
+    finally:
+        market_fanout.remove_client(everything)
+        market_fanout.remove_client(apple)
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,75 @@
+"""
+Ingest Process Writer Tests
+
+The WebSocket thread (ticks) and the stdin thread (polled snapshots) of the
+ingest process both write the shared quote table through one QuoteWriter.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+from market_ingest import QuoteWriter
+from shared_quotes import SharedQuoteTable
+
+ROWS_PER_THREAD = 5000
+
+
+def write_from_threads(writer, batches):
+    threads = [threading.Thread(target=lambda b=batch: [writer.apply([item]) for item in b]) for batch in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_two_threads_add_rows():
+    """Concurrent new-row allocation keeps every conid"""
+    table = SharedQuoteTable(create=True, capacity=2 * ROWS_PER_THREAD)
+    try:
+        writer = QuoteWriter(table)
+        ticks = [{"conid": c, "31": "1.5"} for c in range(1, ROWS_PER_THREAD + 1)]
+        snapshots = [{"conid": c, "31": "2.5"} for c in range(ROWS_PER_THREAD + 1, 2 * ROWS_PER_THREAD + 1)]
+        write_from_threads(writer, [ticks, snapshots])
+        assert len(table) == 2 * ROWS_PER_THREAD
+        assert sorted(table.conids()) == list(range(1, 2 * ROWS_PER_THREAD + 1))
+        assert table.get(1, 'last') == 1.5
+        assert table.get(2 * ROWS_PER_THREAD, 'last') == 2.5
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_two_threads_update_one_row():
+    """Concurrent updates of one conid leave its version even and readable"""
+    table = SharedQuoteTable(create=True, capacity=4)
+    try:
+        writer = QuoteWriter(table)
+        batch = [{"conid": 265598, "31": str(100 + i)} for i in range(ROWS_PER_THREAD)]
+        write_from_threads(writer, [batch, batch])
+        quote = table.quote(265598)
+        assert len(table) == 1
+        assert quote["seq"] == 2 * ROWS_PER_THREAD
+        assert quote["last"] == 100 + ROWS_PER_THREAD - 1
+    finally:
+        table.close()
+        table.unlink()
+
+
+def test_table_full_is_reported():
+    table = SharedQuoteTable(create=True, capacity=1)
+    try:
+        updates, errors = QuoteWriter(table).apply([{"conid": 1, "31": "1"}, {"conid": 2, "31": "2"}, {"31": "3"}])
+        assert updates == [(1, 1)]
+        assert len(errors) == 1
+    finally:
+        table.close()
+        table.unlink()
+
+
+if __name__ == "__main__":
+    test_two_threads_add_rows()
+    test_two_threads_update_one_row()
+    test_table_full_is_reported()
+    print("OK")
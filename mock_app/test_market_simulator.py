@@ -0,0 +1,49 @@
+"""
+Price Simulator Tests
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+from market_simulator import PriceSimulator
+
+INSTRUMENTS = {
+    "AAPL": {"price": 189.45, "reference": 187.13, "volatility": 0.0002, "spread": 0.0005, "decimals": 2},
+    "EUR/USD": {"price": 1.0850, "reference": 1.0830, "volatility": 0.0001, "spread": 0.0001, "decimals": 4},
+}
+
+
+def test_live_symbols_stop_and_resume():
+    sim = PriceSimulator(INSTRUMENTS, seed=1)
+    assert sim.set_live("AAPL") is True
+    assert sim.set_live("AAPL") is False
+    assert [q["symbol"] for q in sim.step()] == ["EUR/USD"]
+
+    # Feed dropped: continue from the last live price rather than the old simulated one
+    assert sim.resume({"AAPL": 200.0, "EUR/USD": 1.2, "TSLA": 250.0}) == ["AAPL"]
+    quotes = {q["symbol"]: q for q in sim.step(dt=0.001)}
+    assert set(quotes) == {"AAPL", "EUR/USD"}
+    assert abs(quotes["AAPL"]["last"] - 200.0) < 1.0
+    assert abs(quotes["EUR/USD"]["last"] - 1.085) < 0.01  # still simulated: price untouched
+
+
+def test_concurrent_set_live_reports_once():
+    """Relay threads racing on the first live tick: only one of them stops the simulation"""
+    for _ in range(50):
+        sim = PriceSimulator(INSTRUMENTS, seed=1)
+        start = threading.Barrier(4)
+        results = []
+
+        def go_live():
+            start.wait()
+            results.append(sim.set_live("AAPL"))
+
+        threads = [threading.Thread(target=go_live) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.count(True) == 1
+        assert not sim.is_simulated("AAPL")
@@ -0,0 +1,86 @@
+"""
+Binary Delta Wire Format Tests
+
+Whatever sequence of quotes the encoder sees, a decoder applying its frames in
+order ends up with the same quotes.
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from market_wire import FIELDS, FLAGS, DeltaDecoder, DeltaEncoder
+
+
+def quote(symbol, last=None, bid=None, ask=None, chg=None, delayed=False, simulated=False):
+    return {"symbol": symbol, "last": last, "bid": bid, "ask": ask, "chg": chg,
+            "isDelayed": delayed, "isSimulated": simulated}
+
+
+def round_trip(encoder, decoder, quotes):
+    symbols, frame = encoder.encode(quotes)
+    decoder.add_symbols(symbols)
+    return decoder.decode(frame) if frame is not None else []
+
+
+def test_round_trip_with_nulls_and_flag_changes():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    steps = [
+        [quote("AAPL", 190.5, 190.4, 190.6, 1.25), quote("EUR/USD", 1.0851, None, None, -0.0003)],
+        [quote("AAPL", 190.51, None, 190.6, 1.26, delayed=True)],     # bid goes null, delayed flag set
+        [quote("AAPL", 190.49, 190.45, 190.55, 1.24)],                # bid back, flag cleared
+        [quote("EUR/USD", 1.0851, 1.085, 1.0852, -0.0003, simulated=True)],
+    ]
+    for batch in steps:
+        assert round_trip(encoder, decoder, batch) == batch
+
+
+def test_unchanged_quotes_send_nothing():
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    first = quote("AAPL", 190.5, 190.4, 190.6)
+    round_trip(encoder, decoder, [first])
+    symbols, frame = encoder.encode([dict(first)])
+    assert symbols == {} and frame is None
+    assert encoder.stats()["frames"] == 1
+
+
+def test_small_moves_stay_small():
+    encoder = DeltaEncoder()
+    encoder.encode([quote("AAPL", 190.5, 190.4, 190.6, 1.25)])
+    _, frame = encoder.encode([quote("AAPL", 190.51, 190.41, 190.61, 1.26)])
+    assert len(frame) <= 16  # type, count, id, mask and four 3-byte deltas
+
+
+def test_random_sequences_round_trip():
+    rng = random.Random(7)
+    encoder, decoder = DeltaEncoder(), DeltaDecoder()
+    state = {s: quote(s, 100.0, 99.9, 100.1, 0.0) for s in ("A", "B", "C")}
+    for _ in range(500):
+        batch = []
+        for symbol in rng.sample(sorted(state), rng.randint(1, 3)):
+            q = dict(state[symbol])
+            for name in FIELDS:
+                roll = rng.random()
+                if roll < 0.1:
+                    q[name] = None
+                elif roll < 0.6:
+                    q[name] = round(rng.uniform(-500, 500), 6)
+            for name in FLAGS:
+                if rng.random() < 0.05:
+                    q[name] = not q[name]
+            state[symbol] = q
+            batch.append(q)
+        changed = round_trip(encoder, decoder, batch)
+        assert all(q == state[q["symbol"]] for q in changed)
+
+
+def test_unknown_frame_type():
+    with pytest.raises(ValueError):
+        DeltaDecoder().decode(b"\x02\x00")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
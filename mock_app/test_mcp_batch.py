@@ -0,0 +1,113 @@
+"""
+JSON-RPC Batch Tests
+
+Every entry of a batch gets exactly one response slot, whether it was answered
+inline, ran on the worker pool, was rejected by the per-session cap or was
+cancelled with its session.
+"""
+
+import os
+import queue
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+import serve_mock
+from serve_mock import (MCP_ERROR_REQUEST_CANCELLED, MCP_ERROR_SERVER_BUSY, cancel_mcp_session_work,
+                        dispatch_mcp_batch, end_mcp_http_session, mcp_client, mcp_http_sessions,
+                        mcp_sse_lock, new_mcp_session_queue)
+from tool_pool import ToolCallPool
+
+SESSION = "batch-test"
+
+
+def call(mid, name="get_quote"):
+    return {"jsonrpc": "2.0", "id": mid, "method": "tools/call", "params": {"name": name, "arguments": {}}}
+
+
+@pytest.fixture
+def session():
+    session = {"queue": new_mcp_session_queue(SESSION)}
+    with mcp_sse_lock:
+        mcp_http_sessions[SESSION] = session
+    yield SESSION
+    end_mcp_http_session(SESSION)
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    """Tool calls block until the gate opens; started counts calls that reached the tool"""
+    opened, started = threading.Event(), queue.Queue()
+
+    def call_tool(name, args):
+        started.put(name)
+        opened.wait(5)
+        return {"ok": True}
+
+    monkeypatch.setattr(mcp_client, "call_tool", call_tool)
+    yield opened, started
+    opened.set()
+
+
+def use_pool(monkeypatch, **kwargs):
+    pool = ToolCallPool(**kwargs)
+    monkeypatch.setattr(serve_mock, "mcp_tool_pool", pool)
+    return pool
+
+
+def run_batch(messages):
+    done = queue.Queue()
+    dispatch_mcp_batch(SESSION, messages, done.put)
+    return done
+
+
+def test_batch_answers_every_entry_in_order(monkeypatch, session, gate):
+    use_pool(monkeypatch, max_workers=2)
+    gate[0].set()
+    done = run_batch([{"jsonrpc": "2.0", "id": 1, "method": "ping"}, "junk", call(2),
+                      {"jsonrpc": "2.0", "method": "notifications/initialized"}])
+    responses = done.get(timeout=5)
+    assert [r["id"] for r in responses] == [1, None, 2]
+    assert responses[1]["error"]["code"] == -32600
+    assert responses[2]["result"]["isError"] is False
+
+
+def test_session_cap_rejects_extra_batch_entries(monkeypatch, session, gate):
+    use_pool(monkeypatch, max_workers=4, max_per_session=2)
+    opened, _ = gate
+    done = run_batch([call(1), call(2), call(3)])
+    opened.set()
+    responses = done.get(timeout=5)
+    assert "result" in responses[0] and "result" in responses[1]
+    assert responses[2]["error"]["code"] == MCP_ERROR_SERVER_BUSY
+
+
+def test_cancelled_calls_still_fill_their_slots(monkeypatch, session, gate):
+    pool = use_pool(monkeypatch, max_workers=1, max_per_session=4)
+    opened, started = gate
+    done = run_batch([call(1), call(2), call(3)])
+    started.get(timeout=5)  # call 1 holds the only worker, 2 and 3 are queued
+
+    cancel_mcp_session_work(SESSION)
+    assert done.empty()  # the running call has not answered yet
+    opened.set()
+    responses = done.get(timeout=5)
+    assert [r["id"] for r in responses] == [1, 2, 3]
+    assert all(r["error"]["code"] == MCP_ERROR_REQUEST_CANCELLED for r in responses)
+    assert pool.stats()["cancelled"] == 2
+    assert pool.stats()["activeSessions"] == 0
+
+
+def test_batch_for_a_gone_session_completes(monkeypatch, gate):
+    use_pool(monkeypatch, max_workers=1)
+    done = run_batch([call(1), {"jsonrpc": "2.0", "id": 2, "method": "ping"}])
+    responses = done.get(timeout=5)
+    assert responses[0]["error"]["code"] == MCP_ERROR_REQUEST_CANCELLED
+    assert responses[1]["result"] == {}
+    assert gate[1].empty()  # the tool never ran
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,93 @@
+"""
+MCP Streamable HTTP Transport Tests
+
+POST /mcp answers on the same response (JSON, or SSE for tools/call when the
+client accepts it), GET /mcp carries server-initiated messages, DELETE /mcp
+ends the session.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from serve_mock import (MCP_HTTP_PROTOCOL_VERSION, MCP_SESSION_HEADER, app, mcp_client, send_mcp_notification,
+                        tool_registry)
+
+
+def rpc(mid, method, **params):
+    return {"jsonrpc": "2.0", "id": mid, "method": method, "params": params}
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def session(client):
+    response = client.post("/mcp", json=rpc(1, "initialize", protocolVersion=MCP_HTTP_PROTOCOL_VERSION))
+    assert response.status_code == 200
+    assert response.get_json()["result"]["protocolVersion"] == MCP_HTTP_PROTOCOL_VERSION
+    session_id = response.headers[MCP_SESSION_HEADER]
+    yield {MCP_SESSION_HEADER: session_id}
+    client.delete("/mcp", headers={MCP_SESSION_HEADER: session_id})
+
+
+def test_session_header_is_required(client):
+    assert client.post("/mcp", json=rpc(1, "ping")).status_code == 400
+    assert client.post("/mcp", json=rpc(1, "ping"), headers={MCP_SESSION_HEADER: "nope"}).status_code == 404
+    assert client.post("/mcp", data="not json").status_code == 400
+
+
+def test_inline_methods(client, session):
+    tools = client.post("/mcp", json=rpc(2, "tools/list"), headers=session).get_json()
+    assert tools["id"] == 2
+    assert tools["result"]["_meta"]["registryVersion"] == tool_registry.version
+    assert len(tools["result"]["tools"]) == len(tool_registry.tools)
+
+    notification = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+    assert client.post("/mcp", json=notification, headers=session).status_code == 202
+
+
+def test_tools_call_as_json_and_as_sse(client, session, monkeypatch):
+    monkeypatch.setattr(mcp_client, "call_tool", lambda name, args: {"echo": args})
+    call = rpc(3, "tools/call", name="get_quote", arguments={"symbol": "AAPL"})
+
+    response = client.post("/mcp", json=call, headers=session).get_json()
+    assert json.loads(response["result"]["content"][0]["text"]) == {"echo": {"symbol": "AAPL"}}
+
+    streamed = client.post("/mcp", json=call, headers={**session, "Accept": "application/json, text/event-stream"})
+    assert streamed.mimetype == "text/event-stream"
+    events = [line[len("data: "):] for line in streamed.get_data(as_text=True).splitlines() if line.startswith("data: ")]
+    assert json.loads(events[-1])["id"] == 3
+
+
+def test_batch(client, session, monkeypatch):
+    monkeypatch.setattr(mcp_client, "call_tool", lambda name, args: {"ok": True})
+    response = client.post("/mcp", json=[rpc(4, "ping"), rpc(5, "tools/call", name="get_orders")], headers=session)
+    assert [r["id"] for r in response.get_json()] == [4, 5]
+    assert client.post("/mcp", json=[], headers=session).status_code == 400
+
+
+def test_get_stream_delivers_notifications(client, session):
+    notification = {"jsonrpc": "2.0", "method": "notifications/resources/updated", "params": {"uri": "ibkr://x"}}
+    assert send_mcp_notification(session[MCP_SESSION_HEADER], notification)
+    response = client.get("/mcp", headers=session, buffered=False)
+    frames = iter(response.response)
+    frame = next(frames)
+    frame = frame.decode() if isinstance(frame, bytes) else frame
+    assert "notifications/resources/updated" in frame
+    response.close()
+
+
+def test_delete_ends_the_session(client, session):
+    assert client.delete("/mcp", headers=session).status_code == 204
+    assert client.post("/mcp", json=rpc(6, "ping"), headers=session).status_code == 404
+    assert client.delete("/mcp", headers=session).status_code == 404
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,59 @@
+"""
+ask_analyst Progress Tests
+
+A tools/call carrying params._meta.progressToken gets notifications/progress
+for each stage and notifications/tools/partialResult for streamed text, all
+ahead of its result.
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+import serve_mock
+from serve_mock import CancelToken, run_mcp_tool
+
+LOCAL_CONFIG = {"provider": "local", "model": "test", "url": "http://localhost:0"}
+
+
+class Upstream:
+    def close(self):
+        pass
+
+
+def ask(monkeypatch, progress_token):
+    def openai_call(*args, stream=False, **kwargs):
+        return Upstream() if stream else {"content": "Hello"}
+
+    monkeypatch.setattr(serve_mock, "openai_call", openai_call)
+    monkeypatch.setattr(serve_mock, "parse_openai_sse", lambda response: iter(["Hel", "lo"]))
+    delivered = []
+    args = {"query": "How is the market?", "logs": [], "config": LOCAL_CONFIG, "enable_trading": False}
+    run_mcp_tool("progress-test", 7, "ask_analyst", args, CancelToken(), delivered.append, progress_token)
+    return delivered
+
+
+def test_progress_then_partial_text_then_result(monkeypatch):
+    delivered = ask(monkeypatch, "tok-1")
+    *notifications, result = delivered
+    stages = [n for n in notifications if n["method"] == "notifications/progress"]
+    partials = [n for n in notifications if n["method"] == "notifications/tools/partialResult"]
+
+    assert stages and all(n["params"]["progressToken"] == "tok-1" for n in notifications)
+    assert [n["params"]["progress"] for n in stages] == list(range(1, len(stages) + 1))
+    assert "Querying local model test" in stages[0]["params"]["message"]
+    assert [n["params"]["content"][0]["text"] for n in partials] == ["Hel", "lo"]
+    assert result["id"] == 7
+    assert json.loads(result["result"]["content"][0]["text"])["analysis"] == "Hello"
+
+
+def test_no_notifications_without_progress_token(monkeypatch):
+    delivered = ask(monkeypatch, None)
+    assert len(delivered) == 1 and "method" not in delivered[0]
+    assert json.loads(delivered[0]["result"]["content"][0]["text"])["analysis"] == "Hello"
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
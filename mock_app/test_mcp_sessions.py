@@ -0,0 +1,151 @@
+"""
+Bounded MCP Session Queue Tests
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from mcp_sessions import POLICY_DISCONNECT, SessionQueue, encode_message, parse_event_id
+
+
+def response(mid):
+    return {"jsonrpc": "2.0", "id": mid, "result": {}}
+
+
+def notification(n):
+    return {"jsonrpc": "2.0", "method": "notifications/progress", "params": {"progress": n}}
+
+
+def data(frame):
+    return json.loads(frame.split("data: ", 1)[1])
+
+
+def drain(queue):
+    frames = []
+    while True:
+        frame = queue.get(timeout=0)
+        if not frame:
+            return frames
+        frames.append(data(frame))
+
+
+def test_frames_carry_session_event_ids():
+    queue = SessionQueue("s1")
+    queue.put(response(1))
+    queue.put('{"jsonrpc":"2.0","id":2,"result":{}}')  # pre-encoded JSON goes in as-is
+    first, second = queue.get(timeout=0), queue.get(timeout=0)
+    assert first.startswith("id: s1:1\nevent: message\ndata: ")
+    assert second.startswith("id: s1:2\n") and data(second)["id"] == 2
+    assert queue.get(timeout=0) == ""
+
+
+def test_drop_oldest_notifications_keeps_responses():
+    queue = SessionQueue("s1", max_messages=3)
+    for message in (notification(1), response(1), notification(2), notification(3)):
+        assert queue.put(message)
+    assert [m.get("id", m.get("params", {}).get("progress")) for m in drain(queue)] == [1, 2, 3]
+    assert queue.stats()["droppedNotifications"] == 1
+    assert queue.stats()["highWaterMessages"] == 3
+
+
+def test_responses_alone_over_the_limit_disconnect():
+    queue = SessionQueue("s1", max_messages=2)
+    assert queue.put(response(1)) and queue.put(response(2))
+    assert not queue.put(response(3))
+    assert queue.closed and queue.close_reason == "slow_consumer"
+    assert queue.get(timeout=0) is None
+
+
+def test_disconnect_policy_closes_on_first_overflow():
+    queue = SessionQueue("s1", max_messages=1, policy=POLICY_DISCONNECT)
+    assert queue.put(notification(1))
+    assert not queue.put(notification(2))
+    assert queue.close_reason == "slow_consumer"
+
+
+def test_byte_limit():
+    queue = SessionQueue("s1", max_bytes=300)
+    big = {"jsonrpc": "2.0", "method": "notifications/message", "params": {"data": "x" * 150}}
+    assert queue.put(big) and queue.put(big)  # the second evicts the first
+    assert queue.stats()["depth"] == 1 and queue.stats()["bytes"] <= 300
+    assert queue.stats()["droppedNotifications"] == 1
+
+
+def test_closed_queue_rejects_puts():
+    queue = SessionQueue("s1")
+    queue.put(response(1))
+    queue.close()
+    assert not queue.put(response(2))
+    assert queue.get(timeout=0) is None
+    assert queue.stats()["rejectedClosed"] == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SessionQueue("s1", policy="block")
+
+
+def test_encode_batches():
+    assert json.loads(encode_message([response(1), '{"id":2}'])) == [response(1), {"id": 2}]
+
+
+def test_replay_after_last_event_id():
+    queue = SessionQueue("s1", replay_size=3)
+    for mid in range(1, 5):
+        queue.put(response(mid))
+    drain(queue)
+    assert [data(f)["id"] for f in queue.replay_after(2)] == [3, 4]
+    assert queue.replay_after(4) == []
+    assert queue.replay_after(0) is None  # frame 1 has left the buffer: a gap
+
+
+def test_replay_ttl(monkeypatch):
+    queue = SessionQueue("s1", replay_ttl=10)
+    queue.put(response(1))
+    drain(queue)
+    assert len(queue.replay_after(0)) == 1
+    later = time.monotonic() + 11
+    monkeypatch.setattr(time, "monotonic", lambda: later)
+    assert queue.replay_after(0) is None
+
+
+def test_attach_supersedes_the_old_consumer():
+    queue = SessionQueue("s1")
+    old = queue.attach()
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(queue.get(timeout=5, owner=old)))
+    waiter.start()
+    new = queue.attach()
+    waiter.join(5)
+    assert woken == [None]  # the old stream ends
+
+    queue.put(response(1))  # undelivered frames flow to the new consumer
+    assert data(queue.get(timeout=0, owner=new))["id"] == 1
+    assert queue.get(timeout=0, owner=old) is None
+
+
+def test_detach_waits_for_resume():
+    queue = SessionQueue("s1")
+    owner = queue.attach()
+    queue.detach(owner + 1)  # not the current consumer: ignored
+    assert queue.attached
+    queue.detach(owner)
+    assert not queue.attached and queue.detached_for() >= 0
+    queue.attach()
+    assert queue.attached and queue.detached_for() == 0.0
+
+
+def test_parse_event_id():
+    assert parse_event_id("a:b:12") == ("a:b", 12)
+    assert parse_event_id("abc") == (None, 0)
+    assert parse_event_id(None) == (None, 0)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,57 @@
+"""
+Array-backed Quote Table Tests
+"""
+
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from quote_store import QuoteStore, parse_price
+
+
+def test_partial_updates_merge_in_place():
+    store = QuoteStore()
+    assert store.update(265598, {"31": "190.5", "84": "190.4", "86": "190.6", "6509": "RB"}) == 1
+    assert store.update(265598, {"84": "190.45", "conid": 265598, "_updated": 1}) == 2
+    quote = store.quote(265598)
+    assert (quote["last"], quote["bid"], quote["ask"]) == (190.5, 190.45, 190.6)
+    assert quote["volume"] is None  # not received yet
+    assert quote["isDelayed"] is False and quote["seq"] == 2
+    assert store.quote(265598, ("last",)).keys() == {"last", "isDelayed", "seq", "updated"}
+
+
+def test_delayed_prices():
+    store = QuoteStore()
+    store.update(1, {"31": "C270.01", "6509": "DPB"})
+    assert store.get(1, "last") == 270.01
+    assert store.quote(1)["isDelayed"] is True
+
+
+def test_unknown_conid():
+    store = QuoteStore()
+    assert store.quote(1) is None and store.get(1, "last") is None
+    assert 1 not in store and len(store) == 0
+
+
+def test_rows_grow_past_capacity():
+    store = QuoteStore(capacity=2)
+    for conid in range(1, 6):
+        store.update(conid, {"31": str(conid * 10)})
+    assert len(store) == 5 and store.conids() == [1, 2, 3, 4, 5]
+    assert [store.get(c, "last") for c in range(1, 6)] == [10, 20, 30, 40, 50]
+    stats = store.stats()
+    assert (stats["rows"], stats["capacity"], stats["updates"]) == (5, 8, 5)
+
+
+def test_parse_price():
+    assert parse_price("190.5") == 190.5
+    assert parse_price("C270.01") == 270.01
+    assert parse_price("1,234") == 1234.0
+    assert parse_price("-1.5e2") == -150.0
+    assert math.isnan(parse_price(None)) and math.isnan(parse_price("n/a"))
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
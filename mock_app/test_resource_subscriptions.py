@@ -0,0 +1,55 @@
+"""
+MCP Resource Subscription Tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from resource_subscriptions import ResourceSubscriptions
+
+URI = "ibkr://live/quote/AAPL"
+
+
+def make():
+    sent = []
+    subs = ResourceSubscriptions(notify=lambda sid, msg: sent.append((sid, msg["params"]["uri"])) or True)
+    return subs, sent
+
+
+def test_first_content_after_subscribing_without_data_notifies():
+    """Subscribe before the first tick: the first price is a change"""
+    subs, sent = make()
+    subs.subscribe("s1", URI, content=None)
+    assert subs.publish(URI, {"last": 190.5}) == 1
+    assert sent == [("s1", URI)]
+    assert subs.publish(URI, {"last": 190.5}) == 0
+    assert subs.publish(URI, {"last": 190.6}) == 1
+
+
+def test_subscribe_content_is_the_baseline():
+    subs, sent = make()
+    subs.subscribe("s1", URI, content={"last": 190.5})
+    assert subs.publish(URI, {"last": 190.5}) == 0
+    assert subs.publish(URI, {"last": 191.0}) == 1
+    assert subs.stats()["unchanged"] == 1
+
+
+def test_unwatched_and_dropped_sessions():
+    subs, sent = make()
+    assert subs.publish(URI, {"last": 1}) == 0
+    subs.subscribe("s1", URI)
+    subs.subscribe("s2", URI)
+    assert subs.drop_session("s1") == 1
+    subs.publish(URI, {"last": 2})
+    assert sent == [("s2", URI)]
+    assert subs.unsubscribe("s2", URI) is True
+    assert not subs.watching(URI)
+
+
+def test_gone_session_is_dropped_on_notify():
+    subs = ResourceSubscriptions(notify=lambda sid, msg: sid != "gone")
+    subs.subscribe("gone", URI)
+    subs.subscribe("ok", URI)
+    assert subs.publish(URI, {"last": 1}) == 1
+    assert subs.stats()["subscriptions"] == 1
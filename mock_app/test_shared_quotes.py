@@ -0,0 +1,53 @@
+"""
+Shared-Memory Quote Table Tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from shared_quotes import HEADER_SIZE, SEQ, SharedQuoteTable
+
+
+def test_reader_sees_writer_updates():
+    table = SharedQuoteTable(create=True, capacity=4)
+    writer = SharedQuoteTable(name=table.name)
+    try:
+        writer.update(265598, {"31": "C190.5", "6509": "DPB"})
+        quote = table.quote(265598)
+        assert quote["last"] == 190.5
+        assert quote["isDelayed"] is True
+        assert quote["seq"] == 1
+    finally:
+        writer.close()
+        table.close()
+        table.unlink()
+
+
+def test_writer_killed_mid_update():
+    """A new writer recovers a row whose sequence a killed writer left odd"""
+    table = SharedQuoteTable(create=True, capacity=4)
+    writer = SharedQuoteTable(name=table.name)
+    try:
+        writer.update(265598, {"31": "100"})
+        # What a writer terminated inside update() leaves behind: the row marked in progress
+        SEQ.pack_into(table._shm.buf, HEADER_SIZE, SEQ.unpack_from(table._shm.buf, HEADER_SIZE)[0] + 1)
+        writer.close()
+
+        replacement = SharedQuoteTable(name=table.name)
+        replacement.update(265598, {"31": "101"})
+        quote = table.quote(265598)
+        assert quote["last"] == 101.0
+        assert SEQ.unpack_from(table._shm.buf, HEADER_SIZE)[0] % 2 == 0
+        replacement.update(265598, {"31": "102"})
+        assert table.quote(265598)["seq"] > quote["seq"]
+        replacement.close()
+    finally:
+        table.close()
+        table.unlink()
+
+
+if __name__ == "__main__":
+    test_reader_sees_writer_updates()
+    test_writer_killed_mid_update()
+    print("OK")
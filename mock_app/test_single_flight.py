@@ -0,0 +1,96 @@
+"""
+Single-Flight Gateway Call Tests
+
+Concurrent identical read calls share one gateway request; each caller still
+gets a result of its own.
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from ibkr_gateway_client import SingleFlight, single_flight
+
+
+class Gateway:
+    """Counts gateway requests; each blocks until released"""
+
+    def __init__(self):
+        self._flights = SingleFlight()
+        self.release = threading.Event()
+        self.requests = []
+
+    @single_flight(sets=('conids',))
+    def snapshot(self, conids, fields=None):
+        self.requests.append((list(conids), fields))
+        self.release.wait(5)
+        return {"items": [{"conid": c} for c in conids]}
+
+    @single_flight
+    def fail(self):
+        self.requests.append("fail")
+        self.release.wait(5)
+        raise RuntimeError("gateway down")
+
+
+def shared(count):
+    return lambda gateway: gateway._flights.stats()["shared"] >= count
+
+
+def call_concurrently(calls, gateway, ready):
+    """Run calls on threads; the gateway answers once ready(gateway) holds"""
+    results, errors = [None] * len(calls), [None] * len(calls)
+
+    def run(i, fn):
+        try:
+            results[i] = fn()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, fn)) for i, fn in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while not ready(gateway) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    gateway.release.set()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_followers_get_their_own_copy():
+    gateway = Gateway()
+    results, _ = call_concurrently([lambda: gateway.snapshot([1, 2])] * 3, gateway, shared(2))
+    assert len(gateway.requests) == 1
+    assert results[0] == results[1] == results[2]
+    results[1]["items"].append({"conid": 3})
+    assert len(results[0]["items"]) == 2 and len(results[2]["items"]) == 2
+
+
+def test_only_set_arguments_ignore_order():
+    gateway = Gateway()
+    call_concurrently([lambda: gateway.snapshot([1, 2], ["31", "84"]),
+                       lambda: gateway.snapshot(["2", 1], ["31", "84"])], gateway, shared(1))
+    assert len(gateway.requests) == 1
+
+    gateway = Gateway()
+    call_concurrently([lambda: gateway.snapshot([1, 2], ["31", "84"]),
+                       lambda: gateway.snapshot([1, 2], ["84", "31"])], gateway, lambda g: len(g.requests) == 2)
+    assert len(gateway.requests) == 2
+
+
+def test_failure_reaches_every_caller():
+    gateway = Gateway()
+    _, errors = call_concurrently([gateway.fail] * 2, gateway, shared(1))
+    assert gateway.requests == ["fail"]
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert gateway._flights.stats()["inFlight"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,38 @@
+"""
+Stream Symbol Demand Tests
+
+An /ibkr/stream client's symbols are its own market-data demand: nothing is
+pinned server-side, and dropping a symbol from the stream releases its line.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from serve_mock import PRIORITY_WATCHLIST, SYMBOL_CONID_MAP, app, market_fanout, subscriptions
+
+
+def test_removing_a_stream_symbol_sends_umd(monkeypatch):
+    sent = []
+    monkeypatch.setattr(subscriptions, "_send", lambda message: sent.append(message) or True)
+    assert subscriptions.state("MSFT") == "idle"  # no server-side default watchlist
+
+    client = market_fanout.add_client(symbols=["AAPL", "MSFT"])
+    source = f"stream:{client.client_id}"
+    try:
+        subscriptions.set_source(source, client.symbols, PRIORITY_WATCHLIST)
+        assert subscriptions.state("MSFT") == "streaming"
+
+        response = app.test_client().post(f"/ibkr/stream/{client.client_id}/symbols", json={"remove": ["MSFT"]})
+        assert response.get_json()["symbols"] == ["AAPL"]
+        assert f"umd+{SYMBOL_CONID_MAP['MSFT']}+{{}}" in sent
+        assert subscriptions.state("MSFT") == "idle"
+        assert subscriptions.state("AAPL") == "streaming"
+    finally:
+        market_fanout.remove_client(client)
+        subscriptions.release_source(source)
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,96 @@
+"""
+Subscription Manager Tests
+
+Runs without a gateway: send/resolve/snapshot are in-memory fakes.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+from subscription_manager import PRIORITY_POSITION, PRIORITY_WATCHLIST, SubscriptionManager
+
+CONIDS = {"AAPL": 1, "MSFT": 2, "TSLA": 3, "NVDA": 4, "AMZN": 5}
+
+
+class FakeGateway:
+    """Records smd/umd in arrival order and tracks which conids it streams"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = []
+        self.streaming = set()
+
+    def send(self, message):
+        command, conid, _ = message.split('+', 2)
+        time.sleep(random.random() / 1000)  # widen the window between compute and send
+        with self.lock:
+            self.sent.append(message)
+            (self.streaming.add if command == 'smd' else self.streaming.discard)(int(conid))
+        return True
+
+
+def make_manager(gateway, max_lines=2):
+    return SubscriptionManager(send=gateway.send, resolve=lambda symbol: None, snapshot=lambda conids: [],
+                               on_snapshot=lambda items: None, symbol_conids=dict(CONIDS),
+                               conid_symbols={c: s for s, c in CONIDS.items()}, fields=["31"],
+                               max_lines=max_lines)
+
+
+def test_line_budget_and_priority():
+    gateway = FakeGateway()
+    manager = make_manager(gateway)
+    manager.set_source("default", ["AAPL", "MSFT", "TSLA"], PRIORITY_WATCHLIST)
+    assert manager.stats()["streaming"] == ["AAPL", "MSFT"]
+    assert manager.state("TSLA") == "polled"
+    assert manager.acquire("TSLA", "portfolio", PRIORITY_POSITION) == "streaming"
+    assert manager.state("MSFT") == "polled"
+    assert gateway.streaming == {1, 3}
+    manager.release("TSLA", "portfolio")
+    assert gateway.streaming == {1, 2}
+
+
+def test_overlapping_rebalances_keep_gateway_in_sync():
+    """Concurrent acquire/release leave the gateway streaming exactly the manager's set"""
+    gateway = FakeGateway()
+    manager = make_manager(gateway)
+    manager.set_source("default", ["AAPL", "MSFT"], PRIORITY_WATCHLIST)
+
+    def churn(source):
+        for _ in range(300):
+            symbol = random.choice(list(CONIDS))
+            manager.acquire(symbol, source, random.choice([PRIORITY_POSITION, PRIORITY_WATCHLIST]))
+            manager.release(symbol, source)
+
+    threads = [threading.Thread(target=churn, args=(f"stream:{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Each conid's smd/umd must arrive in the order the manager changed state: strictly alternating
+    last = {}
+    for message in gateway.sent:
+        command, conid, _ = message.split('+', 2)
+        assert last.get(conid) != command, f"{command} {conid} out of order"
+        last[conid] = command
+    assert gateway.streaming == {CONIDS[s] for s in manager.stats()["streaming"]}
+
+
+def test_resubscribe_sends_current_set():
+    gateway = FakeGateway()
+    manager = make_manager(gateway)
+    manager.set_source("default", ["AAPL", "MSFT", "TSLA"], PRIORITY_WATCHLIST)
+    manager.disconnected()
+    gateway.sent.clear()
+    manager.resubscribe()
+    assert sorted(gateway.sent) == ['smd+1+{"fields": ["31"]}', 'smd+2+{"fields": ["31"]}']
+
+
+if __name__ == "__main__":
+    test_line_budget_and_priority()
+    test_overlapping_rebalances_keep_gateway_in_sync()
+    test_resubscribe_sends_current_set()
+    print("OK")
@@ -0,0 +1,57 @@
+"""
+Tick Capture Tests
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+from tick_capture import TickCapture, capture_files, load_relay, read_capture, replay
+
+
+def test_round_trip_with_rotation(tmp_path):
+    capture = TickCapture(str(tmp_path), max_bytes=2000, max_files=3, flush_interval=0.01)
+    messages = [json.dumps([{"conid": 265598, "31": str(100 + i)}]) for i in range(100)]
+    for i, message in enumerate(messages):
+        capture.write(message if i % 2 else message.encode('utf-8'), ts=1000.0 + i)
+    capture.close()
+
+    files = capture_files(str(tmp_path))
+    assert len(files) == 3  # older files pruned
+    records = [record for path in files for record in read_capture(path)]
+    assert capture.stats()["records"] == 100
+    assert records[-1] == (1099.0, messages[-1].encode('utf-8'))
+    assert [ts for ts, _ in records] == sorted(ts for ts, _ in records)
+
+
+def test_write_does_no_file_io(tmp_path):
+    """write() only buffers; the writer thread creates and fills the file"""
+    capture = TickCapture(str(tmp_path), flush_interval=3600)
+    capture.write("hb", ts=1.0)
+    assert capture_files(str(tmp_path)) == []
+    assert capture.stats()["buffered"] == 1
+    capture.close()
+    assert list(read_capture(capture_files(str(tmp_path))[0])) == [(1.0, b"hb")]
+
+
+def test_full_buffer_drops_oldest(tmp_path):
+    capture = TickCapture(str(tmp_path), flush_interval=3600, buffer_size=2)
+    for i in range(5):
+        capture.write(str(i), ts=float(i))
+    capture.close()
+    assert capture.stats()["dropped"] == 3
+    assert [payload for _, payload in read_capture(capture_files(str(tmp_path))[0])] == [b"3", b"4"]
+
+
+def test_replay_through_injected_relay(tmp_path):
+    capture = TickCapture(str(tmp_path), flush_interval=3600)
+    capture.write(json.dumps([{"conid": 1, "31": "10"}, {"conid": 2, "31": "20"}, {"topic": "sts"}]), ts=1.0)
+    capture.write("hb", ts=1.5)
+    capture.write(json.dumps({"conid": 1, "31": "11"}), ts=2.0)
+    capture.close()
+
+    seen = []
+    result = replay(capture_files(str(tmp_path)), load_relay(seen.append), speed=None)
+    assert [(item["conid"], item["31"]) for item in seen] == [(1, "10"), (2, "20"), (1, "11")]
+    assert (result["messages"], result["updates"], result["skipped"]) == (2, 3, 1)
@@ -0,0 +1,61 @@
+"""
+Tick History and OHLCV Bar Tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from tick_history import BarSeries, TickHistory, TickRing
+
+
+def test_tick_ring_wraps():
+    ring = TickRing(capacity=3)
+    for i in range(5):
+        ring.append(100.0 + i, 10.0 + i, 1.0)
+    assert [t["p"] for t in ring.ticks()] == [12.0, 13.0, 14.0]
+    assert [t["p"] for t in ring.ticks(since=102.0)] == [13.0, 14.0]
+    assert [t["p"] for t in ring.ticks(limit=1)] == [14.0]
+
+
+def test_bars_aggregate_ticks():
+    bars = BarSeries(seconds=60, capacity=10)
+    for ts, price, size in ((60.0, 10.0, 1), (70.0, 12.0, 2), (80.0, 9.0, 3), (119.9, 11.0, 4), (120.0, 11.5, 5)):
+        bars.add(ts, price, size)
+    assert bars.bars() == [
+        {"t": 60.0, "o": 10.0, "h": 12.0, "l": 9.0, "c": 11.0, "v": 10.0, "n": 4},
+        {"t": 120.0, "o": 11.5, "h": 11.5, "l": 11.5, "c": 11.5, "v": 5.0, "n": 1},
+    ]
+    assert [b["t"] for b in bars.bars(since=120.0)] == [120.0]
+
+
+def test_bar_ring_wraps():
+    bars = BarSeries(seconds=1, capacity=3)
+    for second in range(5):
+        bars.add(float(second), float(second), 1.0)
+    assert [b["t"] for b in bars.bars()] == [2.0, 3.0, 4.0]
+
+
+def test_late_tick_does_not_rewrite_a_closed_bar():
+    history = TickHistory(intervals={"1m": (60, 10)})
+    history.record("AAPL", 130.0, 10.0)
+    history.record("AAPL", 70.0, 99.0)  # belongs to the 60s bar, which is already closed
+    assert [b["t"] for b in history.bars("AAPL", "1m")] == [120.0]
+    assert history.bars("AAPL", "1m")[0]["h"] == 10.0
+    assert [t["p"] for t in history.ticks("AAPL")] == [10.0, 99.0]  # still in the tick ring
+
+
+def test_history_per_symbol():
+    history = TickHistory(tick_capacity=8)
+    history.record("AAPL", 1.0, 10.0, size=100)
+    assert history.bars("MSFT", "1s") == [] and history.ticks("MSFT") == []
+    assert history.symbols() == ["AAPL"]
+    assert history.stats()["ticksRecorded"] == 1
+    with pytest.raises(KeyError):
+        history.bars("AAPL", "1h")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,96 @@
+"""
+Bounded Tool Call Pool Tests
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from tool_pool import ToolCallPool, ToolPoolFull
+
+
+@pytest.fixture
+def gate():
+    opened = threading.Event()
+    yield opened
+    opened.set()
+
+
+def blocked(gate, started=None):
+    def call():
+        if started is not None:
+            started.release()
+        gate.wait(5)
+        return "done"
+    return call
+
+
+def test_runs_calls_and_reports_stats():
+    pool = ToolCallPool(max_workers=2)
+    futures = [pool.submit("s1", lambda i=i: i * 2) for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [0, 2, 4, 6, 8]
+    failing = pool.submit("s1", lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        failing.result(timeout=5)
+    stats = pool.stats()
+    assert (stats["submitted"], stats["completed"], stats["failed"]) == (6, 5, 1)
+    assert (stats["queueDepth"], stats["running"], stats["activeSessions"]) == (0, 0, 0)
+
+
+def test_per_session_cap(gate):
+    pool = ToolCallPool(max_workers=4, max_per_session=2)
+    running = [pool.submit("s1", blocked(gate)) for _ in range(2)]
+    with pytest.raises(ToolPoolFull) as rejected:
+        pool.submit("s1", blocked(gate))
+    assert rejected.value.reason == "session_limit"
+    other = pool.submit("s2", lambda: "other")  # other sessions are not affected
+    assert other.result(timeout=5) == "other"
+
+    gate.set()
+    for future in running:
+        future.result(timeout=5)
+    assert pool.submit("s1", lambda: "again").result(timeout=5) == "again"
+    assert pool.stats()["rejectedSessionLimit"] == 1
+
+
+def test_full_queue_rejects(gate):
+    pool = ToolCallPool(max_workers=1, max_queue=2, max_per_session=10)
+    started = threading.Semaphore(0)
+    first = pool.submit("s1", blocked(gate, started))
+    assert started.acquire(timeout=5)  # holds the only worker
+    queued = [pool.submit(f"s{i}", lambda: "queued") for i in range(2)]
+    with pytest.raises(ToolPoolFull) as rejected:
+        pool.submit("s9", lambda: "too many")
+    assert rejected.value.reason == "queue_full"
+    assert pool.stats()["queueDepth"] == 2
+
+    gate.set()
+    assert first.result(timeout=5) == "done"
+    assert [f.result(timeout=5) for f in queued] == ["queued", "queued"]
+    assert pool.stats()["rejectedQueueFull"] == 1
+
+
+def test_cancelled_future_releases_its_slots(gate):
+    pool = ToolCallPool(max_workers=1, max_queue=1, max_per_session=2)
+    started = threading.Semaphore(0)
+    running = pool.submit("s1", blocked(gate, started))
+    assert started.acquire(timeout=5)
+    queued = pool.submit("s1", lambda: "never")
+    with pytest.raises(ToolPoolFull):
+        pool.submit("s1", lambda: "over the cap")
+
+    assert queued.cancel()
+    stats = pool.stats()
+    assert (stats["cancelled"], stats["queueDepth"]) == (1, 0)
+    replacement = pool.submit("s1", lambda: "replacement")  # both the queue and session slot are free again
+    gate.set()
+    assert running.result(timeout=5) == "done"
+    assert replacement.result(timeout=5) == "replacement"
+    assert pool.stats()["activeSessions"] == 0
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
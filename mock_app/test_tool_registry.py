@@ -0,0 +1,55 @@
+"""
+Tool Registry Tests
+
+The registry's collections are frozen and encoded once; callers of
+list_tools() still get plain dicts they may modify.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from ibkr_gateway_client import IBKR_TOOLS, IBKR_TOOLS_JSON, ibkr_gateway_client
+from tool_registry import ToolRegistry
+
+TOOL = {"name": "get_quote", "description": "Quote", "inputSchema": {"type": "object", "properties": {}}}
+
+
+def test_list_tools_returns_plain_dicts():
+    tools = ibkr_gateway_client.list_tools()
+    assert isinstance(tools, list) and all(type(t) is dict for t in tools)
+    assert [t["name"] for t in tools] == [t["name"] for t in IBKR_TOOLS]
+
+    tools[0]["description"] = "changed"
+    tools[0]["inputSchema"]["properties"]["extra"] = {"type": "string"}
+    assert ibkr_gateway_client.list_tools()[0]["description"] == IBKR_TOOLS[0]["description"]
+    assert "extra" not in IBKR_TOOLS[0]["inputSchema"].get("properties", {})
+    assert json.loads(IBKR_TOOLS_JSON) == ibkr_gateway_client.list_tools()
+
+
+def test_encoded_follows_the_registry_version():
+    registry = ToolRegistry([TOOL])
+    assert json.loads(registry.encoded("openai_tools"))[0]["function"]["name"] == "get_quote"
+    assert registry.encoded("openai_tools") == registry.openai_tools_json
+
+    same = ToolRegistry([dict(TOOL)])
+    changed = ToolRegistry([{**TOOL, "description": "Live quote"}])
+    assert same.version == registry.version and same.encoded("tools") is registry.encoded("tools")
+    assert changed.version != registry.version
+    assert json.loads(changed.encoded("tools"))[0]["description"] == "Live quote"
+
+    with pytest.raises(KeyError):
+        registry.encoded("by_name")
+
+
+def test_mcp_tools_endpoint():
+    from serve_mock import app
+    body = app.test_client().get("/mcp/tools").get_json()
+    assert body == {"tools": ibkr_gateway_client.list_tools()}
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,56 @@
+"""
+Per-Request Tool Usage Tests
+
+Concurrent ask_analyst calls share the worker pool; each must report only the
+sub-tools its own analysis called.
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(__file__))
+import serve_mock
+from serve_mock import CancelToken, mcp_client, run_mcp_tool
+
+LOCAL_CONFIG = {"provider": "local", "model": "test", "url": "http://localhost:0"}
+
+
+def test_concurrent_analyses_report_their_own_tools(monkeypatch):
+    # Both analyses are inside their tool call at the same time
+    both_in_flight = threading.Barrier(2, timeout=5)
+
+    def fetch(data):
+        def call():
+            both_in_flight.wait()
+            return data
+        return call
+
+    monkeypatch.setattr(mcp_client, "get_positions", fetch({"positions": []}))
+    monkeypatch.setattr(mcp_client, "get_orders", fetch({"orders": []}))
+    monkeypatch.setattr(serve_mock, "openai_call", lambda *args, **kwargs: {"content": "summary"})
+
+    responses = {}
+
+    def ask(mid, query):
+        args = {"query": query, "logs": [], "config": LOCAL_CONFIG, "enable_trading": True}
+        run_mcp_tool("test-session", mid, "ask_analyst", args, CancelToken(),
+                     lambda response: responses.__setitem__(mid, response))
+
+    threads = [threading.Thread(target=ask, args=(1, "What are my positions?")),
+               threading.Thread(target=ask, args=(2, "Show my open orders"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    positions = responses[1]["result"]["_meta"]["toolsUsed"]
+    orders = responses[2]["result"]["_meta"]["toolsUsed"]
+    assert positions == ["ask_analyst", "get_positions"]
+    assert orders == ["ask_analyst", "get_orders"]
+    assert "resourcesUsed" not in responses[1]["result"]["_meta"]
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
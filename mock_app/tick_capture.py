@@ -0,0 +1,274 @@
+"""
+IBKR WebSocket Tick Capture
+
+Records raw IBKR WebSocket messages with their receive time into compact
+rotating binary files, and replays them through the relay for reproducing
+performance problems and load tests with realistic traffic.
+
+File format (little-endian):
+    header   b"IBKRCAP" + version byte (1)
+    record   <d receive time (epoch seconds)> <I payload length> <payload bytes>
+
+A new file is started when the current one would exceed max_bytes; only the
+newest max_files are kept. write() only appends to a bounded in-memory buffer
+(oldest records dropped and counted if it overflows); a writer thread drains
+it every flush_interval and does the encoding, file writes and rotation, so
+the WebSocket thread never waits on disk.
+
+Usage:
+    capture = TickCapture("captures", max_bytes=64 * 1024 * 1024, max_files=10)
+    capture.write(raw_message)                  # from the WebSocket on_message
+    capture.close()                             # write everything buffered (also registered with atexit)
+    for ts, payload in read_capture(path): ...
+
+    python mock_app/tick_capture.py captures/ibkr_*.bin --speed 1     # real time
+    python mock_app/tick_capture.py captures/ibkr_*.bin --speed 10    # 10x
+    python mock_app/tick_capture.py captures/ibkr_*.bin --speed max   # as fast as possible
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple
+
+MAGIC = b"IBKRCAP\x01"
+RECORD = struct.Struct('<dI')
+
+
+class TickCapture:
+    """Append-only, size-rotated capture writer; callers only enqueue"""
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_files: int = 10,
+                 flush_interval: float = 1.0, prefix: str = 'ibkr', buffer_size: int = 100000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self._buffer = deque(maxlen=buffer_size)
+        self._wake = threading.Event()
+        self._closed = False
+        self._file = None
+        self._size = 0
+        self.path = None
+        self.records = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='tick-capture-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, payload, ts: Optional[float] = None):
+        """Queue one raw message (str or bytes), stamped with ts or the current time"""
+        if self._closed:
+            return
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append((time.time() if ts is None else ts, payload))
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+            if self._closed:
+                self._drain()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _drain(self):
+        # Writer thread only
+        if not self._buffer:
+            return
+        chunk = []
+        try:
+            while self._buffer:
+                try:
+                    ts, payload = self._buffer.popleft()
+                except IndexError:
+                    break
+                if isinstance(payload, str):
+                    payload = payload.encode('utf-8')
+                record = RECORD.pack(ts, len(payload)) + payload
+                if self._file is None or self._size + len(record) > self.max_bytes:
+                    self._file_write(chunk)
+                    self._rotate()
+                chunk.append(record)
+                self._size += len(record)
+                self.records += 1
+                self.bytes_written += len(record)
+            self._file_write(chunk)
+            self._file.flush()
+        except OSError:
+            self.errors += 1
+
+    def _file_write(self, chunk: list):
+        if chunk:
+            self._file.write(b"".join(chunk))
+            chunk.clear()
+
+    def _rotate(self):
+        # Writer thread only
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(self.directory, f"{self.prefix}_{stamp}_{self.records:09d}.bin")
+        self._file = open(self.path, 'wb')
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        for old in capture_files(self.directory, self.prefix)[:-self.max_files]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def close(self):
+        """Write everything buffered and stop the writer"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        return {"path": self.path, "records": self.records, "bytes": self.bytes_written,
+                "buffered": len(self._buffer), "dropped": self.dropped, "errors": self.errors,
+                "maxBytes": self.max_bytes, "maxFiles": self.max_files}
+
+
+def capture_files(directory: str, prefix: str = 'ibkr') -> List[str]:
+    """Capture files in a directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, f"{prefix}_*.bin")))
+
+
+def read_capture(path: str) -> Iterator[Tuple[float, bytes]]:
+    """(receive time, raw payload) for every complete record in a capture file"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a tick capture file: {path}")
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            ts, length = RECORD.unpack(head)
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # truncated tail (writer still running or crashed)
+            yield ts, payload
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+
+def replay(paths: List[str], handler: Callable[[object], int], speed: Optional[float] = 1.0) -> dict:
+    """
+    Feed captured messages to handler(decoded_json) -> updates processed.
+    speed is a multiple of real time; None replays as fast as possible.
+    Returns throughput, per-message handler latency and (when paced) lag behind schedule.
+    """
+    latencies, lags = [], []
+    messages = updates = skipped = 0
+    first_ts = wall_start = None
+    started = time.perf_counter()
+    for path in paths:
+        for ts, payload in read_capture(path):
+            if speed:
+                if first_ts is None:
+                    first_ts, wall_start = ts, time.perf_counter()
+                due = wall_start + (ts - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                lags.append(max(0.0, time.perf_counter() - due))
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                skipped += 1  # heartbeats and other non-JSON frames
+                continue
+            t0 = time.perf_counter()
+            updates += handler(data) or 0
+            latencies.append(time.perf_counter() - t0)
+            messages += 1
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    lags.sort()
+    return {
+        "messages": messages,
+        "updates": updates,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "messagesPerSec": messages / elapsed if elapsed else 0.0,
+        "updatesPerSec": updates / elapsed if elapsed else 0.0,
+        "latencyUs": {p: percentile(latencies, p) * 1e6 for p in (50, 95, 99, 100)},
+        "lagMs": {p: percentile(lags, p) * 1e3 for p in (50, 95, 99, 100)} if lags else None,
+    }
+
+
+def route_market_data(data, process_market_data: Callable[[dict], object]) -> int:
+    """Pass each quote item of a decoded IBKR WebSocket message to process_market_data; returns items handled"""
+    if isinstance(data, list):
+        items = [item for item in data if isinstance(item, dict) and 'conid' in item]
+    elif isinstance(data, dict) and 'conid' in data:
+        items = [data]
+    else:
+        return 0
+    for item in items:
+        process_market_data(item)
+    return len(items)
+
+
+def load_relay(process_market_data: Callable[[dict], object]) -> Callable[[object], int]:
+    """A replay handler that routes messages to process_market_data, as the live WebSocket does"""
+    return lambda data: route_market_data(data, process_market_data)
+
+
+def import_serve_mock_relay() -> Callable[[dict], object]:
+    """
+    serve_mock's process_market_data, for the command line. Importing serve_mock
+    builds its app and state; it is forced into the plain in-process mode
+    first, so a replay never creates a shared-memory quote table, captures its
+    own input, or floods the server log (LOG_LEVEL defaults to WARNING here).
+    Nothing connects to IBKR or listens on a port: those start only from requests.
+    """
+    os.environ['IBKR_INGEST_PROCESS'] = '0'
+    os.environ.pop('IBKR_CAPTURE_DIR', None)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from serve_mock import process_market_data
+    return process_market_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay IBKR tick captures through the market-data relay")
+    parser.add_argument('paths', nargs='+', help="capture files (or directories), replayed in order")
+    parser.add_argument('--speed', default='1', help="real-time multiple (1, 10, ...) or 'max'")
+    args = parser.parse_args()
+
+    paths = []
+    for p in args.paths:
+        paths.extend(capture_files(p) if os.path.isdir(p) else [p])
+    speed = None if args.speed == 'max' else float(args.speed)
+    result = replay(paths, load_relay(import_serve_mock_relay()), speed)
+    print(f"{result['messages']:,} messages ({result['updates']:,} updates, {result['skipped']:,} skipped) "
+          f"in {result['seconds']:.2f}s ({'max speed' if speed is None else f'{speed:g}x'})")
+    print(f"throughput   {result['messagesPerSec']:,.0f} msg/s   {result['updatesPerSec']:,.0f} updates/s")
+    print("latency us   " + "  ".join(f"p{p}={v:.1f}" for p, v in result['latencyUs'].items()))
+    if result['lagMs']:
+        print("lag ms       " + "  ".join(f"p{p}={v:.2f}" for p, v in result['lagMs'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Tick History and OHLCV Bars
+
+Server-side price history shared by every client. Per symbol:
+
+    TickRing    the last N ticks (time, price, size) in preallocated arrays
+    BarSeries   1s / 1m / 5m OHLCV bars, each a fixed-size ring, updated
+                incrementally on every tick (no re-aggregation on read)
+
+Memory per symbol is fixed at creation; the oldest ticks and bars are
+overwritten. Ticks arriving for a bucket older than the current bar are
+kept in the tick ring but do not rewrite closed bars.
+
+Usage:
+    history = TickHistory()
+    history.record("AAPL", time.time(), 190.5, size=100)
+    history.bars("AAPL", "1m", since=time.time() - 3600)   # [{"t", "o", "h", "l", "c", "v", "n"}, ...]
+"""
+
+import math
+import threading
+from array import array
+from typing import Any, Dict, List, Optional
+
+# interval name -> (seconds, bars kept)
+INTERVALS = {
+    '1s': (1, 900),      # 15 minutes
+    '1m': (60, 1440),    # 1 day
+    '5m': (300, 576),    # 2 days
+}
+TICK_CAPACITY = 4096
+
+
+class TickRing:
+    """Fixed-capacity ring of (time, price, size)"""
+
+    def __init__(self, capacity: int = TICK_CAPACITY):
+        self.capacity = capacity
+        self._time = array('d', bytes(8 * capacity))
+        self._price = array('d', bytes(8 * capacity))
+        self._size = array('d', bytes(8 * capacity))
+        self._next = 0
+        self.count = 0
+
+    def append(self, ts: float, price: float, size: float):
+        i = self._next
+        self._time[i] = ts
+        self._price[i] = price
+        self._size[i] = size
+        self._next = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def ticks(self, since: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, float]]:
+        """Oldest first; only ticks after since, at most the newest limit"""
+        start = (self._next - self.count) % self.capacity
+        out = []
+        for k in range(self.count):
+            i = (start + k) % self.capacity
+            if since is None or self._time[i] > since:
+                out.append({"t": self._time[i], "p": self._price[i], "s": self._size[i]})
+        return out[-limit:] if limit else out
+
+
+class BarSeries:
+    """Ring of OHLCV bars for one interval; the newest slot is the bar in progress"""
+
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.capacity = capacity
+        zeros = bytes(8 * capacity)
+        self._start = array('d', zeros)
+        self._open = array('d', zeros)
+        self._high = array('d', zeros)
+        self._low = array('d', zeros)
+        self._close = array('d', zeros)
+        self._volume = array('d', zeros)
+        self._ticks = array('L', bytes(array('L').itemsize * capacity))
+        self._last = -1  # slot of the current bar
+        self.count = 0
+
+    def add(self, ts: float, price: float, size: float):
+        bucket = math.floor(ts / self.seconds) * self.seconds
+        i = self._last
+        if i >= 0 and self._start[i] == bucket:
+            if price > self._high[i]:
+                self._high[i] = price
+            if price < self._low[i]:
+                self._low[i] = price
+            self._close[i] = price
+            self._volume[i] += size
+            self._ticks[i] += 1
+            return
+        if i >= 0 and bucket < self._start[i]:
+            return  # late tick for a closed bar
+        i = (i + 1) % self.capacity
+        self._start[i] = bucket
+        self._open[i] = self._high[i] = self._low[i] = self._close[i] = price
+        self._volume[i] = size
+        self._ticks[i] = 1
+        self._last = i
+        self.count = min(self.count + 1, self.capacity)
+
+    def bars(self, since: Optional[float] = None) -> List[Dict[str, float]]:
+        """Oldest first; only bars whose start is >= since (the in-progress bar included)"""
+        out = []
+        for k in range(self.count - 1, -1, -1):
+            i = (self._last - k) % self.capacity
+            if since is None or self._start[i] >= since:
+                out.append({"t": self._start[i], "o": self._open[i], "h": self._high[i], "l": self._low[i],
+                            "c": self._close[i], "v": self._volume[i], "n": self._ticks[i]})
+        return out
+
+
+class TickHistory:
+    """Per-symbol tick rings and bar series, created on the first tick for a symbol"""
+
+    def __init__(self, tick_capacity: int = TICK_CAPACITY, intervals: Dict[str, tuple] = INTERVALS):
+        self.tick_capacity = tick_capacity
+        self.intervals = intervals
+        self._lock = threading.Lock()
+        self._symbols: Dict[str, tuple] = {}  # symbol -> (TickRing, {interval: BarSeries})
+        self.recorded = 0
+
+    def record(self, symbol: str, ts: float, price: float, size: float = 0.0):
+        with self._lock:
+            entry = self._symbols.get(symbol)
+            if entry is None:
+                entry = (TickRing(self.tick_capacity),
+                         {name: BarSeries(sec, cap) for name, (sec, cap) in self.intervals.items()})
+                self._symbols[symbol] = entry
+            ring, series = entry
+            ring.append(ts, price, size)
+            for bars in series.values():
+                bars.add(ts, price, size)
+            self.recorded += 1
+
+    def bars(self, symbol: str, interval: str, since: Optional[float] = None) -> List[Dict[str, float]]:
+        """Bars for a symbol; [] if it has no ticks yet. Raises KeyError for an unknown interval."""
+        if interval not in self.intervals:
+            raise KeyError(interval)
+        with self._lock:
+            entry = self._symbols.get(symbol)
+            return entry[1][interval].bars(since) if entry else []
+
+    def ticks(self, symbol: str, since: Optional[float] = None, limit: Optional[int] = None) -> List[Dict[str, float]]:
+        with self._lock:
+            entry = self._symbols.get(symbol)
+            return entry[0].ticks(since, limit) if entry else []
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return list(self._symbols)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "symbols": len(self._symbols),
+                "ticksRecorded": self.recorded,
+                "tickCapacity": self.tick_capacity,
+                "intervals": {name: {"seconds": sec, "bars": cap} for name, (sec, cap) in self.intervals.items()},
+            }
@@ -0,0 +1,127 @@
+"""
+Bounded Tool Call Pool
+
+Shared executor for MCP tools/call work. Replaces one thread per call with a
+fixed number of workers, a bounded wait queue and a per-session in-flight cap,
+so a chatty client (or several agents) cannot flood the IBKR gateway.
+
+Usage:
+    pool = ToolCallPool(max_workers=8, max_queue=32, max_per_session=4)
+    try:
+        future = pool.submit(session_id, run_tool, name, args)
+    except ToolPoolFull as e:
+        ...  # reply with a JSON-RPC "server busy" error
+"""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class ToolPoolFull(Exception):
+    """Raised when a call is rejected because the queue or the session is at capacity."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class ToolCallPool:
+    """Fixed-size worker pool with a bounded queue and per-session concurrency caps"""
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 32, max_per_session: int = 4,
+                 name: str = 'mcp-tool'):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_per_session = max_per_session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._per_session: Dict[str, int] = {}
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "rejectedQueueFull": 0,
+            "rejectedSessionLimit": 0,
+            "queueHighWater": 0,
+            "execTimeTotal": 0.0,
+            "execTimeMax": 0.0,
+            "waitTimeTotal": 0.0,
+        }
+
+    def submit(self, session_id: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queue fn for execution; raises ToolPoolFull instead of growing without bound"""
+        with self._lock:
+            if self._per_session.get(session_id, 0) >= self.max_per_session:
+                self._stats["rejectedSessionLimit"] += 1
+                raise ToolPoolFull("session_limit",
+                                   f"Too many concurrent tool calls for this session (max {self.max_per_session})")
+            if self._queued >= self.max_queue:
+                self._stats["rejectedQueueFull"] += 1
+                raise ToolPoolFull("queue_full",
+                                   f"Server busy: tool queue is full ({self.max_queue} waiting)")
+            self._queued += 1
+            self._per_session[session_id] = self._per_session.get(session_id, 0) + 1
+            self._stats["submitted"] += 1
+            self._stats["queueHighWater"] = max(self._stats["queueHighWater"], self._queued)
+
+        future = self._executor.submit(self._run, session_id, time.monotonic(), fn, args, kwargs)
+        future.add_done_callback(lambda f: self._on_done(session_id, f))
+        return future
+
+    def _run(self, session_id: str, enqueued_at: float, fn: Callable, args, kwargs) -> Any:
+        started = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._stats["waitTimeTotal"] += started - enqueued_at
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._running -= 1
+                self._release_session(session_id)
+                self._stats["failed" if failed else "completed"] += 1
+                self._stats["execTimeTotal"] += elapsed
+                self._stats["execTimeMax"] = max(self._stats["execTimeMax"], elapsed)
+
+    def _on_done(self, session_id: str, future: Future):
+        # Only cancelled futures skip _run, so they release their slot here
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+                self._release_session(session_id)
+                self._stats["cancelled"] += 1
+
+    def _release_session(self, session_id: str):
+        remaining = self._per_session.get(session_id, 0) - 1
+        if remaining > 0:
+            self._per_session[session_id] = remaining
+        else:
+            self._per_session.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, concurrency and execution-time metrics"""
+        with self._lock:
+            stats = dict(self._stats)
+            finished = stats["completed"] + stats["failed"]
+            stats.update({
+                "workers": self.max_workers,
+                "maxQueue": self.max_queue,
+                "maxPerSession": self.max_per_session,
+                "queueDepth": self._queued,
+                "running": self._running,
+                "activeSessions": len(self._per_session),
+                "execTimeAvg": stats["execTimeTotal"] / finished if finished else 0.0,
+                "waitTimeAvg": stats["waitTimeTotal"] / (finished + self._running) if finished + self._running else 0.0,
+            })
+        return stats
@@ -0,0 +1,125 @@
+"""
+Precompiled Tool Registry
+
+Tool definitions are frozen and encoded for every wire format once, at
+import, instead of being rebuilt and re-serialized for each tools/list
+request or LLM call:
+
+    mcp_tools_json       tools/list result ({"tools": [...]})
+    resources_json       resources/list result ({"resources": [...]})
+    resource_templates_json  resources/templates/list result ({"resourceTemplates": [...]})
+    openai_tools         OpenAI "tools" array (frozen) + its JSON
+    gemini_tools         Gemini "tools" array (frozen) + its JSON
+    version              short hash of the definitions, changes when any tool does
+
+Frozen values are read-only mappings and tuples; they support the usual
+t["name"] / t.get(...) access but cannot be mutated by callers. Use
+encode_json() to serialize them, or registry.encoded(name) for the cached
+JSON of one of the registry's own collections.
+
+Usage:
+    registry = ToolRegistry(tools, resources=MCP_RESOURCES, gemini_tool_names={...})
+    body = splice_json({"model": m, "messages": msgs}, "tools", registry.encoded("openai_tools"))
+    response_text = jsonrpc_result(msg_id, registry.mcp_tools_json)
+"""
+
+import hashlib
+import json
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+# (registry version, collection name) -> JSON; a registry built from changed
+# definitions has a new version, so it can never be served stale JSON
+_ENCODED: Dict[Tuple[str, str], str] = {}
+
+ENCODED_COLLECTIONS = ("tools", "resources", "resource_templates", "openai_tools", "gemini_tools")
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to read-only mappings and lists to tuples"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(value: Any, **kwargs) -> str:
+    """json.dumps that also accepts frozen registry values"""
+    return json.dumps(value, separators=(',', ':'), default=_thaw, **kwargs)
+
+
+def splice_json(payload: Dict[str, Any], key: str, encoded: str) -> str:
+    """JSON text of payload plus one member whose value is already-encoded JSON"""
+    head = encode_json(payload)
+    return f"{head[:-1]}{',' if len(head) > 2 else ''}{json.dumps(key)}:{encoded}}}"
+
+
+def jsonrpc_result(msg_id: Any, encoded_result: str) -> str:
+    """A complete JSON-RPC response around a pre-encoded result"""
+    return f'{{"jsonrpc":"2.0","id":{json.dumps(msg_id)},"result":{encoded_result}}}'
+
+
+class ToolRegistry:
+    """Immutable tool catalogue with per-format pre-encoded JSON"""
+
+    def __init__(self, tools: Iterable[Dict[str, Any]], resources: Iterable[Dict[str, Any]] = (),
+                 gemini_tool_names: Optional[Iterable[str]] = None,
+                 resource_templates: Iterable[Dict[str, Any]] = ()):
+        self.tools = freeze(list(tools))
+        self.resources = freeze(list(resources))
+        self.resource_templates = freeze(list(resource_templates))
+        self.by_name = MappingProxyType({t["name"]: t for t in self.tools})
+        self.version = hashlib.sha256(
+            encode_json({"tools": self.tools, "resources": self.resources,
+                         "resourceTemplates": self.resource_templates}, sort_keys=True).encode()
+        ).hexdigest()[:12]
+
+        mcp_tools = [{
+            "name": t["name"],
+            "description": t["description"],
+            "inputSchema": t.get("inputSchema", {}),
+            **({"annotations": t["annotations"]} if "annotations" in t else {})
+        } for t in self.tools]
+        self.openai_tools = freeze([{
+            "type": "function",
+            "function": {
+                "name": t["name"],
+                "description": t["description"],
+                "parameters": t.get("inputSchema", {})
+            }
+        } for t in self.tools])
+        gemini_names = set(gemini_tool_names) if gemini_tool_names is not None else set(self.by_name)
+        self.gemini_tools = freeze([{
+            "function_declarations": [{
+                "name": t["name"],
+                "description": t["description"],
+                "parameters": t.get("inputSchema", {})
+            } for t in self.tools if t["name"] in gemini_names]
+        }])
+
+        self.mcp_tools_json = encode_json({"tools": mcp_tools, "_meta": {"registryVersion": self.version}})
+        self.resources_json = encode_json({"resources": self.resources})
+        self.resource_templates_json = encode_json({"resourceTemplates": self.resource_templates})
+        self.openai_tools_json = self.encoded("openai_tools")
+        self.gemini_tools_json = self.encoded("gemini_tools")
+
+    def get(self, name: str) -> Optional[MappingProxyType]:
+        return self.by_name.get(name)
+
+    def encoded(self, name: str) -> str:
+        """JSON of one of this registry's collections (see ENCODED_COLLECTIONS), encoded once per version"""
+        if name not in ENCODED_COLLECTIONS:
+            raise KeyError(name)
+        key = (self.version, name)
+        cached = _ENCODED.get(key)
+        if cached is None:
+            cached = _ENCODED[key] = encode_json(getattr(self, name))
+        return cached